@@ -1,25 +1,41 @@
 """
 Flask GUI Dashboard for RTKRCV Multi Session Handler.
-Provides web interface to configure receivers, launch main.py, and visualize KML results.
+Provides web interface to configure receivers, run the RTK workflow, and visualize KML results.
 """
+import hashlib
+import json
 import os
 import subprocess
 import threading
-import queue
 import glob
 from pathlib import Path
-from flask import Flask, render_template, jsonify, request, Response
+from flask import Flask, render_template, jsonify, request, Response, send_file
 import yaml
+from utils.log_bus import LogBus, SubscriberDropped, END_OF_STREAM
+from utils.events import StatusBoard, parse_event, EVENT_PREFIX
+from utils.metrics import RunMetrics
+from manager.rtk_manager import RTKManager
+from manager.inprocess_run import InProcessRun
+from utils.kml_writer import RESULTS_JSON
 
 app = Flask(__name__)
 
-# Global state for subprocess management
-process_queue = queue.Queue()
-current_process = None
+# Global state for run management
+log_bus = LogBus(capacity=5000)
+# Current per-receiver state, built from the structured events of the running process
+status_board = StatusBoard()
+# Counters and histograms for /metrics, fed by the same events (kept across runs)
+run_metrics = RunMetrics()
+current_process = None  # subprocess mode
+current_run = None      # in-process mode (InProcessRun)
 process_lock = threading.Lock()
 
-STATIONS_PATH = Path(__file__).parent / "stations.yaml"
-OUTPUT_PATH = Path(__file__).parent / "output"
+BASE_DIR = Path(__file__).parent
+STATIONS_PATH = BASE_DIR / "stations.yaml"
+OUTPUT_PATH = BASE_DIR / "output"
+RTKLIB_PATH = BASE_DIR / "rtklib" / "rtkrcv"
+# 'inprocess' runs RTKManager on a worker thread; 'subprocess' keeps main.py isolated
+EXECUTION_MODE = os.environ.get('RTK_EXECUTION_MODE', 'inprocess')
 
 
 def load_stations():
@@ -59,115 +75,197 @@ def save_receivers():
 
 @app.route('/api/start', methods=['POST'])
 def start_process():
-    """Launch main.py as subprocess."""
-    global current_process
+    """
+    Start a run, in-process (default) or as a `main.py` subprocess.
+
+    Optional JSON body: {"mode": "inprocess" | "subprocess", "delta": bool}.
+    The default mode comes from the RTK_EXECUTION_MODE environment variable.
+    """
     import shutil
-    
+
+    options = request.get_json(silent=True) or {}
+    mode = options.get('mode', EXECUTION_MODE)
+    if mode not in ('inprocess', 'subprocess'):
+        return jsonify({"status": "error", "message": f"Unknown mode: {mode}"}), 400
+
     with process_lock:
-        if current_process and current_process.poll() is None:
+        if is_running():
             return jsonify({"status": "error", "message": "Process already running"}), 400
         
-        # Clean output/ and tmp/ folders
-        for folder in [OUTPUT_PATH, Path(__file__).parent / "tmp"]:
+        # Clean output/ and tmp/ folders (tmp/ holds one sub-directory per rover session)
+        for folder in [OUTPUT_PATH, BASE_DIR / "tmp"]:
             if folder.exists():
                 for file in folder.iterdir():
                     if file.is_file():
                         file.unlink()
+                    elif file.is_dir():
+                        shutil.rmtree(file, ignore_errors=True)
         
-        # Clear the queue
-        while not process_queue.empty():
-            try:
-                process_queue.get_nowait()
-            except queue.Empty:
-                break
-        
-        # Set environment for unbuffered Python output
-        env = os.environ.copy()
-        env['PYTHONUNBUFFERED'] = '1'
+        # New run: drop the previous run's history (event ids keep increasing)
+        log_bus.clear()
+        status_board.reset()
+
+        if mode == 'subprocess':
+            start_subprocess(delta=bool(options.get('delta')))
+        else:
+            start_inprocess(delta=bool(options.get('delta')))
+        return jsonify({"status": "started", "mode": mode})
+
+
+def is_running():
+    """True while a run (in-process or subprocess) is active."""
+    if current_run is not None and current_run.running():
+        return True
+    return current_process is not None and current_process.poll() is None
+
+
+def start_inprocess(delta=False):
+    """Run RTKManager on a worker thread of this process (no interpreter startup, direct state)."""
+    global current_run
+
+    def on_event(event):
+        # Events arrive as dicts: the board is updated without parsing text
+        status_board.apply(event)
+        run_metrics.apply(event)
+        log_bus.publish(EVENT_PREFIX + json.dumps(event, separators=(',', ':')))
+
+    manager = InProcessRun.anchor(RTKManager(yaml_path=STATIONS_PATH, rtklib_path=RTKLIB_PATH, delta=delta),
+                                  BASE_DIR)
+    current_run = InProcessRun(manager, on_line=log_bus.publish, on_event=on_event, on_finish=log_bus.end)
+    current_run.start()
+
+
+def start_subprocess(delta=False):
+    """Launch main.py as an isolated subprocess and relay its stdout to the log bus."""
+    global current_process, current_run
+    current_run = None
+
+    # Set environment for unbuffered Python output
+    env = os.environ.copy()
+    env['PYTHONUNBUFFERED'] = '1'
+    
+    # Start main.py subprocess with unbuffered output
+    current_process = subprocess.Popen(
+        ["python", "-u", "main.py"] + (["--delta"] if delta else []),  # -u: unbuffered output
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,  # Line buffered
+        cwd=BASE_DIR,
+        env=env
+    )
+    
+    # Start thread to read output using select for non-blocking reads
+    def read_output():
+        import select
+        import os
         
-        # Start main.py subprocess with unbuffered output
-        current_process = subprocess.Popen(
-            ["python", "-u", "main.py"],  # -u forces unbuffered stdout/stderr
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,  # Line buffered
-            cwd=Path(__file__).parent,
-            env=env
-        )
+        fd = current_process.stdout.fileno()
+        buffer = ""
         
-        # Start thread to read output using select for non-blocking reads
-        def read_output():
-            import select
-            import os
-            
-            fd = current_process.stdout.fileno()
-            buffer = ""
-            
-            try:
-                while True:
-                    # Use select with timeout to avoid blocking
-                    readable, _, _ = select.select([fd], [], [], 0.1)
-                    
-                    if readable:
-                        try:
-                            chunk = os.read(fd, 4096)
-                            if not chunk:
-                                # EOF reached
-                                break
-                            buffer += chunk.decode('utf-8', errors='replace')
-                            
-                            # Process complete lines
-                            while '\n' in buffer:
-                                line, buffer = buffer.split('\n', 1)
-                                if line:
-                                    process_queue.put(line + '\n')
-                        except OSError:
+        try:
+            while True:
+                # Use select with timeout to avoid blocking
+                readable, _, _ = select.select([fd], [], [], 0.1)
+                
+                if readable:
+                    try:
+                        chunk = os.read(fd, 4096)
+                        if not chunk:
+                            # EOF reached
                             break
-                    
-                    # Check if process has terminated
-                    if current_process.poll() is not None:
-                        # Read any remaining data
-                        try:
-                            remaining = os.read(fd, 4096)
-                            if remaining:
-                                buffer += remaining.decode('utf-8', errors='replace')
-                        except OSError:
-                            pass
+                        buffer += chunk.decode('utf-8', errors='replace')
+                        
+                        # Process complete lines
+                        while '\n' in buffer:
+                            line, buffer = buffer.split('\n', 1)
+                            if line:
+                                publish_line(line)
+                    except OSError:
                         break
                 
-                # Flush remaining buffer
-                if buffer.strip():
-                    process_queue.put(buffer + '\n')
-                    
-            finally:
-                try:
-                    current_process.stdout.close()
-                except:
-                    pass
-                process_queue.put(None)  # Signal end of stream
-        
-        thread = threading.Thread(target=read_output, daemon=True)
-        thread.start()
-        
-        return jsonify({"status": "started"})
+                # Check if process has terminated
+                if current_process.poll() is not None:
+                    # Read any remaining data
+                    try:
+                        remaining = os.read(fd, 4096)
+                        if remaining:
+                            buffer += remaining.decode('utf-8', errors='replace')
+                    except OSError:
+                        pass
+                    break
+            
+            # Flush remaining buffer
+            if buffer.strip():
+                publish_line(buffer.rstrip('\n'))
+                
+        finally:
+            try:
+                current_process.stdout.close()
+            except:
+                pass
+            log_bus.end()  # Signal end of stream
+    
+    thread = threading.Thread(target=read_output, daemon=True)
+    thread.start()
+
+
+def publish_line(line):
+    """Publish a process output line, updating the status board when it is an event."""
+    event = parse_event(line)
+    if event is not None:
+        status_board.apply(event)
+        run_metrics.apply(event)
+    log_bus.publish(line)
+
+
+@app.route('/api/status')
+def get_status():
+    """Current run and receiver state (what the dashboard needs after a (re)connect)."""
+    return jsonify(status_board.snapshot())
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Run, phase and session metrics in the Prometheus text exposition format."""
+    return Response(run_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 @app.route('/api/stream')
 def stream_output():
-    """SSE endpoint for real-time process output."""
+    """
+    SSE endpoint for real-time process output.
+
+    Every line carries its log bus id, so a reconnecting EventSource resumes from
+    Last-Event-ID; a new client gets the current run's history first.
+    Structured events are sent as SSE events of type 'rtk' with their JSON payload,
+    plain log lines as default 'message' events.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    subscription = log_bus.subscribe(int(last_event_id) if last_event_id and last_event_id.isdigit() else None)
+
     def generate():
+        yield "retry: 2000\n\n"
         while True:
             try:
-                line = process_queue.get(timeout=30)
-                if line is None:
-                    # Process finished
-                    yield f"data: [PROCESS_END]\n\n"
-                    break
-                yield f"data: {line}\n\n"
-            except queue.Empty:
-                # Send heartbeat to keep connection alive
-                yield f"data: \n\n"
+                lines = subscription.read(timeout=30)
+            except SubscriberDropped:
+                # Client too slow: close, the browser reconnects from its Last-Event-ID
+                return
+            if subscription.gap:
+                yield f"data: [LOG_GAP] {subscription.gap} righe non più disponibili\n\n"
+                subscription.gap = 0
+            if not lines:
+                # Heartbeat to keep the connection alive
+                yield ": keepalive\n\n"
+                continue
+            for event_id, line in lines:
+                if line.startswith(EVENT_PREFIX):
+                    yield f"id: {event_id}\nevent: rtk\ndata: {line[len(EVENT_PREFIX):]}\n\n"
+                    continue
+                yield f"id: {event_id}\ndata: {line}\n\n"
+                if line == END_OF_STREAM:
+                    return
     
     response = Response(generate(), mimetype='text/event-stream')
     response.headers['Cache-Control'] = 'no-cache'
@@ -178,22 +276,43 @@ def stream_output():
 
 @app.route('/api/stop', methods=['POST'])
 def stop_process():
-    """Terminate the running subprocess."""
+    """Stop the running process (cooperative cancellation for in-process runs)."""
     global current_process
     
     with process_lock:
+        if current_run is not None and current_run.running():
+            # Sessions notice cancel_event and stop their rtkrcv; the worker ends the stream
+            if not current_run.stop(timeout=15):
+                return jsonify({"status": "stopping"}), 202
+            return jsonify({"status": "stopped"})
         if current_process and current_process.poll() is None:
             current_process.terminate()
             try:
                 current_process.wait(timeout=5)
             except subprocess.TimeoutExpired:
                 current_process.kill()
-            process_queue.put(None)  # Signal end of stream
+            log_bus.end()  # Signal end of stream
             return jsonify({"status": "stopped"})
         else:
             return jsonify({"status": "error", "message": "No process running"}), 400
 
 
+@app.route('/api/results')
+def get_results():
+    """Receivers of the current/last run with role, solution status and coordinates."""
+    if current_run is not None:
+        return jsonify({"mode": "inprocess", "running": current_run.running(),
+                        "receivers": current_run.results()})
+    # Subprocess mode: only what the structured events reported
+    receivers = []
+    for serial, state in status_board.snapshot()['receivers'].items():
+        entry = {'serial': serial, 'role': state.get('role'), 'status': state.get('status')}
+        if 'lat' in state and state.get('state') in ('positioned', 'solved'):
+            entry.update(lat=state['lat'], lon=state['lon'], alt=state['alt'])
+        receivers.append(entry)
+    return jsonify({"mode": "subprocess", "running": is_running(), "receivers": receivers})
+
+
 @app.route('/api/kml')
 def get_latest_kml():
     """Return the most recent KML file content with timestamp filename."""
@@ -218,18 +337,61 @@ def get_latest_kml():
     return response
 
 
-@app.route('/api/kml/json')
-def get_kml_as_json():
-    """Parse KML and return coordinates as JSON for Leaflet."""
+EXPORT_MIMETYPES = {
+    'kml': 'application/vnd.google-earth.kml+xml',
+    'kmz': 'application/vnd.google-earth.kmz',
+    'geojson': 'application/geo+json',
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+@app.route('/api/export/<fmt>')
+def download_export(fmt):
+    """Download the latest run's results in one of the exported formats (see settings.export_formats)."""
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({"status": "error", "message": f"Unknown format: {fmt}"}), 404
+    files = glob.glob(str(OUTPUT_PATH / f"output_*.{fmt}"))
+    if not files:
+        return jsonify({"status": "error", "message": f"No {fmt} export found"}), 404
+    latest = Path(max(files, key=os.path.getmtime))
+    return send_file(latest, mimetype=EXPORT_MIMETYPES[fmt], as_attachment=True, download_name=latest.name)
+
+
+class MapDataCache:
+    """
+    Pre-serialized /api/kml/json body with its ETag.
+
+    The body is rebuilt only when the source file changes (path, mtime, size), so a map
+    refresh costs one stat() and, with If-None-Match, an empty 304.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._body = None
+        self._etag = None
+
+    def get(self, path, build):
+        """Return (body, etag) for path, calling build(path) -> bytes only on changes."""
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key != self._key:
+                body = build(path)
+                self._key, self._body = key, body
+                self._etag = hashlib.sha1(body).hexdigest()
+            return self._body, self._etag
+
+
+map_data_cache = MapDataCache()
+
+
+def kml_to_json(kml_path):
+    """Parse a KML file into the /api/kml/json body (fallback for runs without results.json)."""
     import xml.etree.ElementTree as ET
-    
-    kml_files = glob.glob(str(OUTPUT_PATH / "*.kml"))
-    if not kml_files:
-        return jsonify({"status": "error", "message": "No KML files found"}), 404
-    
-    latest_kml = max(kml_files, key=os.path.getmtime)
-    
-    tree = ET.parse(latest_kml)
+
+    tree = ET.parse(kml_path)
     root = tree.getroot()
     
     # KML namespace
@@ -253,7 +415,37 @@ def get_kml_as_json():
                 'style': style.text if style is not None else ''
             })
     
-    return jsonify({"placemarks": placemarks, "file": Path(latest_kml).name})
+    return json.dumps({"placemarks": placemarks, "file": Path(kml_path).name}).encode('utf-8')
+
+
+@app.route('/api/kml/json')
+def get_kml_as_json():
+    """
+    Coordinates of the last run as JSON for Leaflet.
+
+    Served from output/results.json, written by the manager next to the KML; older
+    output folders without it fall back to parsing the newest KML. Responses carry an
+    ETag and are revalidated by the browser (304 when nothing changed).
+    """
+    source = OUTPUT_PATH / RESULTS_JSON
+    build = lambda path: path.read_bytes()
+    if not source.exists():
+        kml_files = glob.glob(str(OUTPUT_PATH / "*.kml"))
+        if not kml_files:
+            return jsonify({"status": "error", "message": "No KML files found"}), 404
+        source = Path(max(kml_files, key=os.path.getmtime))
+        build = kml_to_json
+
+    try:
+        body, etag = map_data_cache.get(source, build)
+    except FileNotFoundError:
+        # Output folder cleaned by a new run between the check and the read
+        return jsonify({"status": "error", "message": "No KML files found"}), 404
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark dei percorsi caldi di parsing e I/O (NMEA, .pos, stream grezzi, config
+RTKRCV, export KML/JSON, /api/kml/json, archivio delle epoche) su dati sintetici.
+
+    python -m benchmarks                          # scala 'full', report in output/
+    python -m benchmarks --quick --filter nmea    # solo i casi NMEA, dati ridotti
+    python -m benchmarks --compare output/benchmark_20251104_120000.json
+
+Con --compare l'uscita è 1 se la latenza mediana di un caso peggiora oltre --threshold.
+"""
+import argparse
+import datetime
+import json
+import sys
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+from benchmarks.cases import SCALES, build_cases
+from benchmarks.harness import Runner, compare, format_result, report, save
+from utils import events
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmark di parsing e I/O")
+    parser.add_argument("--quick", action="store_true", help="Dati ridotti (controllo rapido)")
+    parser.add_argument("--filter", action="append", default=[],
+                        help="Esegue solo i casi il cui nome contiene il testo (ripetibile)")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Secondi di misura minimi per caso")
+    parser.add_argument("--data-dir", type=Path, default=None,
+                        help="Directory dei dati sintetici, riusati tra run (default: temporanea)")
+    parser.add_argument("--out", type=Path, default=None,
+                        help="File JSON dei risultati (default: output/benchmark_<timestamp>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="Report JSON di riferimento")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Peggioramento della latenza mediana considerato regressione (0.15 = +15%%)")
+    parser.add_argument("--list", action="store_true", help="Elenca i casi senza eseguirli")
+    args = parser.parse_args()
+
+    # Gli eventi emessi dal codice misurato (es. fase export) non vanno su stdout
+    events.set_stdout(False)
+    scale = 'quick' if args.quick else 'full'
+
+    with ExitStack() as stack:
+        data_dir = args.data_dir or Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="rtk-bench-")))
+        cases = [c for c in build_cases(data_dir, scale, stack)
+                 if not args.filter or any(f in c.name for f in args.filter)]
+        if args.list:
+            for case in cases:
+                print(case.name)
+            return 0
+
+        print(f"{len(cases)} casi, scala '{scale}' {SCALES[scale]}", flush=True)
+        runner = Runner(min_time=args.min_time)
+        results = []
+        for case in cases:
+            try:
+                result = runner.run(case)
+            except ImportError as e:
+                print(f"{case.name:<40} saltato: {e}", flush=True)
+                continue
+            results.append(result)
+            print(format_result(result), flush=True)
+
+    data = report(results, scale)
+    out = args.out or Path("output") / f"benchmark_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    save(data, out)
+    print(f"Risultati salvati: {out} (picco RSS {data['max_rss_mb']} MB)", flush=True)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != scale:
+            print(f"⚠️  Riferimento con scala '{baseline.get('scale')}': confronto non significativo", flush=True)
+        lines = compare(data, baseline, args.threshold)
+        print(f"\nConfronto con {args.compare}:", flush=True)
+        for line in lines:
+            print(line, flush=True)
+        if any(line.startswith('REGRESSIONE') for line in lines):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Casi di benchmark dei percorsi caldi di parsing e I/O. I dati sintetici vengono generati
+alla prima esecuzione di un caso (non misurata) e riusati se la directory dati è la stessa.
+"""
+import itertools
+import random
+import shutil
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Callable, Dict, List
+from benchmarks import datagen
+from benchmarks.harness import Case
+from utils.gnss_framer import GNSSFramer
+from utils.epoch_archive import EpochArchive
+from utils.kml_writer import KMLWriter
+from utils.nmea_parser import NMEAStreamParser, parse_gga, parse_gga_log, parse_sentence
+from utils.rtklib_config import generate_rtkrcv_config
+from utils.solution_reader import SolutionTailReader, parse_solution_line, read_solution_file
+from utils.stream_verifier import StreamVerifier
+
+# Dimensioni dei dati: 'quick' per un controllo rapido, 'full' per i numeri da confrontare
+SCALES: Dict[str, Dict] = {
+    'quick': {'gga_lines': 1000, 'nmea_hours': (0.5,), 'pos_hours': (0.25, 1), 'receivers': (100, 1000),
+              'stream_epochs': 20},
+    'full': {'gga_lines': 10000, 'nmea_hours': (1, 4), 'pos_hours': (1, 4, 12), 'receivers': (1000, 10000),
+             'stream_epochs': 60},
+}
+
+# Dimensione dei blocchi passati ai parser incrementali, come una recv() dal socket
+CHUNK_SIZE = 65536
+
+
+def _cached(path: Path, write: Callable[[Path], object]) -> Path:
+    """Genera il file di dati solo se non esiste già"""
+    if not path.exists():
+        tmp_path = path.with_name(path.name + '.tmp')
+        write(tmp_path)
+        tmp_path.replace(path)
+    return path
+
+
+def _chunks(data: bytes) -> List[bytes]:
+    return [data[pos:pos + CHUNK_SIZE] for pos in range(0, len(data), CHUNK_SIZE)]
+
+
+def _label(hours: float) -> str:
+    return f"{hours:g}h"
+
+
+def build_cases(data_dir: Path, scale: str, stack: ExitStack) -> List[Case]:
+    """Casi per la scala richiesta; stack chiude le risorse dei casi (es. server TCP) a fine run"""
+    sizes = SCALES[scale]
+    data_dir.mkdir(parents=True, exist_ok=True)
+    cases: List[Case] = []
+
+    # --- NMEA -----------------------------------------------------------------
+    def gga_setup():
+        lines = itertools.cycle(datagen.nmea_lines(sizes['gga_lines']))
+        return lambda: parse_gga(next(lines))
+
+    def sentence_setup():
+        lines = itertools.cycle([line.encode('ascii') for line in datagen.nmea_lines(sizes['gga_lines'])])
+        return lambda: parse_sentence(next(lines))
+
+    cases.append(Case('nmea.parse_gga', gga_setup, unit='sentence'))
+    cases.append(Case('nmea.parse_sentence', sentence_setup, unit='sentence'))
+
+    for hours in sizes['nmea_hours']:
+        log_path = data_dir / f"nmea_{_label(hours)}.log"
+        epochs = int(hours * 3600)
+
+        def stream_setup(log_path=log_path, hours=hours):
+            chunks = _chunks(_cached(log_path, lambda p: datagen.write_nmea_log(p, hours)).read_bytes())
+
+            def op():
+                parser = NMEAStreamParser()
+                for chunk in chunks:
+                    for _ in parser.feed(chunk):
+                        pass
+            return op
+
+        def log_setup(log_path=log_path, hours=hours):
+            _cached(log_path, lambda p: datagen.write_nmea_log(p, hours))
+            return lambda: parse_gga_log(log_path)
+
+        cases.append(Case(f"nmea.stream_parser[{_label(hours)}]", stream_setup, items=epochs * 4,
+                          unit='sentence', params={'hours': hours}))
+        cases.append(Case(f"nmea.parse_gga_log[{_label(hours)}]", log_setup, items=epochs,
+                          unit='epoch', params={'hours': hours}))
+
+    # --- File soluzione .pos ----------------------------------------------------
+    for hours in sizes['pos_hours']:
+        epochs = int(hours * 3600)
+
+        def read_setup(hours=hours):
+            path = _cached(data_dir / f"solution_{_label(hours)}.pos",
+                           lambda p: datagen.write_solution_file(p, hours))
+            return lambda: read_solution_file(path)
+
+        def tail_setup(hours=hours):
+            # Copia dedicata: il caso la fa crescere di un'epoca per chiamata
+            path = data_dir / f"solution_tail_{_label(hours)}.pos"
+            datagen.write_solution_file(path, hours)
+            rng = random.Random(2)
+            lines = itertools.cycle([datagen.solution_line(datagen.START, rng).encode('ascii') for _ in range(100)])
+            reader = SolutionTailReader(path)
+            reader.offset = path.stat().st_size
+            f = stack.enter_context(open(path, 'ab', buffering=0))
+
+            def op():
+                f.write(next(lines))
+                return reader.read_new_epochs()
+            return op
+
+        cases.append(Case(f"solution.read_solution_file[{_label(hours)}]", read_setup, items=epochs,
+                          unit='epoch', params={'hours': hours}))
+        cases.append(Case(f"solution.tail_reader[{_label(hours)}]", tail_setup, unit='epoch',
+                          params={'hours': hours}))
+
+    # --- Archivio colonnare delle epoche ------------------------------------------
+    for hours in sizes['pos_hours']:
+        epochs = int(hours * 3600)
+
+        def session_epochs(hours):
+            path = _cached(data_dir / f"solution_{_label(hours)}.pos",
+                           lambda p: datagen.write_solution_file(p, hours))
+            with open(path, 'r') as f:
+                return [e for e in (parse_solution_line(line.strip()) for line in f) if e]
+
+        def append_setup(hours=hours):
+            # Archivio svuotato a ogni chiamata: misura una sessione accodata a un giorno vuoto
+            root = data_dir / f"epochs_append_{_label(hours)}"
+            archive = EpochArchive(root)
+            session = session_epochs(hours)
+
+            def op():
+                shutil.rmtree(root, ignore_errors=True)
+                return archive.append("ROVER-00001", session)
+            return op
+
+        def scan_setup(hours=hours):
+            # Aggregazione in streaming dal memmap: percentuale FIX e media delle sigma orizzontali
+            archive = EpochArchive(data_dir / f"epochs_scan_{_label(hours)}")
+            if not archive.days("ROVER-00001"):
+                archive.append("ROVER-00001", session_epochs(hours))
+
+            def op():
+                fix = sigma = 0.0
+                for day in archive.iter_days("ROVER-00001", columns=('quality', 'sdn', 'sde')):
+                    fix += (day['quality'] == 1).sum()
+                    sigma += (day['sdn'] ** 2 + day['sde'] ** 2).sum()
+                return fix, sigma
+            return op
+
+        cases.append(Case(f"archive.append[{_label(hours)}]", append_setup, items=epochs, unit='epoch',
+                          params={'hours': hours}))
+        cases.append(Case(f"archive.scan[{_label(hours)}]", scan_setup, items=epochs, unit='epoch',
+                          params={'hours': hours}))
+
+    # --- Stream grezzi e rilevamento protocollo -----------------------------------
+    for protocol in ('UBX', 'RTCM3'):
+        stream = datagen.gnss_stream(protocol, sizes['stream_epochs'])
+
+        def framer_setup(stream=stream):
+            chunks = _chunks(stream)
+
+            def op():
+                framer = GNSSFramer()
+                for chunk in chunks:
+                    framer.feed(chunk)
+            return op
+
+        def detect_setup(protocol=protocol, stream=stream):
+            server = stack.enter_context(datagen.StreamServer(stream))
+            host, port = server.address
+            detected = StreamVerifier.detect_protocol(host, port)
+            if detected != protocol:
+                raise RuntimeError(f"stream {protocol} rilevato come {detected}")
+            return lambda: StreamVerifier.detect_protocol(host, port)
+
+        cases.append(Case(f"stream.framer[{protocol}]", framer_setup, items=len(stream), unit='byte',
+                          params={'protocol': protocol, 'epochs': sizes['stream_epochs']}))
+        cases.append(Case(f"stream.detect_protocol[{protocol}]", detect_setup, unit='probe',
+                          params={'protocol': protocol}))
+
+    # --- Configurazione RTKRCV ------------------------------------------------
+    def config_setup():
+        output_dir = data_dir / "config"
+        return lambda: generate_rtkrcv_config(
+            rover_serial="ROVER-00001", rover_ip="10.0.0.2", rover_port=2222,
+            master_ip="127.0.0.1", master_port=9000, master_lat=datagen.BASE_LAT,
+            master_lon=datagen.BASE_LON, master_alt=datagen.BASE_ALT, output_dir=output_dir)
+
+    cases.append(Case('config.generate_rtkrcv_config', config_setup, unit='config'))
+
+    # --- Export e /api/kml/json ---------------------------------------------------
+    for count in sizes['receivers']:
+        def kml_setup(count=count):
+            receivers = datagen.receivers(count)
+            path = data_dir / f"export_{count}.kml"
+            return lambda: KMLWriter.write(receivers, path)
+
+        def json_setup(count=count):
+            receivers = datagen.receivers(count)
+            path = data_dir / f"results_{count}.json"
+            return lambda: KMLWriter.write_json(receivers, path, kml_file=f"export_{count}.kml")
+
+        def api_setup(count=count):
+            # Parsing del KML di ripiego di /api/kml/json (run senza results.json)
+            from app import kml_to_json
+            path = _cached(data_dir / f"api_{count}.kml",
+                           lambda p: KMLWriter.write(datagen.receivers(count), p))
+            return lambda: kml_to_json(path)
+
+        params = {'receivers': count}
+        cases.append(Case(f"export.kml_write[{count}]", kml_setup, items=count, unit='receiver', params=params))
+        cases.append(Case(f"export.write_json[{count}]", json_setup, items=count, unit='receiver', params=params))
+        cases.append(Case(f"api.kml_to_json[{count}]", api_setup, items=count, unit='receiver', params=params))
+
+    return cases
+
@@ -0,0 +1,191 @@
+"""
+Generatori di dati sintetici per i benchmark: log NMEA, file soluzione RTKLIB (.pos),
+stream grezzi UBX/RTCM3 e insiemi di ricevitori. Tutti deterministici (seed), così due
+run confrontati misurano esattamente gli stessi dati.
+"""
+import datetime
+import random
+import socket
+import threading
+from pathlib import Path
+from typing import List, Optional
+from models.master import Master
+from models.receiver import Ricevitore
+from models.rover import Rover
+from utils.gnss_framer import UBX_SYNC, RTCM3_PREAMBLE, crc24q, ubx_checksum
+
+# Punto di riferimento delle posizioni generate
+BASE_LAT, BASE_LON, BASE_ALT = 45.4642035, 9.1899820, 122.5
+START = datetime.datetime(2025, 11, 4, 8, 0, 0)
+
+
+def nmea_sentence(body: str) -> str:
+    """'$' + body + '*hh' con il checksum NMEA (XOR dei caratteri di body)"""
+    checksum = 0
+    for byte in body.encode('ascii'):
+        checksum ^= byte
+    return f"${body}*{checksum:02X}"
+
+
+def _ddmm(value: float, width: int) -> str:
+    degrees = int(abs(value))
+    return f"{degrees:0{width}d}{(abs(value) - degrees) * 60:010.7f}"
+
+
+def gga_sentence(t: datetime.datetime, lat: float, lon: float, alt: float,
+                 quality: int = 4, sats: int = 18, hdop: float = 0.7) -> str:
+    return nmea_sentence(
+        f"GNGGA,{t:%H%M%S}.{t.microsecond // 10000:02d},{_ddmm(lat, 2)},{'N' if lat >= 0 else 'S'},"
+        f"{_ddmm(lon, 3)},{'E' if lon >= 0 else 'W'},{quality},{sats:02d},{hdop:.1f},{alt:.3f},M,47.2,M,1.0,0000")
+
+
+def nmea_lines(count: int, seed: int = 1) -> List[str]:
+    """count sentence GGA con posizione in lenta deriva attorno al punto di riferimento"""
+    rng = random.Random(seed)
+    return [gga_sentence(START + datetime.timedelta(seconds=i), BASE_LAT + rng.gauss(0, 1e-6),
+                         BASE_LON + rng.gauss(0, 1e-6), BASE_ALT + rng.gauss(0, 0.01),
+                         quality=rng.choice((1, 2, 4, 4, 4, 5)), sats=rng.randint(8, 30))
+            for i in range(count)]
+
+
+def write_nmea_log(path: Path, hours: float, rate: float = 1.0, seed: int = 1) -> int:
+    """
+    Log NMEA di hours ore a rate Hz: GGA, RMC, GST e GSA per epoca, con circa lo 0,5% di
+    sentence corrotte (checksum errato). Restituisce il numero di sentence scritte.
+    """
+    rng = random.Random(seed)
+    epochs = int(hours * 3600 * rate)
+    written = 0
+    with open(path, 'w', newline='\r\n') as f:
+        for i in range(epochs):
+            t = START + datetime.timedelta(seconds=i / rate)
+            lat = BASE_LAT + rng.gauss(0, 2e-7)
+            lon = BASE_LON + rng.gauss(0, 2e-7)
+            sats = sorted(rng.sample(range(1, 33), 12))
+            lines = [
+                gga_sentence(t, lat, lon, BASE_ALT + rng.gauss(0, 0.02), sats=rng.randint(10, 30)),
+                nmea_sentence(f"GNRMC,{t:%H%M%S}.00,A,{_ddmm(lat, 2)},N,{_ddmm(lon, 3)},E,0.01,,{t:%d%m%y},,,D"),
+                nmea_sentence(f"GNGST,{t:%H%M%S}.00,0.9,0.012,0.009,45.0,0.011,0.010,0.025"),
+                nmea_sentence("GNGSA,A,3," + ",".join(f"{s:02d}" for s in sats) + ",1.2,0.7,1.0"),
+            ]
+            if rng.random() < 0.02:
+                lines[0] = lines[0][:-2] + '00'
+            f.write('\n'.join(lines) + '\n')
+            written += len(lines)
+    return written
+
+
+def solution_line(t: datetime.datetime, rng: random.Random, quality: int = 1) -> str:
+    """Riga epoca nel formato llh di RTKLIB (out-solformat=llh, out-outopt=on)"""
+    return (f"{t:%Y/%m/%d %H:%M:%S}.000 {BASE_LAT + rng.gauss(0, 1e-8):14.9f} {BASE_LON + rng.gauss(0, 1e-8):14.9f}"
+            f" {BASE_ALT + rng.gauss(0, 0.005):10.4f} {quality:3d} {rng.randint(10, 30):3d}"
+            f" {0.003:8.4f} {0.003:8.4f} {0.008:8.4f} {-0.001:8.4f} {0.0005:8.4f} {-0.002:8.4f}"
+            f" {rng.uniform(0.5, 2.0):6.2f} {rng.uniform(3, 40):6.1f}\n")
+
+
+SOLUTION_HEADER = ("% program   : RTKLIB ver.demo5 b34L\n"
+                   "% pos mode  : Kinematic\n"
+                   "%  GPST                  latitude(deg) longitude(deg)  height(m)   Q  ns   sdn(m)"
+                   "   sde(m)   sdu(m)  sdne(m)  sdeu(m)  sdun(m) age(s)  ratio\n")
+
+
+def write_solution_file(path: Path, hours: float, rate: float = 1.0, seed: int = 1) -> int:
+    """File .pos di hours ore: FLOAT nei primi minuti, poi FIX. Restituisce il numero di epoche"""
+    rng = random.Random(seed)
+    epochs = int(hours * 3600 * rate)
+    with open(path, 'w') as f:
+        f.write(SOLUTION_HEADER)
+        for i in range(epochs):
+            f.write(solution_line(START + datetime.timedelta(seconds=i / rate), rng, 2 if i < 120 else 1))
+    return epochs
+
+
+def _random_bytes(rng: random.Random, size: int) -> bytes:
+    return rng.getrandbits(8 * size).to_bytes(size, 'little')
+
+
+def ubx_frame(msg_class: int, msg_id: int, payload: bytes) -> bytes:
+    body = bytes((msg_class, msg_id)) + len(payload).to_bytes(2, 'little') + payload
+    return UBX_SYNC + body + ubx_checksum(body)
+
+
+def rtcm3_frame(message_type: int, payload: bytes) -> bytes:
+    data = ((message_type << 4) & 0xFFF0).to_bytes(2, 'big') + payload
+    frame = bytes((RTCM3_PREAMBLE, len(data) >> 8, len(data) & 0xFF)) + data
+    return frame + crc24q(frame).to_bytes(3, 'big')
+
+
+def gnss_stream(protocol: str, epochs: int, seed: int = 1) -> bytes:
+    """
+    Stream grezzo di un ricevitore: 'UBX' (RXM-RAWX + NAV-PVT + una GGA per epoca) o
+    'RTCM3' (MSM7 di quattro costellazioni + 1005 ogni 10 epoche).
+    """
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(epochs):
+        t = START + datetime.timedelta(seconds=i)
+        if protocol == 'UBX':
+            chunks.append(ubx_frame(0x02, 0x15, _random_bytes(rng, 16 + 32 * 30)))
+            chunks.append(ubx_frame(0x01, 0x07, _random_bytes(rng, 92)))
+            chunks.append((gga_sentence(t, BASE_LAT, BASE_LON, BASE_ALT) + '\r\n').encode('ascii'))
+        else:
+            for message_type in (1077, 1087, 1097, 1127):
+                chunks.append(rtcm3_frame(message_type, _random_bytes(rng, rng.randint(150, 400))))
+            if i % 10 == 0:
+                chunks.append(rtcm3_frame(1005, _random_bytes(rng, 17)))
+    return b''.join(chunks)
+
+
+def receivers(count: int, seed: int = 1) -> List[Ricevitore]:
+    """Un Master e count-1 Rover con coordinate (FIX o FLOAT) sparsi in circa 10 km"""
+    rng = random.Random(seed)
+    master = Master("MASTER-0001", "10.0.0.1", 2222)
+    master.set_coordinates(BASE_LAT, BASE_LON, BASE_ALT)
+    result: List[Ricevitore] = [master]
+    for i in range(1, count):
+        rover = Rover(f"ROVER-{i:05d}", f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}", 2222)
+        rover.set_coordinates(BASE_LAT + rng.uniform(-0.05, 0.05), BASE_LON + rng.uniform(-0.07, 0.07),
+                              BASE_ALT + rng.uniform(-20, 80), status=rng.choice(('FIX', 'FIX', 'FIX', 'FLOAT')),
+                              master_id=master.serial_number)
+        result.append(rover)
+    return result
+
+
+class StreamServer:
+    """
+    Server TCP locale che invia a ogni connessione lo stesso stream (a blocchi di 4 KB),
+    per misurare StreamVerifier senza ricevitori reali.
+    """
+
+    def __init__(self, data: bytes, host: str = '127.0.0.1'):
+        self.data = data
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, 0))
+        self._sock.listen(64)
+        self.address = self._sock.getsockname()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> 'StreamServer':
+        self._thread = threading.Thread(target=self._accept, name="bench-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._sock.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._send, args=(conn,), daemon=True).start()
+
+    def _send(self, conn: socket.socket) -> None:
+        with conn:
+            try:
+                for pos in range(0, len(self.data), 4096):
+                    conn.sendall(self.data[pos:pos + 4096])
+            except OSError:
+                pass  # il client chiude appena ha classificato lo stream
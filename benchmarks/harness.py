@@ -0,0 +1,203 @@
+"""
+Misura dei casi di benchmark: latenza per chiamata (percentili), throughput, picco di
+memoria, salvataggio in JSON e confronto con un run precedente.
+"""
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # non disponibile su Windows
+    resource = None
+
+
+@dataclass
+class Case:
+    """
+    Un benchmark: setup() prepara i dati (non misurato) e restituisce l'operazione da
+    ripetere; items è il numero di elementi elaborati da una chiamata (sentence, epoche,
+    ricevitori...) e dà il throughput in unit/s.
+    """
+    name: str
+    setup: Callable[[], Callable[[], Any]]
+    items: int = 1
+    unit: str = 'op'
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Result:
+    name: str
+    params: Dict[str, Any]
+    unit: str
+    items: int
+    # Campioni raccolti e chiamate per campione (le operazioni brevi sono raggruppate)
+    samples: int
+    number: int
+    # Latenza di una chiamata in microsecondi
+    mean_us: float
+    min_us: float
+    p50_us: float
+    p90_us: float
+    p99_us: float
+    max_us: float
+    ops_per_s: float
+    items_per_s: float
+    # Picco di memoria Python allocata durante una chiamata (tracemalloc)
+    peak_alloc_kb: float
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentile con interpolazione lineare su valori già ordinati"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+
+class Runner:
+    """
+    Esegue i casi. Dopo il riscaldamento, le chiamate più brevi di SAMPLE_TARGET vengono
+    raggruppate (number chiamate per campione, come timeit) e la latenza di un campione è
+    la media del gruppo; si raccolgono campioni per almeno min_time secondi e almeno
+    MIN_SAMPLES. Il picco di memoria si misura a parte, su una chiamata sotto tracemalloc,
+    perché il tracciamento rallenta le allocazioni e falserebbe i tempi.
+    """
+
+    SAMPLE_TARGET = 0.002
+    MIN_SAMPLES = 5
+    MAX_SAMPLES = 1000
+
+    def __init__(self, min_time: float = 1.0, warmup: int = 1):
+        self.min_time = min_time
+        self.warmup = warmup
+
+    def run(self, case: Case) -> Result:
+        with _quiet():
+            op = case.setup()
+            for _ in range(self.warmup):
+                op()
+            number = self._calibrate(op)
+            timings = self._sample(op, number)
+            peak = self._peak_memory(op)
+
+        timings.sort()
+        mean = sum(timings) / len(timings)
+        return Result(
+            name=case.name, params=case.params, unit=case.unit, items=case.items,
+            samples=len(timings), number=number,
+            mean_us=round(mean * 1e6, 3), min_us=round(timings[0] * 1e6, 3),
+            p50_us=round(percentile(timings, 0.5) * 1e6, 3), p90_us=round(percentile(timings, 0.9) * 1e6, 3),
+            p99_us=round(percentile(timings, 0.99) * 1e6, 3), max_us=round(timings[-1] * 1e6, 3),
+            ops_per_s=round(1 / mean, 2) if mean else 0.0,
+            items_per_s=round(case.items / mean, 2) if mean else 0.0,
+            peak_alloc_kb=round(peak / 1024, 1))
+
+    def _calibrate(self, op: Callable[[], Any]) -> int:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                op()
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.SAMPLE_TARGET or number >= 1 << 20:
+                return number
+            number *= 10 if elapsed < self.SAMPLE_TARGET / 10 else 2
+
+    def _sample(self, op: Callable[[], Any], number: int) -> List[float]:
+        timings: List[float] = []
+        deadline = time.perf_counter() + self.min_time
+        gc_enabled = gc.isenabled()
+        gc.collect()
+        gc.disable()
+        try:
+            while len(timings) < self.MAX_SAMPLES and (len(timings) < self.MIN_SAMPLES
+                                                       or time.perf_counter() < deadline):
+                start = time.perf_counter()
+                for _ in range(number):
+                    op()
+                timings.append((time.perf_counter() - start) / number)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return timings
+
+    @staticmethod
+    def _peak_memory(op: Callable[[], Any]) -> int:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            op()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Le funzioni misurate stampano log (config scritta, KML creato): non vanno a terminale"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def max_rss_mb() -> Optional[float]:
+    """Picco di memoria residente del processo (MB), None se non disponibile"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta kB, macOS byte
+    return round(rss / (2 ** 20 if sys.platform == 'darwin' else 1024), 1)
+
+
+def report(results: List[Result], scale: str) -> Dict:
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'max_rss_mb': max_rss_mb(),
+        'results': [asdict(r) for r in results],
+    }
+
+
+def save(data: Dict, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Confronta la latenza mediana (p50) di ogni caso presente in entrambi i report.
+    Restituisce le righe di confronto; quelle dei casi più lenti di oltre threshold
+    (es. 0.15 = +15%) iniziano con 'REGRESSIONE'.
+    """
+    previous = {r['name']: r for r in baseline.get('results', [])}
+    lines = []
+    for result in current.get('results', []):
+        old = previous.get(result['name'])
+        if not old or not old.get('p50_us'):
+            continue
+        change = result['p50_us'] / old['p50_us'] - 1
+        label = 'REGRESSIONE' if change > threshold else 'migliorato' if change < -threshold else 'invariato'
+        lines.append(f"{label:<12} {result['name']:<40} p50 {old['p50_us']:>12.1f} -> "
+                     f"{result['p50_us']:>12.1f} us ({change:+.1%})")
+    return lines
+
+
+def format_result(result: Result) -> str:
+    return (f"{result.name:<40} p50 {result.p50_us:>12.1f} us  p99 {result.p99_us:>12.1f} us  "
+            f"{result.items_per_s:>14,.0f} {result.unit}/s  picco {result.peak_alloc_kb:>10,.1f} kB")
@@ -1,10 +1,27 @@
+import argparse
 from pathlib import Path
 from manager.rtk_manager import RTKManager
+from manager.monitor_daemon import MonitorDaemon
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RTK Multi-Session Handler")
+    parser.add_argument("--delta", action="store_true",
+                        help="Rielabora solo i Rover senza un FIX recente in archivio")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Non riprendere l'ultimo run interrotto: inizia un nuovo run")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Monitoraggio continuo: rielabora i Rover con la cadenza di settings.monitor")
+    args = parser.parse_args()
+
+    if args.daemon:
+        MonitorDaemon(yaml_path=Path("./stations.yaml"), rtklib_path=Path("./rtklib/rtkrcv")).run()
+        raise SystemExit(0)
+
     manager = RTKManager(
         yaml_path=Path("./stations.yaml"),
-        rtklib_path=Path("./rtklib/rtkrcv")
+        rtklib_path=Path("./rtklib/rtkrcv"),
+        delta=args.delta,
+        resume=not args.no_resume
     )
     
     manager.run()
@@ -0,0 +1,87 @@
+import threading
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from manager.rtk_manager import RTKManager
+from utils import events
+from utils.session_log import capture_stdout
+
+
+class InProcessRun:
+    """
+    Esecuzione di RTKManager in un thread del processo che la richiede (la dashboard),
+    invece di un sottoprocesso 'python -u main.py'.
+
+    Niente avvio dell'interprete né import a ogni run; il log testuale arriva a on_line
+    riga per riga, gli eventi strutturati a on_event come dizionari (senza passare dal
+    testo) e lo stato dei ricevitori si legge direttamente dal manager con results().
+    stop() è cooperativo: imposta cancel_event e le sessioni in corso terminano al
+    controllo successivo. Un solo run alla volta, perché stdout viene rediretto per
+    l'intero processo finché il run è attivo.
+    """
+
+    def __init__(self, manager: RTKManager, on_line: Callable[[str], None],
+                 on_event: Callable[[Dict], None], on_finish: Optional[Callable[[], None]] = None):
+        self.manager = manager
+        self.on_line = on_line
+        self.on_event = on_event
+        self.on_finish = on_finish
+        self.error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def anchor(manager: RTKManager, base_dir: Path) -> RTKManager:
+        """
+        Rende assoluti i percorsi di lavoro del manager (il processo ospite può avere un'altra cwd).
+        Va chiamato prima di run(): load_receivers apre l'archivio delle epoche su epoch_archive_path.
+        """
+        base_dir = Path(base_dir)
+        manager.work_dir = base_dir / manager.work_dir
+        manager.output_dir = base_dir / manager.output_dir
+        manager.probe_cache_path = base_dir / manager.probe_cache_path
+        manager.result_store_path = base_dir / manager.result_store_path
+        manager.epoch_archive_path = base_dir / manager.epoch_archive_path
+        return manager
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="rtk-inprocess", daemon=True)
+        self._thread.start()
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self, timeout: float = 15.0) -> bool:
+        """Richiede l'arresto e attende al più timeout secondi; False se il run è ancora attivo"""
+        self.manager.cancel_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running()
+
+    def results(self) -> List[Dict]:
+        """Vista in memoria dei ricevitori del run: ruolo, stato della soluzione e coordinate"""
+        manager = self.manager
+        receivers = list(manager.all_masters) + list(manager.rovers) + list(manager.restored_rovers)
+        results = []
+        for rcv in receivers:
+            entry = {'serial': rcv.serial_number, 'role': rcv.role, 'status': rcv.sol_status,
+                     'master_id': rcv.linked_master_id}
+            entry.update(rcv.get_coordinates() or {})
+            results.append(entry)
+        return results
+
+    def _run(self) -> None:
+        events.add_listener(self.on_event)
+        events.set_stdout(False)
+        try:
+            with capture_stdout(self.on_line):
+                try:
+                    self.manager.run()
+                except Exception as e:
+                    self.error = str(e)
+                    print(f"ERRORE: {e}", flush=True)
+                    print(traceback.format_exc().rstrip(), flush=True)
+        finally:
+            events.set_stdout(True)
+            events.remove_listener(self.on_event)
+            if self.on_finish:
+                self.on_finish()
@@ -0,0 +1,246 @@
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Callable, Dict, List, Set, Tuple
+from manager.rtk_manager import RTKManager
+from models.coordinates import Coordinates
+from models.master import Master
+from models.rover import Rover
+from utils.result_store import ResultStore
+from utils.rtkrcv_pool import RTKRCVPool
+from utils.session_log import log, log_prefix
+from utils import events
+
+
+@dataclass
+class MonitorSettings:
+    """Parametri della modalità monitoraggio (settings.monitor in stations.yaml)"""
+    # Intervallo (s) tra due soluzioni dello stesso Rover (sovrascrivibile con monitor_cadence del Rover)
+    cadence: float = 3600.0
+    # Spostamento dal primo FIX della serie oltre cui viene generato un allarme (m)
+    displacement_threshold: float = 0.02
+    vertical_threshold: float = 0.04
+    # Conservazione della serie temporale nell'archivio (giorni)
+    retention_days: float = 90.0
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> 'MonitorSettings':
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in (settings.get('monitor') or {}).items() if k in names})
+
+
+class MonitorDaemon(RTKManager):
+    """
+    Modalità monitoraggio continuo (deformazioni): ogni Rover viene rielaborato con la sua
+    cadenza per tutta la vita del processo e le soluzioni vanno nella serie temporale
+    dell'archivio.
+
+    Le scadenze stanno in un heap (scadenza, ordine di inserimento): quando gli slot sono
+    tutti occupati i Rover in ritardo vengono serviti in ordine di scadenza, così nessun
+    Rover resta indietro. Lo stato in memoria è fisso (un elemento di heap per Rover), la
+    serie viene potata oltre retention_days e il ciclo dorme fino alla prossima scadenza o
+    al termine di una sessione: uso di memoria e CPU resta costante nel tempo.
+
+    Un allarme scatta quando un Rover supera la soglia e non si ripete finché lo spostamento
+    non rientra. Con la stessa cadenza della potatura la posizione di ogni Master viene
+    ricontrollata: se la base deriva oltre master_drift_threshold gli spostamenti dei suoi
+    Rover non generano allarmi, perché rifletterebbero il movimento della base.
+    """
+
+    # Intervallo tra due potature della serie temporale e tra due controlli di deriva dei Master
+    PRUNE_INTERVAL = 3600.0
+    IDLE_WAKEUP = 5.0
+
+    def __init__(self, yaml_path: Path, rtklib_path: Path):
+        super().__init__(yaml_path, rtklib_path, resume=False)
+        self.monitor = MonitorSettings()
+        # Callback invocate a ogni allarme: fn(rover, orizzontale_m, verticale_m)
+        self.alert_handlers: List[Callable[[Rover, float, float], None]] = []
+        self._schedule: List[Tuple[float, int, str]] = []
+        self._order = itertools.count()
+        # Rover oltre soglia (allarme già emesso) e Master con deriva oltre soglia (serial -> metri)
+        self._alerting: Set[str] = set()
+        self._drifted_masters: Dict[str, float] = {}
+
+    def load_receivers(self) -> None:
+        super().load_receivers()
+        self.monitor = MonitorSettings.from_settings(self.settings)
+
+    def cadence_of(self, rover: Rover) -> float:
+        return float(self.receiver_config.get(rover.serial_number, {}).get('monitor_cadence', self.monitor.cadence))
+
+    def run(self) -> None:
+        print("=== RTK Monitor ===\n", flush=True)
+        self.load_receivers()
+        if not self.master or not self.rovers:
+            print("Servono un Master e almeno un Rover per il monitoraggio", flush=True)
+            return
+
+        self.store = ResultStore(self.result_store_path)
+        if self.master_relay:
+            self._start_master_relay()
+        try:
+            if not self.position_masters():
+                print("Impossibile avviare il monitoraggio senza posizione Master", flush=True)
+                return
+            self.assign_rovers()
+            self._start_coordinator()
+            # Con più basi il limite è la somma dei limiti dei Master in uso
+            limit = sum(self._session_limit(m) for m in self.masters)
+            if self.session_options.session_pool:
+                self.rtkrcv_pool = RTKRCVPool(self.rtklib_path, self.work_dir, size=limit)
+            self._loop(limit)
+        except KeyboardInterrupt:
+            print("\nMonitoraggio interrotto dall'utente", flush=True)
+            self.cancel_event.set()
+        finally:
+            if self.rtkrcv_pool:
+                self.rtkrcv_pool.close()
+                self.rtkrcv_pool = None
+            self._stop_master_relay()
+            self.store.close()
+            self.store = None
+
+    def stop(self) -> None:
+        """Richiede l'arresto: le sessioni in corso terminano al prossimo controllo di cancel_event"""
+        self.cancel_event.set()
+
+    def _loop(self, limit: int) -> None:
+        rovers: Dict[str, Rover] = {r.serial_number: r for r in self.rovers}
+        now = time.monotonic()
+        for rover in self.rovers:
+            self._push(now, rover.serial_number)
+        log(f"Monitoraggio di {len(rovers)} Rover, {limit} sessioni in parallelo")
+
+        next_prune = now
+        # Le posizioni dei Master sono appena state acquisite: il primo controllo di deriva
+        # avviene al giro di potatura successivo
+        verify_masters = False
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=limit, thread_name_prefix="rtk-monitor") as executor:
+            try:
+                while not self.cancel_event.is_set():
+                    now = time.monotonic()
+                    if now >= next_prune:
+                        removed = self.store.prune_series(self.monitor.retention_days * 86400)
+                        if removed:
+                            log(f"Serie di monitoraggio: {removed} punti oltre {self.monitor.retention_days:g} giorni rimossi")
+                        if self.epoch_archive:
+                            days = self.epoch_archive.prune(self.monitor.retention_days * 86400)
+                            if days:
+                                log(f"Archivio epoche: {days} giorni oltre {self.monitor.retention_days:g} giorni rimossi")
+                        if verify_masters:
+                            self._verify_masters()
+                        verify_masters = True
+                        next_prune = now + self.PRUNE_INTERVAL
+
+                    # Avvia i Rover scaduti finché ci sono slot liberi, in ordine di scadenza
+                    while self._schedule and len(in_flight) < limit and self._schedule[0][0] <= now:
+                        _, _, serial = heapq.heappop(self._schedule)
+                        in_flight[executor.submit(self._solve, rovers[serial])] = serial
+
+                    if in_flight:
+                        # Risveglio al termine di una sessione, alla prossima scadenza (se c'è
+                        # uno slot libero) o comunque periodicamente per reagire a cancel_event
+                        timeout = self.IDLE_WAKEUP
+                        if self._schedule and len(in_flight) < limit:
+                            timeout = min(timeout, max(0.0, self._schedule[0][0] - now))
+                        done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            serial = in_flight.pop(future)
+                            try:
+                                future.result()
+                            except Exception as e:
+                                log(f"Errore sessione Rover {serial}: {e}")
+                            self._push(time.monotonic() + self.cadence_of(rovers[serial]), serial)
+                    elif self._schedule:
+                        self.cancel_event.wait(max(0.0, self._schedule[0][0] - now))
+            finally:
+                self.cancel_event.set()
+
+    def _verify_masters(self) -> None:
+        """Controllo di deriva periodico delle basi in uso rispetto alla posizione di partenza"""
+        masters = [m for m in self.masters if m.has_coordinates()]
+        if not masters:
+            return
+        with ThreadPoolExecutor(max_workers=len(masters), thread_name_prefix="master-drift") as executor:
+            drifts = dict(zip(masters, executor.map(
+                lambda m: m.check_drift(m.coords, samples=self.master_drift_samples, cancel_event=self.cancel_event),
+                masters)))
+        for master, drift in drifts.items():
+            serial = master.serial_number
+            if drift is None:
+                if not self.cancel_event.is_set():
+                    log(f"⚠️  Controllo deriva Master {serial} non riuscito, riprovo tra {self.PRUNE_INTERVAL:.0f}s")
+            elif drift > self.master_drift_threshold:
+                if serial not in self._drifted_masters:
+                    log(f"[ALERT] Master {serial} spostato di {drift:.2f} m (> {self.master_drift_threshold:g} m): "
+                        f"allarmi dei suoi Rover sospesi")
+                    events.emit(events.ALERT, serial, horizontal=round(drift, 4), vertical=None)
+                self._drifted_masters[serial] = drift
+            elif self._drifted_masters.pop(serial, None) is not None:
+                log(f"Master {serial} rientrato nella soglia di deriva ({drift:.2f} m): allarmi dei Rover riattivati")
+
+    def _push(self, due: float, serial: str) -> None:
+        heapq.heappush(self._schedule, (due, next(self._order), serial))
+
+    def _solve(self, rover: Rover) -> None:
+        # La soluzione precedente non deve sopravvivere a una sessione fallita
+        rover.coords = None
+        rover.sol_status = None
+        master = self.master_for(rover)
+        with log_prefix(f"[{rover.serial_number}] "):
+            success = self._run_session(rover, master)
+            if self.cancel_event.is_set():
+                return  # sessione annullata: il risultato parziale non entra nella serie
+            if not success:
+                log(f"Nessuna soluzione per Rover {rover.serial_number}, ritento alla prossima scadenza")
+                self.store.record_series(rover.serial_number, master.serial_number, 'NONE', None)
+                # Se il Master è caduto, la prossima sessione usa la base successiva per distanza
+                self._failover(rover, set())
+                return
+
+            if rover.session_resources:
+                self.store.record_resources(None, rover.serial_number, rover.session_resources)
+            coords = rover.get_coordinates()
+            events.emit(events.SOLUTION, rover.serial_number, status=rover.sol_status, **coords)
+            self.store.record_series(rover.serial_number, master.serial_number, rover.sol_status, coords)
+            log(f"Rover {rover.serial_number} ({rover.sol_status}): {rover.coords}")
+            if rover.sol_status == 'FIX':
+                self._check_displacement(rover, master, coords)
+
+    def _check_displacement(self, rover: Rover, master: Master, coords: Dict[str, float]) -> None:
+        # Gli spostamenti si misurano rispetto al primo FIX calcolato con la stessa base
+        baseline = self.store.series_baseline(rover.serial_number, master.serial_number)
+        if baseline is None:
+            return
+        reference = Coordinates(baseline['lat'], baseline['lon'], baseline['alt'])
+        horizontal = reference.distance_to(rover.coords)
+        vertical = coords['alt'] - reference.alt
+        serial = rover.serial_number
+        if horizontal <= self.monitor.displacement_threshold and abs(vertical) <= self.monitor.vertical_threshold:
+            if serial in self._alerting:
+                self._alerting.discard(serial)
+                log(f"Rover {serial} rientrato nelle soglie di spostamento")
+            return
+        if master.serial_number in self._drifted_masters:
+            log(f"Rover {serial} spostato di {horizontal * 100:.1f} cm con base {master.serial_number} in deriva: "
+                f"nessun allarme")
+            return
+        # Un solo allarme per superamento: si riattiva dopo il rientro nelle soglie
+        if serial in self._alerting:
+            return
+        self._alerting.add(serial)
+
+        log(f"[ALERT] Rover {rover.serial_number} spostato di {horizontal * 100:.1f} cm in orizzontale, "
+            f"{vertical * 100:+.1f} cm in verticale rispetto al primo FIX")
+        self.store.record_alert(rover.serial_number, horizontal, vertical, coords)
+        events.emit(events.ALERT, rover.serial_number, horizontal=round(horizontal, 4), vertical=round(vertical, 4))
+        for handler in self.alert_handlers:
+            try:
+                handler(rover, horizontal, vertical)
+            except Exception as e:
+                log(f"Errore gestione allarme: {e}")
@@ -1,21 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Set
 import yaml
 import datetime
+import threading
+import time
+from models.coordinates import Coordinates
 from models.master import Master
 from models.rover import Rover
 from models.receiver import Ricevitore
-from utils.kml_writer import KMLWriter
+from models.session_options import SessionOptions
+from manager.session_scheduler import SessionScheduler, DEFAULT_MAX_SESSIONS
+from manager.worker_coordinator import WorkerCoordinator
+from utils.kml_writer import KMLWriter, RESULTS_JSON
+from utils.convergence import ConvergenceCriteria
+from utils.rtkrcv_pool import RTKRCVPool
+from utils.result_store import ResultStore, DEFAULT_RESULT_STORE
+from utils.epoch_archive import EpochArchive, DEFAULT_EPOCH_ARCHIVE
+from utils.resource_monitor import AdmissionController, AdmissionSettings
+from utils.spatial_index import SpatialIndex
 from utils.validator import Validator
+from utils.metrics import phase
+from utils.session_log import log
+from utils.cancel_event import CancelEvent
+from utils import events
 
 class RTKManager:
     """Gestisce il processo completo di acquisizione coordinate RTK"""
-    def __init__(self, yaml_path: Path, rtklib_path: Path):
+    def __init__(self, yaml_path: Path, rtklib_path: Path, delta: bool = False, resume: bool = True):
         self.yaml_path = yaml_path
         self.rtklib_path = rtklib_path
         self.receivers: List[Ricevitore] = []
+        # Master principale (il primo utilizzabile in ordine di configurazione) e tutti i Master:
+        # all_masters come configurati, masters quelli raggiungibili e posizionati (basi in uso)
         self.master: Optional[Master] = None
+        self.all_masters: List[Master] = []
+        self.masters: List[Master] = []
         self.rovers: List[Rover] = []
+        # Master assegnato a ogni Rover (il più vicino tra quelli in uso) e posizioni approssimate dei Rover
+        self.assignment: Dict[str, Master] = {}
+        self.rover_positions: Dict[str, Coordinates] = {}
+        self.master_index: Optional[SpatialIndex] = None
+        # Timeout (s) della lettura di una GGA dal Rover per stimarne la posizione (settings.rover_position_timeout)
+        self.rover_position_timeout = 5.0
+        self._masters_lock = threading.Lock()
+        # Numero massimo di sessioni RTKRCV concorrenti (settings.max_sessions, sovrascrivibile per master);
+        # con 'auto' (default) è ricavato da CPU e memoria dell'host e dalla capacità dei worker remoti
+        self.max_sessions = DEFAULT_MAX_SESSIONS
+        self.auto_sessions = False
+        # Ammissione delle sessioni locali in base al carico dell'host (settings.admission)
+        self.admission = AdmissionController()
+        self.work_dir = Path("tmp")
+        self.output_dir = Path("output")
+        # Formati esportati oltre al KML (settings.export_formats: kmz, geojson, csv, ndjson)
+        self.export_formats: List[str] = ['geojson']
+        # Verifica connettività: deadline globale e cache dei probe (settings.probe_deadline / probe_cache_ttl)
+        self.probe_deadline = 8.0
+        self.probe_cache_ttl = 60.0
+        self.probe_cache_path = Path("cache") / "probe_cache.json"
+        self.cancel_event = CancelEvent()
+        self.session_options = SessionOptions()
+        # Pool di processi RTKRCV riutilizzati tra i Rover (settings.session_pool), attivo durante process_rovers
+        self.rtkrcv_pool: Optional[RTKRCVPool] = None
+        # Worker agent remoti (settings.workers, 'host:porta'); senza worker disponibili le
+        # sessioni girano in locale, salvo settings.worker_fallback: false
+        self.workers: List[str] = []
+        self.worker_fallback = True
+        # Token condiviso richiesto dai worker avviati con --token (settings.worker_token)
+        self.worker_token: Optional[str] = None
+        self.coordinator: Optional[WorkerCoordinator] = None
+        # Relay fan-out locale verso il Master (settings.master_relay)
+        self.master_relay = True
+        # Report dell'ultimo run (wall time e tempi per Rover), vedi _build_run_report
+        self.run_report: dict = {}
+        # Archivio incrementale dei risultati (ripresa dei run interrotti e modalità delta)
+        self.result_store_path = DEFAULT_RESULT_STORE
+        self.store: Optional[ResultStore] = None
+        self.run_id: Optional[int] = None
+        # Archivio colonnare delle epoche di ogni sessione (settings.epoch_archive, attivo di default)
+        self.epoch_archive_path = DEFAULT_EPOCH_ARCHIVE
+        self.epoch_archive: Optional[EpochArchive] = None
+        self.resume = resume
+        # Delta: salta i Rover con un FIX più recente di delta_max_age secondi (settings.delta / --delta)
+        self.delta = delta
+        self.delta_max_age = 86400.0
+        # Rover con soluzione ripresa dall'archivio, non rielaborati in questo run
+        self.restored_rovers: List[Rover] = []
+        # Coordinate del Master su cui è stata calcolata ogni soluzione ripresa (per serial Rover)
+        self._restored_bases: Dict[str, Optional[Dict[str, float]]] = {}
+        # Cache della posizione Master: entro master_cache_ttl secondi basta un controllo di
+        # deriva su master_drift_samples campioni; si riacquisisce oltre master_drift_threshold metri
+        self.master_cache_ttl = 7 * 86400.0
+        self.master_drift_threshold = 3.0
+        self.master_drift_samples = 2
+        # Esito del run nell'archivio: 'completed', 'failed' (uscita anticipata senza Rover o
+        # senza posizione Master, non riprendibile) o 'interrupted' (annullamento o eccezione)
+        self._run_status = 'interrupted'
+        # Sezione settings e voci dei ricevitori così come lette dal YAML (per serial)
+        self.settings: dict = {}
+        self.receiver_config: dict = {}
 
     def load_receivers(self) -> None:
         """Carica ricevitori da file YAML"""
@@ -25,23 +108,56 @@ class RTKManager:
         with open(self.yaml_path, 'r') as f:
             data = yaml.safe_load(f)
 
+        settings = data.get('settings') or {}
+        self.settings = settings
+        self.admission = AdmissionController(AdmissionSettings.from_settings(settings))
+        self.auto_sessions = settings.get('max_sessions', 'auto') == 'auto'
+        if self.auto_sessions:
+            self.max_sessions = self.admission.auto_limit()
+            print(f"Sessioni concorrenti (auto): fino a {self.max_sessions} su {self.admission.monitor.cpu_count} CPU, "
+                  f"avvio in base al carico dell'host", flush=True)
+        else:
+            self.max_sessions = settings['max_sessions']
+        self.probe_deadline = settings.get('probe_deadline', self.probe_deadline)
+        self.probe_cache_ttl = settings.get('probe_cache_ttl', self.probe_cache_ttl)
+        self.session_options = SessionOptions.from_settings(settings)
+        self.master_relay = bool(settings.get('master_relay', True))
+        self.export_formats = settings.get('export_formats', self.export_formats)
+        self.delta = self.delta or bool(settings.get('delta', False))
+        self.delta_max_age = settings.get('delta_max_age', self.delta_max_age)
+        self.master_cache_ttl = settings.get('master_cache_ttl', self.master_cache_ttl)
+        self.master_drift_threshold = settings.get('master_drift_threshold', self.master_drift_threshold)
+        self.master_drift_samples = settings.get('master_drift_samples', self.master_drift_samples)
+        self.rover_position_timeout = settings.get('rover_position_timeout', self.rover_position_timeout)
+        self.workers = settings.get('workers') or []
+        self.worker_fallback = bool(settings.get('worker_fallback', True))
+        self.worker_token = settings.get('worker_token')
+        self.epoch_archive = EpochArchive(self.epoch_archive_path) if settings.get('epoch_archive', True) else None
+
         for item in data.get('receivers', {}).values():
             role = item.get('role')
+            self.receiver_config[item['serial']] = item
 
             if role == 'master':
-                self.master = Master(item['serial'], item['ip'], item['port'])
+                master = Master(item['serial'], item['ip'], item['port'])
+                master.max_sessions = item.get('max_sessions')
                 # Carica coordinate se presenti nel YAML
                 if 'coords' in item:
                     coords = item['coords']
-                    self.master.set_coordinates(
+                    master.set_coordinates(
                         lat=coords.get('lat'),
                         lon=coords.get('lon'),
                         alt=coords.get('alt')
                     )
-                self.receivers.append(self.master)
+                self.all_masters.append(master)
+                if self.master is None:
+                    self.master = master
+                self.receivers.append(master)
             elif role == 'rover':
                 timeout = item.get('timeout', 300)
                 rover = Rover(item['serial'], item['ip'], item['port'], timeout)
+                rover.convergence = ConvergenceCriteria.from_config(settings.get('convergence'),
+                                                                    item.get('convergence'))
                 # Carica coordinate se presenti nel YAML
                 if 'coords' in item:
                     coords = item['coords']
@@ -53,133 +169,691 @@ class RTKManager:
                 self.rovers.append(rover)
                 self.receivers.append(rover)
 
-    def acquire_master_position(self) -> bool:
-        """Acquisisce posizione del Master da stream NMEA"""
-        if not self.master:
+        self.masters = list(self.all_masters)
+
+    def acquire_master_position(self, master: Optional[Master] = None) -> bool:
+        """Acquisisce posizione del Master (default: il Master principale) da stream NMEA"""
+        master = master or self.master
+        if not master:
             print("Nessun Master configurato", flush=True)
             return False
 
-        print(f"Acquisizione posizione Master da stream NMEA...", flush=True)
-        success = self.master.read_nmea_position()
+        if self._use_cached_master_position(master):
+            print(f"Master {master.serial_number} posizionato: {master.coords}", flush=True)
+            self._emit_master_position('cache', master)
+            return True
+        if self.cancel_event.is_set():
+            return False
+
+        print(f"Acquisizione posizione Master {master.serial_number} da stream NMEA...", flush=True)
+        success = master.read_nmea_position(cancel_event=self.cancel_event)
 
         if success:
-            print(f"Master posizionato: {self.master.coords}", flush=True)
-            # Salvataggio solo alla fine
+            print(f"Master {master.serial_number} posizionato: {master.coords}", flush=True)
+            self._emit_master_position('nmea', master)
+            if self.store and self.master_cache_ttl > 0:
+                self.store.save_master_position(master.serial_number, self._master_address(master),
+                                                master.coords.lat, master.coords.lon, master.coords.alt)
         else:
-            print("Impossibile acquisire posizione Master", flush=True)
+            print(f"Impossibile acquisire posizione Master {master.serial_number}", flush=True)
 
         return success
 
+    def _master_address(self, master: Optional[Master] = None) -> str:
+        master = master or self.master
+        return f"{master.ip_address}:{master.port}"
+
+    def _use_cached_master_position(self, master: Optional[Master] = None) -> bool:
+        """
+        Usa la posizione Master in cache se ancora valida: invece della media completa
+        (fino a 30s) legge pochi campioni e verifica che la deriva resti sotto soglia.
+        """
+        master = master or self.master
+        if not self.store or self.master_cache_ttl <= 0:
+            return False
+        cached = self.store.cached_master_position(master.serial_number, self._master_address(master),
+                                                   self.master_cache_ttl)
+        if cached is None:
+            return False
+
+        reference = Coordinates(cached['lat'], cached['lon'], cached['alt'])
+        age = time.time() - cached['acquired_at']
+        print(f"Posizione Master {master.serial_number} in cache ({age / 3600:.1f}h fa), controllo deriva...", flush=True)
+        drift = master.check_drift(reference, samples=self.master_drift_samples, cancel_event=self.cancel_event)
+        if self.cancel_event.is_set():
+            return False
+        if drift is None:
+            print("⚠️  Controllo deriva non riuscito, riacquisizione completa", flush=True)
+            return False
+        if drift > self.master_drift_threshold:
+            print(f"⚠️  Deriva Master {drift:.2f} m > {self.master_drift_threshold:g} m, riacquisizione completa",
+                  flush=True)
+            return False
+
+        print(f"Deriva Master {drift:.2f} m: uso la posizione in cache", flush=True)
+        master.set_coordinates(reference.lat, reference.lon, reference.alt)
+        return True
+
+    def position_masters(self) -> bool:
+        """
+        Porta tutti i Master in uso ad avere una posizione (YAML, cache o NMEA), acquisendo
+        in parallelo quelle mancanti. I Master che non si riesce a posizionare escono da
+        self.masters; restituisce False se non ne resta nessuno.
+        """
+        pending = []
+        for master in self.masters:
+            if master.has_coordinates():
+                print(f"Master {master.serial_number} già posizionato: {master.coords}", flush=True)
+                self._emit_master_position('config', master)
+            else:
+                pending.append(master)
+
+        failed = set()
+        if len(pending) == 1:
+            if not self.acquire_master_position(pending[0]):
+                failed.add(pending[0].serial_number)
+        elif pending:
+            with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="master-position") as executor:
+                outcome = dict(zip(pending, executor.map(self.acquire_master_position, pending)))
+            failed = {master.serial_number for master, ok in outcome.items() if not ok}
+
+        with self._masters_lock:
+            self.masters = [m for m in self.masters if m.serial_number not in failed]
+            if self.masters:
+                self.master = self.masters[0]
+        return bool(self.masters)
+
+    def assign_rovers(self) -> None:
+        """
+        Assegna ogni Rover al Master in uso più vicino.
+
+        Con più Master serve una posizione approssimata del Rover: coordinate del YAML,
+        ultima soluzione in archivio o, in mancanza, una GGA letta dallo stream del Rover
+        (in parallelo, al più rover_position_timeout secondi). Le basi sono in un
+        SpatialIndex; un Rover senza posizione nota va al Master principale.
+        """
+        self.assignment = {}
+        self.master_index = SpatialIndex(
+            (m.serial_number, m.coords.lat, m.coords.lon) for m in self.masters)
+        if len(self.masters) > 1:
+            self._approximate_rover_positions()
+
+        for rover in self.rovers:
+            master, distance = self.master, None
+            ranked = self._rank_masters(rover)
+            if ranked:
+                distance, master = ranked[0]
+            self.assignment[rover.serial_number] = master
+            if len(self.masters) > 1:
+                where = f"{distance / 1000:.1f} km" if distance is not None else "posizione ignota"
+                print(f"Rover {rover.serial_number} -> Master {master.serial_number} ({where})", flush=True)
+            events.emit(events.ASSIGNED, rover.serial_number, master=master.serial_number,
+                        distance=round(distance, 1) if distance is not None else None)
+
+    def master_for(self, rover: Rover) -> Master:
+        return self.assignment.get(rover.serial_number, self.master)
+
+    def _rank_masters(self, rover: Rover, exclude: Set[str] = frozenset()) -> List[tuple]:
+        """Master in uso (distanza_m, Master) dal più vicino al Rover; vuota se la posizione è ignota"""
+        position = self.rover_positions.get(rover.serial_number)
+        if position is None or self.master_index is None:
+            return []
+        with self._masters_lock:
+            usable = {m.serial_number: m for m in self.masters}
+        excluded = set(exclude) | {m.serial_number for m in self.all_masters if m.serial_number not in usable}
+        ranked = self.master_index.nearest(position.lat, position.lon, k=len(self.master_index), exclude=excluded)
+        return [(distance, usable[serial]) for distance, serial in ranked]
+
+    def _approximate_rover_positions(self) -> None:
+        missing = []
+        for rover in self.rovers:
+            if rover.serial_number in self.rover_positions:
+                continue
+            if rover.has_coordinates():
+                self.rover_positions[rover.serial_number] = rover.coords
+                continue
+            row = self.store.last_position(rover.serial_number) if self.store else None
+            if row is not None:
+                self.rover_positions[rover.serial_number] = Coordinates(row['lat'], row['lon'], row['alt'])
+            else:
+                missing.append(rover)
+        if not missing:
+            return
+
+        print(f"Stima posizione di {len(missing)} Rover dallo stream NMEA...", flush=True)
+        with ThreadPoolExecutor(max_workers=min(16, len(missing)), thread_name_prefix="rover-position") as executor:
+            positions = executor.map(
+                lambda rover: rover.approximate_position(self.rover_position_timeout, self.cancel_event), missing)
+            for rover, position in zip(missing, positions):
+                if position is not None:
+                    self.rover_positions[rover.serial_number] = position
+
+    def _failover(self, rover: Rover, tried: Set[str]) -> Optional[Master]:
+        """
+        Dopo una sessione fallita: se il Master del Rover non risponde più viene tolto dalle
+        basi in uso e il Rover passa al Master successivo per distanza (non ancora provato).
+        Restituisce il nuovo Master, None se la sessione va considerata fallita.
+        """
+        from utils.stream_verifier import StreamVerifier
+
+        master = self.master_for(rover)
+        tried.add(master.serial_number)
+        with self._masters_lock:
+            in_use = master in self.masters
+        if in_use and StreamVerifier.check_reachability(master.ip_address, master.port):
+            return None  # Master attivo: il problema è del Rover
+        with self._masters_lock:
+            if master in self.masters:
+                log(f"⚠️  Master {master.serial_number} non raggiungibile, escluso dalle basi in uso")
+                self.masters.remove(master)
+                if self.masters and self.master is master:
+                    self.master = self.masters[0]
+            candidates = [m for m in self.masters if m.serial_number not in tried]
+        ranked = self._rank_masters(rover, exclude=tried)
+        fallback = ranked[0][1] if ranked else (candidates[0] if candidates else None)
+        if fallback is not None:
+            self.assignment[rover.serial_number] = fallback
+            log(f"Rover {rover.serial_number}: ripiego sul Master {fallback.serial_number}")
+            events.emit(events.ASSIGNED, rover.serial_number, master=fallback.serial_number,
+                        distance=round(ranked[0][0], 1) if ranked else None)
+        return fallback
+
     def process_rovers(self) -> None:
         """
         Processa tutti i Rover per acquisire le loro posizioni.
-        
-        TENSION: Sequentiality vs Throughput
-        I rover vengono processati sequenzialmente. Questo semplifica drasticamente il debugging
-        e la gestione delle risorse (porte, CPU), ma aumenta il tempo totale di esecuzione
-        linearmente con il numero di rover (O(N)). In un sistema di produzione con molti rover,
-        questo sarebbe un collo di bottiglia critico.
+
+        TENSION: Parallelism vs Resources
+        Le sessioni RTKRCV girano in parallelo su un pool di K worker (settings.max_sessions,
+        sovrascrivibile dal campo max_sessions del Master), quindi il tempo totale scala come
+        ~N/K invece di N. Ogni sessione ha directory tmp/<serial>/ e prefisso di log dedicati.
+        K va dimensionato su CPU disponibile e numero di client accettati dal Master.
+
+        Con più Master ogni base ha la propria coda con il proprio limite K e le code girano
+        in parallelo. I Rover la cui sessione fallisce perché il Master è caduto vengono
+        riassegnati alla base successiva per distanza ed elaborati in un nuovo giro.
         """
-        if not self.master or not self.master.has_coordinates():
+        if not self.masters or not all(m.has_coordinates() for m in self.masters):
             print("Master non ha coordinate valide", flush=True)
             return
+        if not self.assignment:
+            self.assign_rovers()
 
-        for rover in self.rovers:
-            print(f"\\nProcessing Rover {rover.serial_number}...", flush=True)
-            success = rover.process_with_rtkrcv(self.master, self.rtklib_path)
+        self._start_coordinator()
+        limit = sum(self._session_limit(m) for m in self.masters)
+        if self.session_options.session_pool:
+            self.rtkrcv_pool = RTKRCVPool(self.rtklib_path, self.work_dir, size=limit)
+        results: Dict[str, bool] = {}
+        tried: Dict[str, Set[str]] = {rover.serial_number: set() for rover in self.rovers}
+        pending = list(self.rovers)
+        try:
+            while pending and not self.cancel_event.is_set():
+                round_results = self._run_sessions_per_master(pending)
+                results.update(round_results)
+                pending = [rover for rover in pending
+                           if not round_results.get(rover.serial_number) and not self.cancel_event.is_set()
+                           and self._failover(rover, tried[rover.serial_number]) is not None]
+        finally:
+            if self.rtkrcv_pool:
+                self.rtkrcv_pool.close()
+                self.rtkrcv_pool = None
 
-            if success:
-                print(f"Rover {rover.serial_number} posizionato: {rover.coords}", flush=True)
-            else:
-                print(f"Impossibile posizionare Rover {rover.serial_number}", flush=True)
+        # Le sessioni aggiornano i Rover in-place dai worker thread: ricostruiamo
+        # la lista completa nell'ordine di configurazione prima del salvataggio
+        self.receivers = self._positioned_masters() + self.rovers + self.restored_rovers
+        solved = sum(1 for ok in results.values() if ok)
+        print(f"Sessioni completate: {solved}/{len(self.rovers)} Rover posizionati", flush=True)
+
+    def _run_sessions_per_master(self, rovers: List[Rover]) -> Dict[str, bool]:
+        """Una SessionScheduler per Master (con il suo limite), tutte in parallelo"""
+        groups: Dict[str, List[Rover]] = {}
+        masters: Dict[str, Master] = {}
+        for rover in rovers:
+            master = self.master_for(rover)
+            groups.setdefault(master.serial_number, []).append(rover)
+            masters[master.serial_number] = master
+
+        def run_group(serial: str) -> Dict[str, bool]:
+            master = masters[serial]
+            if len(groups) > 1:
+                log(f"Master {serial}: {len(groups[serial])} Rover")
+            scheduler = SessionScheduler(self._session_limit(master), cancel_event=self.cancel_event)
+            return scheduler.run(groups[serial], lambda rover: self._process_rover(rover, master))
+
+        if len(groups) == 1:
+            return run_group(next(iter(groups)))
+        results: Dict[str, bool] = {}
+        try:
+            with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="rtk-master") as executor:
+                for group_results in executor.map(run_group, groups):
+                    results.update(group_results)
+        except KeyboardInterrupt:
+            log("\nInterrotto dall'utente, arresto sessioni in corso...")
+            self.cancel_event.set()
+            raise
+        return results
+
+    def _positioned_masters(self) -> List[Master]:
+        return [m for m in self.all_masters if m.has_coordinates()]
+
+    def _process_rover(self, rover: Rover, master: Optional[Master] = None) -> bool:
+        """Esegue una singola sessione RTKRCV (chiamato da un worker dello scheduler)"""
+        master = master or self.master_for(rover)
+        log(f"\nProcessing Rover {rover.serial_number}...")
+        success = self._run_session(rover, master)
+
+        if success:
+            log(f"Rover {rover.serial_number} posizionato: {rover.coords}")
+            events.emit(events.SOLUTION, rover.serial_number, status=rover.sol_status, **rover.get_coordinates())
+        else:
+            log(f"Impossibile posizionare Rover {rover.serial_number}")
+            events.emit(events.ERROR, rover.serial_number, message="Nessuna soluzione valida")
+
+        # Persistenza immediata: un crash successivo non fa perdere questa soluzione
+        if self.store:
+            self.store.record_rover(self.run_id, rover.serial_number,
+                                    rover.sol_status if success else 'NONE',
+                                    rover.get_coordinates() if success else None,
+                                    rover.linked_master_id, rover.session_timings)
+            if rover.session_resources:
+                self.store.record_resources(self.run_id, rover.serial_number, rover.session_resources)
+        return success
+
+    def _start_coordinator(self) -> None:
+        """Registra i worker di settings.workers e ne legge la capacità (/health)"""
+        if not self.workers:
+            return
+        self.coordinator = WorkerCoordinator(self.workers, cancel_event=self.cancel_event, token=self.worker_token)
+        capacity = self.coordinator.refresh()
+        alive = sum(1 for w in self.coordinator.workers if w.alive)
+        print(f"Worker remoti: {alive}/{len(self.coordinator.workers)} attivi, capacità {capacity} sessioni",
+              flush=True)
+        if self.auto_sessions and capacity > self.max_sessions:
+            self.max_sessions = capacity
+
+    def _run_session(self, rover: Rover, master: Master) -> bool:
+        """Sessione RTKRCV del Rover (remota o locale); le sue epoche vanno nell'archivio colonnare"""
+        success = self._execute_session(rover, master)
+        self._archive_epochs(rover, master, success)
+        return success
+
+    def _execute_session(self, rover: Rover, master: Master) -> bool:
+        """Sessione RTKRCV del Rover su un worker remoto, se configurati, altrimenti in locale"""
+        if self.coordinator:
+            success = self.coordinator.run_session(rover, master, self.session_options)
+            if success is not None:
+                return success
+            if not self.worker_fallback:
+                log("Nessun worker remoto disponibile")
+                return False
+            log("Nessun worker remoto disponibile, sessione locale")
+        # La sessione locale parte solo quando l'host ha margine di CPU e memoria
+        with self.admission.slot(self.cancel_event) as admitted:
+            if not admitted:
+                return False
+            success = rover.process_with_rtkrcv(master, self.rtklib_path,
+                                                work_dir=self.work_dir, cancel_event=self.cancel_event,
+                                                options=self.session_options, pool=self.rtkrcv_pool)
+        self.admission.observe(rover.session_resources)
+        return success
+
+    def _archive_epochs(self, rover: Rover, master: Master, success: bool) -> None:
+        """Accoda all'archivio tutte le epoche della sessione, anche se non ha portato a una soluzione"""
+        epochs, rover.session_epochs = rover.session_epochs, []
+        if not self.epoch_archive or not epochs:
+            return
+        try:
+            self.epoch_archive.append(rover.serial_number, epochs, run_id=self.run_id,
+                                      master_id=master.serial_number, status=rover.sol_status if success else 'NONE')
+        except (OSError, ValueError) as e:
+            log(f"⚠️  Epoche della sessione non archiviate: {e}")
+
+    def _emit_master_position(self, source: str, master: Optional[Master] = None) -> None:
+        master = master or self.master
+        events.emit(events.MASTER_POSITION, master.serial_number, source=source, **master.get_coordinates())
+
+    def _session_limit(self, master: Master) -> int:
+        """Limite di sessioni concorrenti: il valore del Master ha precedenza su quello globale"""
+        return master.max_sessions or self.max_sessions
 
     def save_results(self) -> None:
         """
-        Salva risultati su file KML.
+        Salva risultati su file KML (più i formati di settings.export_formats) e in
+        output/results.json (letto dalla mappa della dashboard).
         
         TENSION: State vs Persistence
-        Il sistema mantiene lo stato in memoria durante l'esecuzione e persiste i risultati
-        solo alla fine. Questo evita scritture parziali e conflitti, ma comporta il rischio
-        di perdere tutto il lavoro se il processo crasha prima della fine. L'alternativa
-        sarebbe un database o un file di stato incrementale.
+        Le singole soluzioni sono già persistite nel ResultStore (SQLite) nel momento in cui
+        vengono trovate; il KML è solo l'esportazione finale del run. Un crash prima della
+        fine non perde le soluzioni ottenute: il run successivo lo riprende dall'archivio.
         """
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_dir = Path("output")
-        output_dir.mkdir(exist_ok=True)
+        output_dir = self.output_dir
+        output_dir.mkdir(parents=True, exist_ok=True)
         
-        output_filename = f"output_{timestamp}.kml"
-        output_path = output_dir / output_filename
-
-        KMLWriter.write(self.receivers, output_path)
+        # Il KML resta sempre (download e mappa della dashboard); gli altri formati da settings.export_formats
+        formats = ['kml'] + [fmt for fmt in self.export_formats if fmt != 'kml']
+        paths = KMLWriter.write_all(self.receivers, output_dir / f"output_{timestamp}", formats)
+        KMLWriter.write_json(self.receivers, output_dir / RESULTS_JSON, kml_file=paths['kml'].name)
 
     def run(self) -> None:
-        """Esegue il workflow completo"""
+        """Esegue il workflow completo e produce il report dei tempi (self.run_report)"""
+        run_start = time.monotonic()
+        events.emit(events.RUN_STARTED)
+        try:
+            self._run_workflow()
+        finally:
+            self._close_result_store()
+            self.run_report = self._build_run_report(time.monotonic() - run_start)
+            self._print_run_report()
+            events.emit(events.RUN_FINISHED, wall_time=round(self.run_report['wall_time'], 3),
+                        completed=self._run_status == 'completed', status=self._run_status)
+
+    def _run_workflow(self) -> None:
         print("=== RTK Manager ===\n", flush=True)
 
         # Carica configurazione
         self.load_receivers()
+
+        # Apre (o riprende) il run nell'archivio e scarta i Rover già risolti
+        self._open_result_store()
         
         # Verifica connettività
-        self._verify_all_receivers()
+        with phase('verification'):
+            self._verify_all_receivers()
         
         # Filtra ricevitori attivi (già fatto in _verify_all_receivers, ma qui ricreiamo la lista completa)
         # Nota: _verify_all_receivers modifica self.rovers in-place rimuovendo quelli inattivi
-        self.receivers = [self.master] + self.rovers if self.master else self.rovers
+        self.receivers = self.masters + self.rovers
         
+        if self.cancel_event.is_set():
+            print("Run annullato", flush=True)
+            return
+
         if not self.rovers:
-            print("Nessun Rover attivo disponibile. Esco.", flush=True)
+            if self.restored_rovers:
+                print("Tutti i Rover hanno già una soluzione in archivio.", flush=True)
+                self.receivers = self._positioned_masters() + self.restored_rovers
+                self.save_results()
+                self._run_status = 'completed'
+            else:
+                print("Nessun Rover attivo disponibile. Esco.", flush=True)
+                self._run_status = 'failed'
             return
 
         print(f"Caricati {len(self.receivers)} ricevitori attivi", flush=True)
 
-        # Acquisisce posizione Master
-        if not self.master.has_coordinates():
-            if not self.acquire_master_position():
-                print("Impossibile proseguire senza posizione Master", flush=True)
+        # Una sola connessione verso ogni Master, condivisa da lettura NMEA e sessioni RTKRCV
+        if self.master_relay:
+            self._start_master_relay()
+
+        try:
+            # Acquisisce posizione dei Master
+            if not self.position_masters():
+                if not self.cancel_event.is_set():
+                    print("Impossibile proseguire senza posizione Master", flush=True)
+                    self._run_status = 'failed'
+                return
+            for master in self._positioned_masters():
+                self.store.record_master(self.run_id, master.serial_number, master.coords.lat,
+                                         master.coords.lon, master.coords.alt)
+            self._requeue_stale_restored()
+            if self.cancel_event.is_set():
+                print("Run annullato", flush=True)
                 return
-        else:
-            print(f"Master già posizionato: {self.master.coords}", flush=True)
 
-        # Processa Rover
-        self.process_rovers()
+            # Ogni Rover alla base più vicina, poi sessioni in parallelo per Master
+            self.assign_rovers()
+            self.process_rovers()
+        finally:
+            self._stop_master_relay()
 
         self.save_results()
+        if not self.cancel_event.is_set():
+            self._run_status = 'completed'
 
         print("\n=== Processo completato ===", flush=True)
         for rcv in self.receivers:
             print(rcv, flush=True)
 
+    def _open_result_store(self) -> None:
+        """
+        Apre l'archivio dei risultati. Se l'ultimo run di questa configurazione non è stato
+        completato (crash o interruzione) viene ripreso: i Rover già risolti non vengono
+        rielaborati e i Master senza coordinate nel YAML riprendono quelle del run interrotto
+        (tutte le basi), così le soluzioni restano coerenti. In modalità delta vengono saltati
+        anche i Rover con un FIX recente rispetto allo stesso Master, registrati anche nel run
+        corrente. Una soluzione viene riusata solo se il suo Master è ancora entro
+        master_drift_threshold metri dalla posizione su cui è stata calcolata.
+        """
+        self.store = ResultStore(self.result_store_path)
+        config = str(Path(self.yaml_path).resolve())
+        restored = {}
+        self._restored_bases = {}
+
+        previous = self.store.resumable_run(config) if self.resume else None
+        if previous is not None:
+            self.run_id = previous['id']
+            self.store.reopen_run(self.run_id)
+            restored = self.store.run_results(self.run_id)
+            print(f"Ripresa del run interrotto #{self.run_id}: {len(restored)} Rover già risolti", flush=True)
+            # Tutte le basi del run interrotto: le soluzioni riprese sono state calcolate su queste coordinate
+            positions = self.store.run_masters(self.run_id)
+            for master in self.all_masters:
+                coords = positions.get(master.serial_number)
+                if not master.has_coordinates() and coords is not None:
+                    master.set_coordinates(coords['lat'], coords['lon'], coords['alt'])
+            self._restored_bases = {serial: positions.get(row['master_id']) for serial, row in restored.items()}
+        else:
+            self.run_id = self.store.begin_run(config)
+        resumed = set(restored)
+
+        skipped = []
+        if self.delta and self.all_masters:
+            # FIX recenti rispetto a uno qualunque dei Master configurati
+            fresh = {}
+            for master in self.all_masters:
+                fresh.update(self.store.fresh_fixes(master.serial_number, self.delta_max_age))
+            skipped = [rover.serial_number for rover in self.rovers
+                       if rover.serial_number in fresh and rover.serial_number not in restored]
+            for serial in skipped:
+                row = fresh[serial]
+                restored[serial] = row
+                self._restored_bases[serial] = self.store.run_masters(row['run_id']).get(row['master_id'])
+
+        # Posizione attuale attesa dei Master: YAML (o run ripreso), altrimenti l'ultima acquisita
+        expected = {}
+        for master in self.all_masters:
+            if master.has_coordinates():
+                expected[master.serial_number] = master.coords
+            else:
+                cached = self.store.cached_master_position(master.serial_number, self._master_address(master),
+                                                           float('inf'))
+                if cached is not None:
+                    expected[master.serial_number] = Coordinates(cached['lat'], cached['lon'], cached['alt'])
+        stale = {serial for serial, row in restored.items()
+                 if not self._same_base(serial, expected.get(row['master_id']))}
+        if stale:
+            print(f"{len(stale)} soluzioni in archivio calcolate su una posizione Master diversa: "
+                  f"i Rover vengono rielaborati", flush=True)
+            for serial in stale & resumed:
+                self.store.discard_rover(self.run_id, serial)
+        restored = {serial: row for serial, row in restored.items() if serial not in stale}
+        skipped = [serial for serial in skipped if serial not in stale]
+        if self.delta and self.all_masters:
+            print(f"Modalità delta: {len(skipped)} Rover con FIX recente (< {self.delta_max_age:g}s) non rielaborati",
+                  flush=True)
+        for serial in skipped:
+            # Anche nel run corrente (con la loro base), così una sua ripresa non li rielabora
+            row = restored[serial]
+            base = self._restored_bases[serial]
+            self.store.record_master(self.run_id, row['master_id'], base['lat'], base['lon'], base['alt'])
+            self.store.record_rover(self.run_id, serial, row['status'],
+                                    {'lat': row['lat'], 'lon': row['lon'], 'alt': row['alt']}, row['master_id'],
+                                    {'first_float': row['time_to_first_float'], 'first_fix': row['time_to_fix'],
+                                     'solution': row['time_to_solution']}, solved_at=row['solved_at'])
+
+        pending = []
+        for rover in self.rovers:
+            row = restored.get(rover.serial_number)
+            if row is None:
+                pending.append(rover)
+                continue
+            rover.set_coordinates(row['lat'], row['lon'], row['alt'], status=row['status'], master_id=row['master_id'])
+            self.restored_rovers.append(rover)
+            print(f"Rover {rover.serial_number}: soluzione {row['status']} dall'archivio", flush=True)
+            events.emit(events.SOLUTION, rover.serial_number, status=row['status'], source='archive',
+                        **rover.get_coordinates())
+        self.rovers = pending
+
+    def _same_base(self, rover_serial: str, current: Optional[Coordinates]) -> bool:
+        """True se la base della soluzione ripresa è entro master_drift_threshold metri da current"""
+        base = self._restored_bases.get(rover_serial)
+        if base is None or current is None:
+            return False
+        return Coordinates(base['lat'], base['lon'], base['alt']).distance_to(current) <= self.master_drift_threshold
+
+    def _requeue_stale_restored(self) -> None:
+        """
+        Dopo il posizionamento dei Master: le soluzioni riprese il cui Master è stato
+        riacquisito in una posizione diversa (oltre master_drift_threshold) tornano da elaborare.
+        """
+        masters = {m.serial_number: m for m in self._positioned_masters()}
+        kept = []
+        for rover in self.restored_rovers:
+            master = masters.get(rover.linked_master_id)
+            if master is None or self._same_base(rover.serial_number, master.coords):
+                kept.append(rover)
+                continue
+            print(f"Rover {rover.serial_number}: Master {master.serial_number} riposizionato, "
+                  f"la soluzione in archivio viene ricalcolata", flush=True)
+            self.store.discard_rover(self.run_id, rover.serial_number)
+            rover.coords = None
+            rover.sol_status = None
+            rover.linked_master_id = None
+            self.rovers.append(rover)
+        self.restored_rovers = kept
+
+    def _close_result_store(self) -> None:
+        """Chiude il run: se annullato o interrotto da un errore resta riprendibile ('interrupted')"""
+        if not self.store:
+            return
+        self.store.finish_run(self.run_id, self._run_status)
+        self.store.close()
+        self.store = None
+
+    def _build_run_report(self, wall_time: float) -> dict:
+        """Riepilogo del run: wall time totale e tempi di sessione per ogni Rover"""
+        rovers = {}
+        for rover in self.rovers:
+            timings = rover.session_timings
+            rovers[rover.serial_number] = {
+                'status': rover.sol_status if rover.has_coordinates() else 'NONE',
+                'time_to_first_float': timings.get('first_float'),
+                'time_to_fix': timings.get('first_fix'),
+                'time_to_solution': timings.get('solution'),
+                'cpu_seconds': rover.session_resources.get('cpu_seconds'),
+                'peak_rss_mb': rover.session_resources.get('peak_rss_mb'),
+            }
+        for rover in self.restored_rovers:
+            rovers[rover.serial_number] = {
+                'status': rover.sol_status,
+                'restored': True,
+                'time_to_first_float': None,
+                'time_to_fix': None,
+                'time_to_solution': None,
+            }
+        return {'wall_time': wall_time, 'rovers': rovers}
+
+    def _print_run_report(self) -> None:
+        print(f"\n=== Tempi ===", flush=True)
+        for serial, info in self.run_report['rovers'].items():
+            ttf = info['time_to_fix']
+            tts = info['time_to_solution']
+            if info.get('restored'):
+                print(f"Rover {serial}: {info['status']} (dall'archivio)", flush=True)
+                continue
+            usage = ""
+            if info.get('cpu_seconds') is not None:
+                usage = f", CPU {info['cpu_seconds']:.1f}s, RSS {info['peak_rss_mb']:.0f} MB"
+            print(f"Rover {serial}: {info['status']}, "
+                  f"time-to-fix {f'{ttf:.1f}s' if ttf is not None else 'N/A'}, "
+                  f"soluzione {f'{tts:.1f}s' if tts is not None else 'N/A'}{usage}", flush=True)
+        print(f"Tempo totale: {self.run_report['wall_time']:.1f}s", flush=True)
+
+    def _start_master_relay(self) -> None:
+        """Avvia il relay fan-out dello stream di ogni Master in uso; in caso di errore si usa la connessione diretta"""
+        from utils.stream_relay import StreamRelay
+        for master in self.masters:
+            try:
+                master.relay = StreamRelay(master.ip_address, master.port).start()
+            except OSError as e:
+                print(f"⚠️  Relay Master {master.serial_number} non avviato ({e}), connessione diretta al Master",
+                      flush=True)
+                master.relay = None
+
+    def _stop_master_relay(self) -> None:
+        for master in self.all_masters:
+            if not master.relay:
+                continue
+            relay = master.relay
+            master.relay = None
+            relay.stop()
+            if relay.dropped_clients:
+                print(f"Relay Master {master.serial_number}: {relay.dropped_clients} client lenti disconnessi",
+                      flush=True)
+
     def _verify_all_receivers(self):
-        """Verifica connettività di tutti i ricevitori prima di iniziare"""
+        """
+        Verifica connettività di tutti i ricevitori prima di iniziare.
+        Master e Rover vengono verificati in parallelo con una deadline globale;
+        i ricevitori trovati attivi di recente vengono presi dalla cache dei probe.
+        """
         print("Verifica connettività ricevitori...", flush=True)
-        from utils.stream_verifier import StreamVerifier
-        
-        # Verify Master
-        if self.master:
-             print(f"Verifica Master {self.master.serial_number}...", end=' ', flush=True)
-             proto = StreamVerifier.detect_protocol(self.master.ip_address, self.master.port)
-             print(f"[{proto}]", flush=True)
-             
-             if proto in ['ERROR', 'TIMEOUT']:
-                 print(f"⚠️  Master {self.master.serial_number} non raggiungibile ({proto}).", flush=True)
-                 if not self.master.has_coordinates():
-                     # Se master offline e senza coords, non possiamo procedere
-                     # (In realtà potremmo se vogliamo solo processare rovers, ma servono i dati master!)
-                     # TENSION: Robustness vs Flexibility
-                     # Blocchiamo tutto se il master è critico.
-                     return
-                 else:
-                     print("⚠️  Uso coordinate Master memorizzate.", flush=True)
-             elif proto == 'SSH':
-                    print(f"❌ Master su porta SSH (22)? Configurazione errata.", flush=True)
-                    return
+        from utils.stream_verifier import StreamVerifier, ProbeCache
+
+        receivers = self.all_masters + self.rovers
+        cache = ProbeCache(self.probe_cache_path, ttl=self.probe_cache_ttl)
+        results = StreamVerifier.probe_many(
+            [(rcv.ip_address, rcv.port) for rcv in receivers],
+            deadline=self.probe_deadline,
+            cache=cache
+        )
+
+        def proto_of(rcv: Ricevitore) -> str:
+            return results.get(ProbeCache.key(rcv.ip_address, rcv.port), 'ERROR')
+
+        # Verify Masters: con più basi quelle non raggiungibili restano escluse e i Rover
+        # vanno alle altre; se nessuna risponde si usano le coordinate memorizzate
+        reachable = []
+        for master in self.all_masters:
+            proto = proto_of(master)
+            events.emit(events.PROBE, master.serial_number, role='master', protocol=proto)
+            print(f"Verifica Master {master.serial_number}... [{proto}]", flush=True)
+
+            if proto in ['ERROR', 'TIMEOUT']:
+                print(f"⚠️  Master {master.serial_number} non raggiungibile ({proto}).", flush=True)
+            elif proto == 'SSH':
+                print(f"❌ Master {master.serial_number} su porta SSH (22)? Configurazione errata.", flush=True)
+            else:
+                reachable.append(master)
+
+        if self.all_masters and not reachable:
+            # TENSION: Robustness vs Flexibility
+            # Senza dati di un Master non si può procedere, salvo coordinate già note
+            self.masters = [m for m in self.all_masters if m.has_coordinates() and proto_of(m) != 'SSH']
+            if not self.masters:
+                return
+            print("⚠️  Uso coordinate Master memorizzate.", flush=True)
+        else:
+            self.masters = reachable
+        if self.masters:
+            self.master = self.masters[0]
         
         # Verify Rovers
         active_rovers = []
         for rover in self.rovers:
-            print(f"Verifica Rover {rover.serial_number}...", end=' ', flush=True)
-            proto = StreamVerifier.detect_protocol(rover.ip_address, rover.port)
-            print(f"[{proto}]", flush=True)
+            proto = proto_of(rover)
+            events.emit(events.PROBE, rover.serial_number, role='rover', protocol=proto)
+            print(f"Verifica Rover {rover.serial_number}... [{proto}]", flush=True)
             
             if proto in ['ERROR', 'TIMEOUT']:
                  print(f"⚠️  Rover {rover.serial_number} non raggiungibile ({proto}). Skippo.", flush=True)
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+from models.rover import Rover
+from utils.session_log import log, log_prefix
+from utils.cancel_event import CancelEvent
+
+DEFAULT_MAX_SESSIONS = 4
+
+
+class SessionScheduler:
+    """
+    Esegue le sessioni RTKRCV dei Rover su un pool limitato di worker thread.
+
+    Ogni sessione gira nel proprio thread con un prefisso di log dedicato; il lavoro
+    pesante è svolto dal processo rtkrcv, quindi i thread passano la maggior parte
+    del tempo in attesa e il GIL non è un collo di bottiglia.
+    Con K worker il tempo totale scala come ~N/K invece di N.
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 cancel_event: Optional[threading.Event] = None):
+        self.max_sessions = max(1, int(max_sessions))
+        self.cancel_event = cancel_event or CancelEvent()
+
+    def run(self, rovers: List[Rover], session_fn: Callable[[Rover], bool]) -> Dict[str, bool]:
+        """
+        Esegue session_fn per ogni rover con al massimo max_sessions sessioni concorrenti.
+        Restituisce {serial: success}. Un'eccezione in una sessione non interrompe le altre.
+        """
+        results: Dict[str, bool] = {}
+        if not rovers:
+            return results
+
+        workers = min(self.max_sessions, len(rovers))
+        log(f"Avvio {len(rovers)} sessioni RTK (max {workers} in parallelo)")
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rtk-session")
+        try:
+            futures = {executor.submit(self._run_session, rover, session_fn): rover for rover in rovers}
+            for future in as_completed(futures):
+                rover = futures[future]
+                try:
+                    results[rover.serial_number] = future.result()
+                except Exception as e:
+                    log(f"Errore sessione Rover {rover.serial_number}: {e}")
+                    results[rover.serial_number] = False
+        except KeyboardInterrupt:
+            log("\nInterrotto dall'utente, arresto sessioni in corso...")
+            self.cancel_event.set()
+            raise
+        finally:
+            # Le sessioni non ancora avviate vengono scartate; quelle attive
+            # terminano al prossimo controllo di cancel_event
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return results
+
+    def _run_session(self, rover: Rover, session_fn: Callable[[Rover], bool]) -> bool:
+        if self.cancel_event.is_set():
+            return False
+        with log_prefix(f"[{rover.serial_number}] "):
+            return session_fn(rover)
@@ -0,0 +1,273 @@
+import http.client
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+from models.master import Master
+from models.rover import Rover
+from models.session_options import SessionOptions
+from utils.convergence import ConvergenceCriteria
+from utils.session_log import log
+from utils import events
+
+DEFAULT_WORKER_PORT = 8470
+# Token condiviso tra coordinatore e worker (settings.worker_token / --token), in alternativa da ambiente
+WORKER_TOKEN_ENV = 'RTK_WORKER_TOKEN'
+
+
+def valid_serial(serial: object) -> bool:
+    """Il seriale finisce nei nomi dei file di sessione: niente separatori di percorso né '.'/'..'"""
+    return isinstance(serial, str) and bool(serial) and serial not in ('.', '..') \
+        and not any(sep in serial for sep in ('/', '\\', '\0'))
+
+
+def job_payload(rover: Rover, master: Master, options: SessionOptions) -> Dict:
+    """
+    Job di una sessione per un worker agent: Rover, Master (indirizzo reale, non il relay
+    locale, e coordinate), opzioni di sessione e criteri di convergenza.
+    """
+    return {
+        'rover': {'serial': rover.serial_number, 'ip': rover.ip_address, 'port': rover.port,
+                  'timeout': rover.timeout,
+                  'convergence': asdict(rover.convergence) if rover.convergence else None},
+        'master': {'serial': master.serial_number, 'ip': master.ip_address, 'port': master.port,
+                   **master.get_coordinates()},
+        'options': asdict(options),
+    }
+
+
+def job_session(payload: Dict) -> Tuple[Rover, Master, SessionOptions]:
+    """Ricostruisce dal job (vedi job_payload) gli oggetti di una sessione lato worker"""
+    spec = payload['rover']
+    rover = Rover(spec['serial'], spec['ip'], int(spec['port']), int(spec['timeout']))
+    if spec.get('convergence'):
+        rover.convergence = ConvergenceCriteria.from_config(spec['convergence'])
+
+    spec = payload['master']
+    master = Master(spec['serial'], spec['ip'], int(spec['port']))
+    master.set_coordinates(spec['lat'], spec['lon'], spec['alt'])
+
+    names = {f.name for f in fields(SessionOptions)}
+    options = SessionOptions(**{k: v for k, v in (payload.get('options') or {}).items() if k in names})
+    return rover, master, options
+
+
+class WorkerBusy(Exception):
+    """Il worker ha rifiutato il job: nessuno slot libero (o Rover già in elaborazione)"""
+
+
+@dataclass
+class Worker:
+    """Worker agent registrato presso il coordinatore"""
+    host: str
+    port: int
+    name: str = ''
+    capacity: int = 1
+    active: int = 0
+    alive: bool = True
+    # Con alive=False, istante (monotonic) dal quale il worker viene riprovato
+    retry_at: float = 0.0
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+class WorkerCoordinator:
+    """
+    Distribuisce le sessioni RTKRCV sui worker agent (worker_agent.py) di altri host.
+
+    run_session() è bloccante e viene chiamata dai thread dello scheduler al posto di
+    Rover.process_with_rtkrcv: il job va al worker con il minor carico relativo
+    (active/capacity) e il log e gli eventi della sessione arrivano in streaming, così
+    dashboard e archivio non vedono differenze rispetto a una sessione locale.
+    Un worker che non risponde o interrompe lo stream (nemmeno gli heartbeat entro
+    STREAM_TIMEOUT) viene escluso per RETRY_INTERVAL secondi e il job torna in coda per
+    un altro worker, fino a MAX_ATTEMPTS tentativi.
+    """
+
+    CONNECT_TIMEOUT = 5.0
+    STREAM_TIMEOUT = 15.0
+    RETRY_INTERVAL = 30.0
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, addresses: Iterable[str] = (), cancel_event: Optional[threading.Event] = None,
+                 token: Optional[str] = None):
+        self.cancel_event = cancel_event or threading.Event()
+        self.token = token or os.environ.get(WORKER_TOKEN_ENV)
+        self.workers: List[Worker] = []
+        self._cond = threading.Condition()
+        for address in addresses:
+            self.register(address)
+
+    @staticmethod
+    def parse_address(address: str) -> Tuple[str, int]:
+        """'host:porta' o 'http://host:porta' (porta di default DEFAULT_WORKER_PORT)"""
+        parts = urlsplit(address if '//' in address else f"http://{address}")
+        if not parts.hostname:
+            raise ValueError(f"Indirizzo worker non valido: {address!r}")
+        return parts.hostname, parts.port or DEFAULT_WORKER_PORT
+
+    def register(self, address: str) -> Worker:
+        host, port = self.parse_address(address)
+        with self._cond:
+            for worker in self.workers:
+                if (worker.host, worker.port) == (host, port):
+                    return worker
+            worker = Worker(host, port, name=f"{host}:{port}")
+            self.workers.append(worker)
+            self._cond.notify_all()
+            return worker
+
+    def refresh(self) -> int:
+        """Interroga /health di ogni worker (nome e capacità); restituisce la capacità disponibile"""
+        for worker in list(self.workers):
+            try:
+                health = self._request(worker, 'GET', '/health')
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                self._mark_dead(worker, e)
+                continue
+            with self._cond:
+                worker.name = health.get('worker') or worker.name
+                worker.capacity = max(1, int(health.get('capacity', worker.capacity)))
+                worker.alive = True
+                self._cond.notify_all()
+        return self.capacity()
+
+    def capacity(self) -> int:
+        with self._cond:
+            return sum(w.capacity for w in self.workers if w.alive)
+
+    def run_session(self, rover: Rover, master: Master, options: SessionOptions) -> Optional[bool]:
+        """
+        Esegue la sessione del Rover su un worker e ne applica la soluzione.
+        Restituisce l'esito, oppure None se nessun worker è disponibile (il chiamante può
+        ripiegare su una sessione locale).
+        """
+        payload = job_payload(rover, master, options)
+        # Worker che hanno rifiutato il job (409/503): al tentativo successivo si preferiscono gli altri
+        refused: Set[str] = set()
+        for attempt in range(self.MAX_ATTEMPTS):
+            worker = self._acquire(refused)
+            if worker is None:
+                return None if not self.cancel_event.is_set() else False
+            try:
+                return self._execute(worker, rover, master, payload)
+            except WorkerBusy:
+                log(f"Worker {worker.name} occupato, job rimesso in coda")
+                refused.add(worker.address)
+                time.sleep(0.5)
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                self._mark_dead(worker, e)
+                log(f"⚠️  Worker {worker.name} non risponde ({e}): job rimesso in coda")
+            finally:
+                self._release(worker)
+        return None
+
+    def _acquire(self, avoid: Set[str] = frozenset()) -> Optional[Worker]:
+        """
+        Occupa uno slot sul worker meno carico, preferendo quelli non in avoid (indirizzi);
+        attende se sono tutti pieni, None se non ce n'è nessuno attivo.
+        """
+        with self._cond:
+            while not self.cancel_event.is_set():
+                now = time.monotonic()
+                for worker in self.workers:
+                    if not worker.alive and worker.retry_at <= now:
+                        worker.alive = True
+                alive = [w for w in self.workers if w.alive]
+                if not alive:
+                    return None
+                free = [w for w in alive if w.active < w.capacity]
+                if free:
+                    worker = min(free, key=lambda w: (w.address in avoid, w.active / w.capacity))
+                    worker.active += 1
+                    return worker
+                self._cond.wait(1.0)
+        return None
+
+    def _release(self, worker: Worker) -> None:
+        with self._cond:
+            worker.active -= 1
+            self._cond.notify_all()
+
+    def _mark_dead(self, worker: Worker, error: Exception) -> None:
+        with self._cond:
+            if worker.alive:
+                log(f"Worker {worker.name} escluso per {self.RETRY_INTERVAL:g}s: {error}")
+            worker.alive = False
+            worker.retry_at = time.monotonic() + self.RETRY_INTERVAL
+            self._cond.notify_all()
+
+    def _request(self, worker: Worker, method: str, path: str) -> Dict:
+        conn = http.client.HTTPConnection(worker.host, worker.port, timeout=self.CONNECT_TIMEOUT)
+        try:
+            conn.request(method, path, headers=self._auth_headers())
+            response = conn.getresponse()
+            if response.status != 200:
+                raise http.client.HTTPException(f"HTTP {response.status}")
+            return json.loads(response.read())
+        finally:
+            conn.close()
+
+    def _auth_headers(self) -> Dict[str, str]:
+        return {'Authorization': f"Bearer {self.token}"} if self.token else {}
+
+    def _execute(self, worker: Worker, rover: Rover, master: Master, payload: Dict) -> bool:
+        """Invia il job e consuma lo stream NDJSON fino al risultato; chiudere la connessione annulla la sessione"""
+        conn = http.client.HTTPConnection(worker.host, worker.port, timeout=self.CONNECT_TIMEOUT)
+        try:
+            conn.request('POST', '/jobs', body=json.dumps(payload),
+                         headers={'Content-Type': 'application/json', **self._auth_headers()})
+            conn.sock.settimeout(self.STREAM_TIMEOUT)
+            response = conn.getresponse()
+            if response.status in (409, 503):
+                raise WorkerBusy(response.read().decode(errors='replace'))
+            if response.status != 200:
+                raise http.client.HTTPException(f"HTTP {response.status}")
+            log(f"Sessione sul worker {worker.name}")
+
+            while True:
+                line = response.readline()
+                if not line:
+                    raise ConnectionError("stream interrotto senza risultato")
+                if self.cancel_event.is_set():
+                    log("\nSessione annullata")
+                    return False
+                message = json.loads(line)
+                kind = message.get('type')
+                if kind == 'log':
+                    log(message['message'])
+                elif kind == 'event':
+                    self._forward_event(message['event'], worker)
+                elif kind == 'result':
+                    return self._apply_result(message, rover, master)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _forward_event(event: Dict, worker: Worker) -> None:
+        event = dict(event)
+        kind = event.pop('type')
+        serial = event.pop('serial', None)
+        event.pop('ts', None)
+        if kind == events.SESSION_STARTED:
+            event['worker'] = worker.name
+        events.emit(kind, serial, **event)
+
+    @staticmethod
+    def _apply_result(result: Dict, rover: Rover, master: Master) -> bool:
+        rover.session_timings = dict(result.get('timings') or {})
+        rover.session_resources = dict(result.get('resources') or {})
+        rover.session_epochs = list(result.get('epochs') or [])
+        if result.get('error'):
+            log(f"Errore sessione sul worker: {result['error']}")
+        coords = result.get('coords')
+        if not result.get('success') or not coords:
+            return False
+        rover.set_coordinates(coords['lat'], coords['lon'], coords['alt'],
+                              status=result.get('status'), master_id=master.serial_number)
+        return True
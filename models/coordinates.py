@@ -1,5 +1,8 @@
+import math
 from dataclasses import dataclass
 
+EARTH_RADIUS = 6371008.8  # raggio medio terrestre (m)
+
 @dataclass
 class Coordinates:
     lat: float
@@ -11,3 +14,10 @@ class Coordinates:
     
     def to_dict(self) -> dict:
         return {'lat': self.lat, 'lon': self.lon, 'alt': self.alt}
+
+    def distance_to(self, other: 'Coordinates') -> float:
+        """Distanza orizzontale in metri (approssimazione equirettangolare, valida su brevi distanze)"""
+        lat1, lat2 = math.radians(self.lat), math.radians(other.lat)
+        x = math.radians(other.lon - self.lon) * math.cos((lat1 + lat2) / 2)
+        y = lat2 - lat1
+        return math.hypot(x, y) * EARTH_RADIUS
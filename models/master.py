@@ -1,68 +1,43 @@
-import socket
-from typing import Optional, Dict
+import threading
+from typing import Optional, Dict, List, Tuple
+from .coordinates import Coordinates
 from .receiver import Ricevitore
 from utils.nmea_parser import parse_gga
+from utils import events
+from utils.metrics import phase
 
 class Master(Ricevitore):
     """Master che riceve coordinate da stream NMEA"""
     def __init__(self, serial_number: str, ip_address: str, port: int):
         super().__init__(serial_number, ip_address, port, 'master')
+        # Limite sessioni RTKRCV concorrenti verso questo Master (None = usa settings.max_sessions)
+        self.max_sessions: Optional[int] = None
+        # Relay fan-out locale (utils.stream_relay.StreamRelay), se attivo
+        self.relay = None
 
-    def read_nmea_position(self, timeout: int = 30) -> bool:
+    def stream_address(self) -> Tuple[str, int]:
+        """Indirizzo da cui leggere lo stream del Master: il relay locale se attivo, altrimenti il ricevitore"""
+        if self.relay is not None:
+            return self.relay.address
+        return self.ip_address, self.port
+
+    def read_nmea_position(self, timeout: int = 30, target: int = 10,
+                           cancel_event: Optional[threading.Event] = None) -> bool:
         """
         Legge la posizione NMEA dal socket.
-        Raccoglie 10 campioni validi e calcola la mediana per maggiore precisione.
+        Raccoglie target campioni validi (default 10) e calcola la mediana per maggiore precisione.
+        La durata va nella fase master_acquisition delle metriche.
         """
-        import socket
-        import time
-        import statistics
-        from utils.nmea_parser import parse_gga
+        with phase('master_acquisition', self.serial_number) as outcome:
+            outcome['ok'] = self._median_position(timeout, target, cancel_event)
+            return outcome['ok']
 
-        start_time = time.time()
-        samples = []
-        
-        print(f"Acquisizione posizione Master (target: 10 campioni)...", flush=True)
-        
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(10) # Socket timeout
-                try:
-                    s.connect((self.ip_address, self.port))
-                except ConnectionRefusedError:
-                    print(f"Errore lettura NMEA da Master: Connection refused", flush=True)
-                    return False
-                except Exception as e:
-                    print(f"Errore connessione Master: {e}", flush=True)
-                    return False
+    def _median_position(self, timeout: int, target: int, cancel_event: Optional[threading.Event]) -> bool:
+        import statistics
 
-                buffer = ""
-                while time.time() - start_time < timeout and len(samples) < 10:
-                    try:
-                        chunk = s.recv(1024).decode('ascii', errors='ignore')
-                        if not chunk:
-                            if not samples:
-                                break
-                            # Keep trying if we have partial samples? No, stream closed.
-                            break
-                            
-                        buffer += chunk
-                        while '\n' in buffer:
-                            line, buffer = buffer.split('\n', 1)
-                            line = line.strip()
-                            
-                            if line.startswith('$') and 'GGA' in line:
-                                coords = parse_gga(line)
-                                if coords:
-                                    samples.append(coords)
-                                    print(f"[MASTER_STATUS] Campione {len(samples)}/10: {coords['lat']:.6f}, {coords['lon']:.6f}, {coords['alt']:.2f}", flush=True)
-                                    
-                    except socket.timeout:
-                        break
-                    except Exception:
-                        break
-        
-        except Exception as e:
-            print(f"Errore inatteso Master: {e}", flush=True)
+        print(f"Acquisizione posizione Master (target: {target} campioni)...", flush=True)
+        samples = self.collect_nmea_samples(target, timeout, cancel_event=cancel_event)
+        if samples is None:
             return False
 
         if not samples:
@@ -83,3 +58,34 @@ class Master(Ricevitore):
         self.set_coordinates(med_lat, med_lon, med_alt)
         return True
 
+    def check_drift(self, reference: Coordinates, samples: int = 2, timeout: int = 10,
+                    cancel_event: Optional[threading.Event] = None) -> Optional[float]:
+        """
+        Confronta pochi campioni GGA con una posizione di riferimento (es. dalla cache).
+        Restituisce la distanza orizzontale in metri della mediana dei campioni dal riferimento,
+        None se non è stato possibile leggere campioni (o se cancel_event interrompe la lettura).
+        """
+        import statistics
+
+        collected = self.collect_nmea_samples(samples, timeout, verbose=False, cancel_event=cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        if not collected:
+            return None
+        current = Coordinates(statistics.median(s['lat'] for s in collected),
+                              statistics.median(s['lon'] for s in collected),
+                              statistics.median(s['alt'] for s in collected))
+        return reference.distance_to(current)
+
+    def collect_nmea_samples(self, target: int, timeout: float, verbose: bool = True,
+                             cancel_event: Optional[threading.Event] = None) -> Optional[List[Dict[str, float]]]:
+        """
+        Raccoglie fino a target posizioni GGA valide (quality > 0) dallo stream del Master
+        entro timeout secondi (o fino a cancel_event). Restituisce None se la connessione fallisce.
+        """
+        def report(n: int, coords: Dict[str, float]) -> None:
+            print(f"[MASTER_STATUS] Campione {n}/{target}: {coords['lat']:.6f}, {coords['lon']:.6f}, {coords['alt']:.2f}", flush=True)
+            events.emit(events.MASTER_SAMPLE, self.serial_number, n=n, target=target, **coords)
+
+        return self.read_gga_samples(target, timeout, cancel_event=cancel_event,
+                                     on_sample=report if verbose else None)
@@ -1,4 +1,7 @@
-from typing import Optional, Dict
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
 from .coordinates import Coordinates
 
 class Ricevitore:
@@ -26,6 +29,81 @@ class Ricevitore:
             return None
         return self.coords.to_dict()
 
+    def stream_address(self) -> Tuple[str, int]:
+        """Indirizzo da cui leggere lo stream del ricevitore"""
+        return self.ip_address, self.port
+
+    def read_gga_samples(self, target: int, timeout: float, cancel_event: Optional[threading.Event] = None,
+                         on_sample: Optional[Callable[[int, Dict[str, float]], None]] = None
+                         ) -> Optional[List[Dict[str, float]]]:
+        """
+        Raccoglie fino a target posizioni GGA valide (quality > 0) dallo stream del ricevitore
+        entro timeout secondi (o fino a cancel_event); on_sample(n, coords) viene chiamata a
+        ogni campione. Restituisce None se la connessione fallisce.
+        """
+        from utils.nmea_parser import NMEAStreamParser
+
+        label = self.role.capitalize()
+        start_time = time.time()
+        samples: List[Dict[str, float]] = []
+        parser = NMEAStreamParser()
+
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                # Silenzio massimo dello stream, usato anche come timeout di connessione
+                silence_timeout = min(10, timeout)
+                s.settimeout(silence_timeout)
+                try:
+                    s.connect(self.stream_address())
+                except ConnectionRefusedError:
+                    print(f"Errore lettura NMEA da {label}: Connection refused", flush=True)
+                    return None
+                except Exception as e:
+                    print(f"Errore connessione {label}: {e}", flush=True)
+                    return None
+
+                # Con cancel_event la recv attende a intervalli brevi così l'annullamento
+                # non aspetta il silenzio massimo dello stream
+                if cancel_event is not None:
+                    s.settimeout(0.5)
+                last_data = time.time()
+                while time.time() - start_time < timeout and len(samples) < target:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    try:
+                        chunk = s.recv(4096)
+                        if not chunk:
+                            # Stream chiuso dal ricevitore
+                            break
+                        last_data = time.time()
+
+                        # Il parser lavora direttamente sui byte, ignora i dati binari
+                        # intercalati e scarta le sentence con checksum errato
+                        for sentence in parser.feed(chunk):
+                            if sentence['type'] != 'GGA' or not sentence['quality']:
+                                continue
+                            coords = {'lat': sentence['lat'], 'lon': sentence['lon'], 'alt': sentence['alt']}
+                            # Campi vuoti (es. quota assente): il campione non è utilizzabile per la mediana
+                            if None in coords.values():
+                                continue
+                            samples.append(coords)
+                            if on_sample:
+                                on_sample(len(samples), coords)
+                            if len(samples) >= target:
+                                break
+
+                    except socket.timeout:
+                        if time.time() - last_data >= silence_timeout:
+                            break
+                    except Exception:
+                        break
+
+        except Exception as e:
+            print(f"Errore inatteso {label}: {e}", flush=True)
+            return None
+
+        return samples
+
     def has_coordinates(self) -> bool:
         """Verifica se le coordinate sono state impostate"""
         return self.coords is not None
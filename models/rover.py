@@ -1,9 +1,15 @@
 import subprocess
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 from .receiver import Ricevitore
+from .coordinates import Coordinates
+from .session_options import SessionOptions
 from utils.rtklib_config import generate_rtkrcv_config
 from utils.rtk_process import RTKProcess
+from utils.convergence import ConvergenceCriteria
+from utils.session_log import log
+from utils.net_utils import find_free_port
 
 class Rover(Ricevitore):
     """Rover che riceve coordinate da RTKRCV"""
@@ -11,8 +17,30 @@ class Rover(Ricevitore):
     def __init__(self, serial_number: str, ip_address: str, port: int, timeout: int = 150):
         super().__init__(serial_number, ip_address, port, 'rover')
         self.timeout = timeout
+        # Tempi dell'ultima sessione RTKRCV (first_float, first_fix, solution) in secondi
+        self.session_timings: Dict[str, float] = {}
+        # Consumo del processo RTKRCV nell'ultima sessione (cpu_seconds, cpu_percent, peak_rss_mb, wall_time)
+        self.session_resources: Dict[str, float] = {}
+        # Epoche dell'ultima sessione (dict di parse_solution_line), destinate all'archivio colonnare
+        self.session_epochs: List[Dict] = []
+        # Obiettivi di convergenza della sessione (settings.convergence + campo convergence del Rover)
+        self.convergence: Optional[ConvergenceCriteria] = None
 
-    def process_with_rtkrcv(self, master, rtklib_path: Path) -> bool:
+    def approximate_position(self, timeout: float = 5.0,
+                             cancel_event: Optional[threading.Event] = None) -> Optional[Coordinates]:
+        """
+        Posizione approssimata (soluzione autonoma del ricevitore, metri) da una GGA dello
+        stream, se il Rover invia NMEA insieme ai dati grezzi. Basta per scegliere il Master
+        più vicino; None se entro timeout non arriva una GGA valida.
+        """
+        samples = self.read_gga_samples(1, timeout, cancel_event=cancel_event)
+        if not samples:
+            return None
+        return Coordinates(samples[0]['lat'], samples[0]['lon'], samples[0]['alt'])
+
+    def process_with_rtkrcv(self, master, rtklib_path: Path, work_dir: Path = Path("tmp"),
+                            cancel_event: Optional[threading.Event] = None,
+                            options: Optional[SessionOptions] = None, pool=None) -> bool:
         """
         Avvia RTKRCV per ottenere posizione con correzioni differenziali.
         
@@ -20,48 +48,68 @@ class Rover(Ricevitore):
         Il sistema attende un FIX RTK (Q=1) fino al timeout, sacrificando la latenza per
         l'accuratezza. Se il timeout scade, si accetta un FLOAT (Q=2) come fallback,
         bilanciando la necessità di avere un dato con la sua qualità.
+
+        Ogni sessione usa una directory isolata (work_dir/<serial>, con la propria rt/),
+        così più sessioni possono girare in parallelo senza collisioni su config, log e trace.
+        Con options.solution_stream='tcp' la soluzione arriva da un tcpsvr locale di RTKRCV
+        e il file .pos viene scritto solo se options.debug_solution_file è attivo.
+        Con pool (utils.rtkrcv_pool.RTKRCVPool) la sessione riusa un processo RTKRCV già avviato.
         """
+        options = options or SessionOptions()
+        self.session_resources = {}
+        self.session_epochs = []
         if not master.has_coordinates():
-            print(f"Master non ha coordinate impostate", flush=True)
+            log(f"Master non ha coordinate impostate")
             return False
 
-        output_dir = Path("tmp")
-        output_dir.mkdir(exist_ok=True)
+        output_dir = work_dir / self.serial_number
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        # Lo stream del Master passa dal relay locale quando attivo
+        master_ip, master_port = master.stream_address()
+        solution_port = find_free_port() if options.solution_stream == 'tcp' else None
 
         config_file = generate_rtkrcv_config(
             rover_serial=self.serial_number,
             rover_ip=self.ip_address,
             rover_port=self.port,
-            master_ip=master.ip_address,
-            master_port=master.port,
+            master_ip=master_ip,
+            master_port=master_port,
             master_lat=master.coords.lat,
             master_lon=master.coords.lon,
             master_alt=master.coords.alt,
-            output_dir=output_dir
+            output_dir=output_dir,
+            solution_port=solution_port,
+            write_solution_file=options.debug_solution_file
         )
         
         if not config_file.exists():
-            print(f"ERRORE: File di configurazione non creato: {config_file}", flush=True)
+            log(f"ERRORE: File di configurazione non creato: {config_file}")
             return False
             
-        print(f"File di configurazione creato: {config_file}", flush=True)
+        log(f"File di configurazione creato: {config_file}")
         
-        rtk_process = RTKProcess(config_file, rtklib_path, output_dir=output_dir)
+        rtk_process = RTKProcess(config_file, rtklib_path, output_dir=output_dir,
+                                 cancel_event=cancel_event, solution_port=solution_port, pool=pool)
         
         if not rtk_process.start():
             return False
             
-        print(f"\nAttendo soluzione FIX (timeout: {self.timeout}s)...", flush=True)
-        result = rtk_process.wait_for_fix(self.timeout)
+        log(f"\nAttendo soluzione FIX (timeout: {self.timeout}s)...")
+        result = rtk_process.wait_for_fix(self.timeout, criteria=self.convergence)
         
+        self.session_timings = dict(rtk_process.timings)
+        self.session_epochs = rtk_process.epochs
+
         success = False
         if result:
             self._apply_solution(result, master.serial_number)
             success = True
         else:
-            print(f"Nessuna soluzione valida trovata nel tempo limite.", flush=True)
+            log(f"Nessuna soluzione valida trovata nel tempo limite.")
             
         rtk_process.stop(keep_logs_on_success=not success)
+        self.session_resources = dict(rtk_process.resource_usage)
         return success
 
     def _apply_solution(self, result: dict, master_id: str):
@@ -81,4 +129,4 @@ class Rover(Ricevitore):
         msg = f"Rover {self.serial_number} posizionato ({status_str}): Lat={coords['lat']}, Lon={coords['lon']}, Alt={coords['alt']}"
         if quality != 1:
             msg += " (⚠️ Status non optimal)"
-        print(msg, flush=True)
+        log(msg)
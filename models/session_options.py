@@ -0,0 +1,21 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class SessionOptions:
+    """Opzioni di una sessione RTKRCV, derivate dalla sezione settings di stations.yaml"""
+    # 'file': RTKRCV scrive il file .pos e il manager lo legge in coda
+    # 'tcp': RTKRCV pubblica la soluzione su un tcpsvr locale letto direttamente dal manager
+    solution_stream: str = 'file'
+    # In modalità 'tcp' scrive comunque il file .pos (per debug)
+    debug_solution_file: bool = False
+    # Riusa processi RTKRCV già avviati tra i Rover (console remota) invece di uno per sessione
+    session_pool: bool = False
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> 'SessionOptions':
+        return cls(
+            solution_stream=settings.get('solution_stream', cls.solution_stream),
+            debug_solution_file=bool(settings.get('debug_solution_file', cls.debug_solution_file)),
+            session_pool=bool(settings.get('session_pool', cls.session_pool))
+        )
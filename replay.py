@@ -0,0 +1,78 @@
+"""
+Registrazione e replay degli stream grezzi GNSS per benchmark riproducibili.
+
+    python replay.py record --duration 600 --out recordings/campagna1
+    python replay.py run recordings/campagna1 --speed 4
+"""
+import argparse
+import datetime
+import json
+import shutil
+import yaml
+from pathlib import Path
+from manager.rtk_manager import RTKManager
+from utils.replay_server import ReplayServer
+from utils.stream_recorder import StreamRecorder
+from utils.validator import Validator
+
+
+def record(args) -> None:
+    Validator.validate_config(args.stations)
+    with open(args.stations, 'r') as f:
+        receivers = list((yaml.safe_load(f).get('receivers') or {}).values())
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    shutil.copy(args.stations, args.out / "stations.yaml")
+
+    print(f"Registrazione di {len(receivers)} stream per {args.duration}s in {args.out}", flush=True)
+    results = StreamRecorder(args.out).record(receivers, args.duration)
+    for serial, size in results.items():
+        print(f"  {serial}: {size} byte", flush=True)
+
+
+def run(args) -> None:
+    # Ogni replay ha archivio risultati, cache e archivio epoche propri: non riprende run
+    # interrotti reali né usa la posizione Master in cache, quindi è isolato e ripetibile
+    state_dir = args.recording / "runs" / datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    with ReplayServer(args.recording, speed=args.speed) as server:
+        stations = server.write_stations(args.recording / "stations.yaml",
+                                         args.recording / "stations_replay.yaml")
+        manager = RTKManager(yaml_path=stations, rtklib_path=args.rtklib, resume=False)
+        manager.result_store_path = state_dir / "results.db"
+        manager.probe_cache_path = state_dir / "probe_cache.json"
+        manager.epoch_archive_path = state_dir / "epochs"
+        manager.run()
+
+    report = {
+        'recording': str(args.recording),
+        'speed': args.speed,
+        'state_dir': str(state_dir),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        **manager.run_report
+    }
+    output_dir = Path("output")
+    output_dir.mkdir(exist_ok=True)
+    report_path = output_dir / f"replay_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report replay salvato: {report_path}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Registrazione e replay stream GNSS")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Registra gli stream dei ricevitori in stations.yaml")
+    rec.add_argument("--stations", type=Path, default=Path("./stations.yaml"))
+    rec.add_argument("--duration", type=float, default=600, help="Durata in secondi")
+    rec.add_argument("--out", type=Path, required=True, help="Directory di destinazione")
+    rec.set_defaults(func=record)
+
+    rep = sub.add_parser("run", help="Esegue RTKManager contro una registrazione")
+    rep.add_argument("recording", type=Path, help="Directory creata da 'record'")
+    rep.add_argument("--speed", type=float, default=1.0, help="Fattore di accelerazione (1 = tempo reale)")
+    rep.add_argument("--rtklib", type=Path, default=Path("./rtklib/rtkrcv"))
+    rep.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# I test importano i moduli del progetto come main.py e app.py, dalla radice del repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,85 @@
+import random
+import statistics
+from utils.convergence import CONVERGED, DIVERGED, ConvergenceCriteria, ConvergenceTracker, _RunningStats
+
+# Circa 1 cm in latitudine
+CM = 0.01 / 111_195
+
+
+def epoch(lat: float = 45.0, quality: int = 1, sd: float = 0.01, **extra) -> dict:
+    sol = {'lat': lat, 'lon': 9.0, 'alt': 100.0, 'quality': quality,
+           'sdn': sd, 'sde': sd, 'sdu': sd * 2, 'age': 1.0, 'ratio': 10.0}
+    sol.update(extra)
+    return sol
+
+
+def test_welford_matches_statistics():
+    rng = random.Random(3)
+    values = [45 + rng.gauss(0, 1e-7) for _ in range(500)]
+    stats = _RunningStats()
+    for value in values:
+        stats.add(value)
+    assert stats.n == 500
+    assert abs(stats.mean - statistics.fmean(values)) < 1e-12
+    assert abs(stats.variance - statistics.variance(values)) < 1e-20
+
+
+def test_converges_after_min_fix_epochs_within_spread():
+    tracker = ConvergenceTracker(ConvergenceCriteria(min_fix_epochs=3, max_spread=0.03))
+    assert tracker.update(epoch(45.0), 1) is None
+    assert tracker.update(epoch(45.0 + CM), 2) is None
+    assert tracker.update(epoch(45.0 - CM), 3) == CONVERGED
+    solution = tracker.solution()
+    assert solution['samples'] == 3 and solution['quality'] == 1
+    assert abs(solution['lat'] - 45.0) < 1e-12
+    assert solution['spread'] <= 0.03
+
+
+def test_float_and_imprecise_epochs_do_not_count():
+    tracker = ConvergenceTracker(ConvergenceCriteria(min_fix_epochs=2, max_age=5.0, min_ratio=3.0))
+    assert tracker.update(epoch(quality=2), 1) is None
+    assert tracker.update(epoch(sd=0.2), 2) is None
+    assert tracker.update(epoch(age=10.0), 3) is None
+    assert tracker.update(epoch(ratio=2.0), 4) is None
+    assert tracker.accepted == 0 and tracker.rejected == 3
+    assert tracker.update(epoch(), 5) is None
+    assert tracker.update(epoch(), 6) == CONVERGED
+
+
+def test_spread_above_limit_resets_from_last_epoch():
+    tracker = ConvergenceTracker(ConvergenceCriteria(min_fix_epochs=3, max_spread=0.03))
+    # Un FIX errato a 50 cm: al raggiungimento di min_fix_epochs la dispersione è troppo alta
+    tracker.update(epoch(45.0 + 50 * CM), 1)
+    tracker.update(epoch(45.0), 2)
+    assert tracker.update(epoch(45.0), 3) is None
+    assert tracker.resets == 1 and tracker.accepted == 1
+    assert tracker.update(epoch(45.0), 4) is None
+    assert tracker.update(epoch(45.0), 5) == CONVERGED
+    assert abs(tracker.solution()['lat'] - 45.0) < 1e-12
+
+
+def test_diverges_without_accepted_fix_after_timeout():
+    tracker = ConvergenceTracker(ConvergenceCriteria(divergence_timeout=60, divergence_sd=1.0))
+    assert tracker.update(epoch(quality=5, sd=3.0), 30) is None
+    assert tracker.update(epoch(quality=5, sd=3.0), 60) == DIVERGED
+    # Con precisione ormai buona (FLOAT stabile) la sessione non viene rilasciata
+    tracker = ConvergenceTracker(ConvergenceCriteria(divergence_timeout=60, divergence_sd=1.0))
+    assert tracker.update(epoch(quality=2, sd=0.3), 90) is None
+
+
+def test_criteria_from_config_precedence():
+    criteria = ConvergenceCriteria.from_config({'min_fix_epochs': 5, 'max_spread': 0.05},
+                                               {'max_spread': 0.01, 'unknown': 1}, None)
+    assert criteria.min_fix_epochs == 5 and criteria.max_spread == 0.01
+
+
+def test_diverged_without_new_epochs():
+    # Stream fermo: nessuna nuova epoca, la divergenza scatta comunque a divergence_timeout
+    tracker = ConvergenceTracker(ConvergenceCriteria(divergence_timeout=60, divergence_sd=1.0))
+    assert tracker.update(epoch(quality=5, sd=3.0), 10) is None
+    assert not tracker.diverged(59)
+    assert tracker.diverged(61)
+    assert ConvergenceTracker(ConvergenceCriteria(divergence_timeout=60)).diverged(61)
+    # Precisione buona nell'ultima epoca: si attende ancora il FIX
+    tracker.update(epoch(quality=2, sd=0.2), 20)
+    assert not tracker.diverged(61)
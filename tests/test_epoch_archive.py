@@ -0,0 +1,112 @@
+import datetime
+import numpy as np
+import pytest
+from utils.epoch_archive import DTYPES, INDEX_FILE, EpochArchive
+
+
+def epochs(start: datetime.datetime, count: int, quality: int = 1) -> list:
+    """Epoche come prodotte da solution_reader.parse_solution_line, una al secondo"""
+    result = []
+    for i in range(count):
+        t = start + datetime.timedelta(seconds=i)
+        result.append({'time': t.strftime('%Y/%m/%d %H:%M:%S.%f')[:-3], 'lat': 45.0 + i * 1e-8,
+                       'lon': 9.0, 'alt': 100.0 + i, 'quality': quality, 'ns': 20,
+                       'sdn': 0.01, 'sde': 0.01, 'sdu': 0.02, 'sdne': 0.0, 'sdeu': 0.0, 'sdun': 0.0,
+                       'age': 1.0, 'ratio': 5.0 + i})
+    return result
+
+
+START = datetime.datetime(2025, 3, 10, 12, 0, 0)
+
+
+def test_append_read_round_trip(tmp_path):
+    archive = EpochArchive(tmp_path)
+    assert archive.append('R1', epochs(START, 100), run_id=7, master_id='M1', status='FIX') == 100
+
+    data = archive.read('R1')
+    assert len(data['time']) == 100
+    assert data['time'][0] == START.replace(tzinfo=datetime.timezone.utc).timestamp()
+    assert np.allclose(data['alt'], 100.0 + np.arange(100))
+    assert np.allclose(data['ratio'], 5.0 + np.arange(100))
+    assert set(data) == set(DTYPES)
+
+    [session] = archive.sessions('R1')
+    assert (session['run_id'], session['master_id'], session['status']) == (7, 'M1', 'FIX')
+    assert (session['offset'], session['rows'], session['fix']) == (0, 100, 100)
+
+
+def test_iter_days_yields_memmap_views_for_a_range(tmp_path):
+    archive = EpochArchive(tmp_path)
+    archive.append('R1', epochs(START, 60))
+    archive.append('R1', epochs(START + datetime.timedelta(minutes=5), 60))
+
+    days = list(archive.iter_days('R1', START + datetime.timedelta(seconds=30),
+                                  START + datetime.timedelta(minutes=5, seconds=10), columns=('time', 'alt')))
+    assert len(days) == 1
+    day = days[0]
+    assert isinstance(day['alt'], np.memmap)
+    assert set(day) == {'time', 'alt'}
+    # 30 epoche della prima sessione + 10 della seconda
+    assert len(day['time']) == 40
+    with pytest.raises(ValueError):
+        list(archive.iter_days('R1', columns=('time', 'speed')))
+
+
+def test_session_across_midnight_is_split(tmp_path):
+    archive = EpochArchive(tmp_path)
+    archive.append('R1', epochs(datetime.datetime(2025, 3, 10, 23, 59, 50), 20))
+    assert archive.days('R1') == ['2025-03-10', '2025-03-11']
+    sessions = archive.sessions('R1')
+    assert [s['rows'] for s in sessions] == [10, 10]
+    assert sessions[0]['session'] == sessions[1]['session']
+
+
+def test_torn_write_is_truncated_on_next_append(tmp_path):
+    archive = EpochArchive(tmp_path)
+    archive.append('R1', epochs(START, 50))
+    day_dir = tmp_path / 'R1' / '2025-03-10'
+
+    # Scrittura interrotta: colonne accodate solo in parte e riga dell'indice troncata
+    with open(day_dir / 'time.bin', 'ab') as f:
+        f.write(np.arange(7, dtype='<f8').tobytes())
+    with open(day_dir / 'alt.bin', 'ab') as f:
+        f.write(b'\x00\x01\x02')
+    with open(day_dir / INDEX_FILE, 'ab') as f:
+        f.write(b'{"session":1,"rows":7,"off')
+
+    # Prima del nuovo accodamento la sessione interrotta non è visibile
+    assert len(archive.read('R1')['time']) == 50
+
+    archive.append('R1', epochs(START + datetime.timedelta(minutes=10), 30))
+    data = archive.read('R1')
+    assert len(data['time']) == 80
+    assert np.allclose(data['alt'][50:], 100.0 + np.arange(30))
+    for name, dtype in DTYPES.items():
+        assert (day_dir / f"{name}.bin").stat().st_size == 80 * dtype.itemsize
+    # La riga interrotta resta nel file ma non conta: la nuova sessione parte dall'offset 50
+    assert len((day_dir / INDEX_FILE).read_text().splitlines()) == 3
+    assert [session['offset'] for session in archive.sessions('R1')] == [0, 50]
+
+
+def test_unordered_sessions_fall_back_to_mask(tmp_path):
+    archive = EpochArchive(tmp_path)
+    archive.append('R1', epochs(START + datetime.timedelta(hours=1), 10))
+    archive.append('R1', epochs(START, 10))
+    data = archive.read('R1', START, START + datetime.timedelta(seconds=5))
+    assert len(data['time']) == 5
+
+
+def test_serial_is_sanitised_and_missing_serial_is_empty(tmp_path):
+    archive = EpochArchive(tmp_path)
+    archive.append('../R/1', epochs(START, 3))
+    assert archive.serials() == ['.._R_1']
+    assert all(len(values) == 0 for values in archive.read('R2').values())
+
+
+def test_prune_removes_old_days(tmp_path):
+    archive = EpochArchive(tmp_path)
+    archive.append('R1', epochs(START, 3))
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    archive.append('R1', epochs(datetime.datetime.combine(today, datetime.time(12)), 3))
+    assert archive.prune(7 * 86400) == 1
+    assert archive.days('R1') == [today.isoformat()]
@@ -0,0 +1,132 @@
+import random
+import socket
+import threading
+import time
+from utils.gnss_framer import GNSSFramer, crc24q, ubx_checksum
+from utils.stream_verifier import StreamVerifier
+
+# UBX ACK-ACK (per CFG-PRT) come trasmesso da un ricevitore u-blox
+UBX_ACK = bytes.fromhex('b5620501020006000e37')
+
+
+def ubx(msg_class: int, msg_id: int, payload: bytes) -> bytes:
+    body = bytes((msg_class, msg_id)) + len(payload).to_bytes(2, 'little') + payload
+    return b'\xb5\x62' + body + ubx_checksum(body)
+
+
+def rtcm3(message_type: int, payload: bytes) -> bytes:
+    data = (message_type << 4).to_bytes(2, 'big') + payload
+    frame = bytes((0xD3, len(data) >> 8, len(data) & 0xFF)) + data
+    return frame + crc24q(frame).to_bytes(3, 'big')
+
+
+def nmea(body: str) -> bytes:
+    checksum = 0
+    for byte in body.encode('ascii'):
+        checksum ^= byte
+    return f"${body}*{checksum:02X}\r\n".encode('ascii')
+
+
+def feed(data: bytes, chunk: int = 0):
+    framer = GNSSFramer()
+    if not chunk:
+        return framer.feed(data), framer
+    frames = []
+    for pos in range(0, len(data), chunk):
+        frames.extend(framer.feed(data[pos:pos + chunk]))
+    return frames, framer
+
+
+def test_known_checksums():
+    assert crc24q(b'123456789') == 0xCDE703
+    assert ubx(0x05, 0x01, b'\x06\x00') == UBX_ACK
+
+
+def test_ubx_accepted():
+    frames, framer = feed(UBX_ACK + ubx(0x02, 0x15, bytes(range(64))))
+    assert [(f.protocol, f.message, f.length) for f in frames] == [('UBX', 'ACK-ACK', 10), ('UBX', 'RXM-RAWX', 72)]
+    assert framer.stats.bytes_skipped == 0
+
+
+def test_ubx_bad_checksum_rejected():
+    corrupted = UBX_ACK[:-1] + bytes([UBX_ACK[-1] ^ 0x01])
+    frames, framer = feed(corrupted + UBX_ACK)
+    assert [f.message for f in frames] == ['ACK-ACK']
+    assert framer.stats.frames['UBX'] == 1
+    assert framer.stats.bytes_skipped == len(corrupted)
+
+
+def test_rtcm3_accepted():
+    frames, _ = feed(rtcm3(1077, bytes(40)) + rtcm3(1005, bytes(17)))
+    assert [(f.protocol, f.message) for f in frames] == [('RTCM3', '1077'), ('RTCM3', '1005')]
+
+
+def test_rtcm3_bad_crc_rejected():
+    frame = bytearray(rtcm3(1077, bytes(40)))
+    frame[10] ^= 0x40
+    frames, framer = feed(bytes(frame) + rtcm3(1230, bytes(4)))
+    assert [f.message for f in frames] == ['1230']
+    assert framer.stats.bytes_skipped == len(frame)
+
+
+def test_nmea_bad_checksum_rejected():
+    gga = nmea("GPGGA,123519.00,4807.0380,N,01131.0000,E,4,12,0.8,545.4,M,46.9,M,1.0,0000")
+    frames, _ = feed(gga.replace(b'545.4', b'545.5') + gga)
+    assert [(f.protocol, f.message) for f in frames] == [('NMEA', 'GPGGA')]
+
+
+def test_rtcm3_reserved_bits_rejected():
+    frame = bytearray(rtcm3(1077, bytes(8)))
+    frame[1] |= 0x80
+    frames, _ = feed(bytes(frame))
+    assert frames == []
+
+
+def test_mixed_stream_split_in_small_chunks():
+    gga = nmea("GPGGA,123519.00,4807.0380,N,01131.0000,E,4,12,0.8,545.4,M,46.9,M,1.0,0000")
+    stream = rtcm3(1077, bytes(40)) + UBX_ACK + gga + rtcm3(1005, bytes(17))
+    for chunk in (1, 3, 7, 64):
+        frames, framer = feed(stream, chunk)
+        assert [f.protocol for f in frames] == ['RTCM3', 'UBX', 'NMEA', 'RTCM3'], chunk
+        assert framer.stats.bytes_framed == len(stream)
+
+
+def test_resync_when_stream_starts_mid_frame():
+    frame = rtcm3(1077, bytes(40))
+    frames, framer = feed(frame[5:] + UBX_ACK + frame)
+    assert [f.protocol for f in frames] == ['UBX', 'RTCM3']
+    assert framer.stats.bytes_skipped == len(frame) - 5
+
+
+def serve_forever(data: bytes):
+    """Server che invia data in continuazione finché il client non chiude"""
+    server = socket.create_server(('127.0.0.1', 0))
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            try:
+                while True:
+                    conn.sendall(data)
+                    time.sleep(0.01)
+            except OSError:
+                pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+
+def test_unclassifiable_stream_is_unknown_before_timeout():
+    noise = bytes(random.Random(5).randrange(256) for _ in range(1024)).replace(b'$', b'').replace(b'\xb5', b'') \
+        .replace(b'\xd3', b'')
+    with serve_forever(noise) as server:
+        start = time.monotonic()
+        report = StreamVerifier.analyze_stream('127.0.0.1', server.getsockname()[1], timeout=5)
+    assert report.protocol == 'UNKNOWN'
+    assert time.monotonic() - start < 2
+
+
+def test_ubx_stream_detected():
+    frame = ubx(0x02, 0x15, bytes(200))
+    with serve_forever(frame) as server:
+        assert StreamVerifier.detect_protocol('127.0.0.1', server.getsockname()[1], timeout=5) == 'UBX'
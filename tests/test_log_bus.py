@@ -0,0 +1,72 @@
+import threading
+import pytest
+from utils.log_bus import END_OF_STREAM, LogBus, SubscriberDropped
+
+
+def publish(bus: LogBus, count: int, prefix: str = 'riga') -> None:
+    for i in range(count):
+        bus.publish(f"{prefix} {i}")
+
+
+def test_every_subscriber_gets_every_line():
+    bus = LogBus()
+    first, second = bus.subscribe(), bus.subscribe()
+    publish(bus, 3)
+    expected = [(1, 'riga 0'), (2, 'riga 1'), (3, 'riga 2')]
+    assert first.read(timeout=0) == expected
+    assert second.read(timeout=0) == expected
+    assert first.read(timeout=0) == []
+
+
+def test_reconnect_replays_after_last_event_id():
+    bus = LogBus()
+    client = bus.subscribe()
+    publish(bus, 5)
+    seen = client.read(timeout=0)
+    last_event_id = seen[2][0]
+    # Il browser si riconnette con Last-Event-ID = 3: riceve solo le righe 4 e 5
+    resumed = bus.subscribe(last_event_id)
+    assert [event_id for event_id, _ in resumed.read(timeout=0)] == [4, 5]
+    assert resumed.gap == 0
+
+
+def test_reconnect_reports_gap_when_lines_left_the_buffer():
+    bus = LogBus(capacity=3)
+    publish(bus, 10)
+    resumed = bus.subscribe(2)
+    assert [event_id for event_id, _ in resumed.read(timeout=0)] == [8, 9, 10]
+    assert resumed.gap == 5
+
+
+def test_unknown_last_event_id_restarts_from_history():
+    bus = LogBus()
+    publish(bus, 2)
+    # Id di un'istanza precedente del server, oltre l'ultimo pubblicato
+    assert [event_id for event_id, _ in bus.subscribe(999).read(timeout=0)] == [1, 2]
+
+
+def test_clear_is_not_a_gap():
+    bus = LogBus()
+    publish(bus, 4)
+    client = bus.subscribe(2)
+    bus.clear()
+    bus.publish('nuovo run')
+    assert client.read(timeout=0) == [(5, 'nuovo run')]
+    assert client.gap == 0
+
+
+def test_slow_subscriber_is_dropped():
+    bus = LogBus(capacity=4)
+    client = bus.subscribe()
+    bus.publish('prima')
+    client.read(timeout=0)
+    publish(bus, 10)
+    with pytest.raises(SubscriberDropped):
+        client.read(timeout=0)
+
+
+def test_read_wakes_up_on_publish():
+    bus = LogBus()
+    client = bus.subscribe()
+    threading.Timer(0.05, bus.end).start()
+    assert client.read(timeout=5) == [(1, END_OF_STREAM)]
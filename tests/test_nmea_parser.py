@@ -0,0 +1,115 @@
+import socket
+import threading
+import time
+from models.master import Master
+from utils.nmea_parser import NMEAStreamParser, nmea_checksum_ok, parse_sentence
+
+
+def sentence(body: str) -> bytes:
+    """Sentence completa di '$', checksum e CRLF"""
+    checksum = 0
+    for byte in body.encode('ascii'):
+        checksum ^= byte
+    return f"${body}*{checksum:02X}\r\n".encode('ascii')
+
+
+GGA = sentence("GPGGA,123519.00,4807.0380,N,01131.0000,E,4,12,0.8,545.4,M,46.9,M,1.0,0000")
+RMC = sentence("GNRMC,123519.00,A,4807.0380,N,01131.0000,E,0.02,,230394,,,R")
+
+
+def test_checksum():
+    assert nmea_checksum_ok(GGA.rstrip())
+    assert not nmea_checksum_ok(GGA.rstrip()[:-2] + b'00')
+    assert not nmea_checksum_ok(GGA.rstrip().split(b'*')[0])
+
+
+def test_parse_gga():
+    parsed = parse_sentence(GGA.rstrip())
+    assert parsed['type'] == 'GGA' and parsed['talker'] == 'GP'
+    assert abs(parsed['lat'] - (48 + 7.038 / 60)) < 1e-9
+    assert abs(parsed['lon'] - (11 + 31 / 60)) < 1e-9
+    assert parsed['quality'] == 4 and parsed['num_sats'] == 12 and parsed['alt'] == 545.4
+    assert parsed['time'] == 12 * 3600 + 35 * 60 + 19
+
+
+def test_parse_rejects_bad_checksum_unless_disabled():
+    corrupted = GGA.rstrip().replace(b'545.4', b'545.5')
+    assert parse_sentence(corrupted) is None
+    assert parse_sentence(corrupted, validate=False)['alt'] == 545.5
+
+
+def test_empty_altitude_is_none():
+    parsed = parse_sentence(sentence("GPGGA,123519.00,4807.0380,N,01131.0000,E,1,08,0.9,,M,,M,,").rstrip())
+    assert parsed['alt'] is None
+
+
+def test_stream_parser_partial_chunks():
+    # Ogni possibile punto di taglio: la sentence esce una sola volta, a newline ricevuto
+    data = GGA + RMC
+    for cut in range(1, len(data)):
+        parser = NMEAStreamParser()
+        first = list(parser.feed(data[:cut]))
+        second = list(parser.feed(data[cut:]))
+        assert [s['type'] for s in first + second] == ['GGA', 'RMC']
+        assert len(first) == (1 if cut >= len(GGA) else 0)
+
+
+def test_stream_parser_byte_by_byte_with_binary_noise():
+    noise = b'\xb5\x62\x02\x15\x00\x10$\xd3\x00\x13' + bytes(range(0, 256, 7))
+    parser = NMEAStreamParser()
+    parsed = []
+    for byte in noise + GGA + noise + RMC:
+        parsed.extend(parser.feed(bytes([byte])))
+    assert [s['type'] for s in parsed] == ['GGA', 'RMC']
+
+
+def test_stream_parser_counts_checksum_errors():
+    parser = NMEAStreamParser()
+    corrupted = GGA.replace(b'545.4', b'545.5')
+    parsed = list(parser.feed(corrupted + RMC))
+    assert [s['type'] for s in parsed] == ['RMC']
+    assert parser.checksum_errors == 1
+
+
+def test_gga_samples_skip_empty_fields():
+    no_alt = sentence("GPGGA,123519.00,4807.0380,N,01131.0000,E,1,08,0.9,,M,,M,,")
+    server = socket.create_server(('127.0.0.1', 0))
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            conn.sendall(no_alt + GGA + no_alt + GGA)
+            conn.recv(1)  # attende la chiusura dal client
+
+    threading.Thread(target=serve, daemon=True).start()
+    with server:
+        master = Master('M1', '127.0.0.1', server.getsockname()[1])
+        samples = master.read_gga_samples(2, timeout=5)
+    assert [s['alt'] for s in samples] == [545.4, 545.4]
+
+
+def test_gga_samples_connect_timeout_with_cancel_event(monkeypatch):
+    # Con cancel_event la connessione usa comunque il timeout pieno: solo la recv fa polling
+    server = socket.create_server(('127.0.0.1', 0))
+
+    def serve():
+        time.sleep(1.0)  # accept() ritardata, come un link lento
+        conn, _ = server.accept()
+        with conn:
+            conn.sendall(GGA + GGA)
+            conn.recv(1)
+
+    connect_timeouts = []
+
+    class RecordingSocket(socket.socket):
+        def connect(self, address):
+            connect_timeouts.append(self.gettimeout())
+            return super().connect(address)
+
+    monkeypatch.setattr(socket, 'socket', RecordingSocket)
+    threading.Thread(target=serve, daemon=True).start()
+    with server:
+        master = Master('M1', '127.0.0.1', server.getsockname()[1])
+        samples = master.read_gga_samples(2, timeout=5, cancel_event=threading.Event())
+    assert connect_timeouts == [5]
+    assert [s['alt'] for s in samples] == [545.4, 545.4]
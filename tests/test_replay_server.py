@@ -0,0 +1,47 @@
+import errno
+import socket
+import pytest
+from utils.replay_server import ReplayServer
+from utils.stream_recorder import RecordingWriter, RECORDING_SUFFIX
+
+
+@pytest.fixture
+def recordings(tmp_path):
+    # Due ricevitori registrati sulla stessa porta, come accade sul campo
+    for serial in ('M1', 'R1'):
+        writer = RecordingWriter(tmp_path / f"{serial}{RECORDING_SUFFIX}",
+                                 {'serial': serial, 'ip': '10.0.0.1', 'port': 5017})
+        # Un client riceve i dati dal punto corrente della riproduzione: record dopo 0.5 s
+        writer.write(serial.encode(), timestamp=writer.start + 0.5)
+        writer.close()
+    return tmp_path
+
+
+def test_falls_back_to_loopback_ports(recordings, monkeypatch):
+    listen = ReplayServer._listen
+
+    def no_aliases(address):
+        # Sistema senza alias 127.0.1.N (es. macOS)
+        if address[0] != '127.0.0.1':
+            raise OSError(errno.EADDRNOTAVAIL, "Can't assign requested address")
+        return listen(address)
+
+    monkeypatch.setattr(ReplayServer, '_listen', staticmethod(no_aliases))
+    with ReplayServer(recordings) as server:
+        addresses = server.addresses
+        assert {host for host, _ in addresses.values()} == {'127.0.0.1'}
+        assert len({port for _, port in addresses.values()}) == 2
+        clients = {serial: socket.create_connection(address, timeout=5)
+                   for serial, address in addresses.items()}
+        for serial, conn in clients.items():
+            with conn:
+                assert conn.recv(16) == serial.encode()
+
+
+def test_other_bind_errors_propagate(recordings, monkeypatch):
+    def busy(address):
+        raise OSError(errno.EADDRINUSE, "Address already in use")
+
+    monkeypatch.setattr(ReplayServer, '_listen', staticmethod(busy))
+    with pytest.raises(OSError):
+        ReplayServer(recordings).start()
@@ -0,0 +1,123 @@
+import socket
+import sys
+import threading
+import pytest
+from utils.rtkrcv_pool import RTKRCVConsole, RTKRCVConsoleError, RTKRCVPool
+
+# RTKRCV finto: console remota su -p con password -w, risponde ai comandi come rtkrcv
+FAKE_RTKRCV = r'''#!{python}
+import socket, sys
+args = sys.argv[1:]
+port, password = int(args[args.index('-p') + 1]), args[args.index('-w') + 1]
+server = socket.create_server(('127.0.0.1', port))
+while True:
+    conn, _ = server.accept()
+    f = conn.makefile('rwb', buffering=0)
+    conn.sendall(b'password: ')
+    if f.readline().strip().decode() != password:
+        conn.close()
+        continue
+    conn.sendall(b'\r\nrtkrcv> ')
+    for line in f:
+        command = line.strip().decode()
+        if command.startswith('load '):
+            reply = f"options loaded from {{command[5:]}}" if 'missing' not in command else f"no options file: {{command[5:]}}"
+        elif command in ('start', 'stop'):
+            reply = f"rtk server {{command}}"
+        else:
+            reply = f"unknown command: {{command}}."
+        conn.sendall(command.encode() + b'\r\n' + reply.encode() + b'\r\nrtkrcv> ')
+'''
+
+
+@pytest.fixture
+def rtkrcv(tmp_path):
+    path = tmp_path / "rtkrcv"
+    path.write_text(FAKE_RTKRCV.format(python=sys.executable))
+    path.chmod(0o755)
+    return path
+
+
+def console_reply(reply: bytes) -> socket.socket:
+    """Console minimale che risponde a un solo comando con reply"""
+    server = socket.create_server(('127.0.0.1', 0))
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            conn.sendall(b'rtkrcv> ')
+            conn.recv(1024)
+            conn.sendall(reply + b'\r\nrtkrcv> ')
+            conn.recv(1)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+
+@pytest.mark.parametrize('reply, failed', [
+    (b'options loaded from /data/error_logs/error.conf', False),
+    (b'rtk server start', False),
+    (b'rtk server start error (invalid stream)', True),
+    (b'no options file: /tmp/a.conf', True),
+    (b'unknown command: lod.', True),
+])
+def test_console_error_replies(reply, failed):
+    with console_reply(reply) as server:
+        console = RTKRCVConsole(server.getsockname()[1], 'pw')
+        console.connect()
+        try:
+            if failed:
+                with pytest.raises(RTKRCVConsoleError):
+                    console.command('load x')
+            else:
+                assert reply.decode() in console.command('load x')
+        finally:
+            console.close()
+
+
+def test_pool_reuses_process(rtkrcv, tmp_path):
+    pool = RTKRCVPool(rtkrcv, tmp_path, size=1)
+    try:
+        first = pool.acquire(tmp_path / "rover1.conf")
+        assert first is not None
+        pool.release(first)
+        # Un percorso che contiene "error" non è un errore della console
+        second = pool.acquire(tmp_path / "error_logs" / "rover2.conf")
+        assert second is first and second.sessions == 2
+        pool.release(second)
+    finally:
+        pool.close()
+
+
+def test_pool_size_limits_live_processes(rtkrcv, tmp_path):
+    pool = RTKRCVPool(rtkrcv, tmp_path, size=2)
+    try:
+        busy = [pool.acquire(tmp_path / f"rover{i}.conf") for i in range(2)]
+        assert all(busy)
+        # Pool pieno: il chiamante ripiega su un processo dedicato
+        assert pool.acquire(tmp_path / "rover3.conf") is None
+        pool.release(busy[0])
+        assert pool.acquire(tmp_path / "rover3.conf") is busy[0]
+        # Un processo non più riutilizzabile libera il suo posto
+        busy[1].process.kill()
+        busy[1].process.wait()
+        pool.release(busy[1])
+        replacement = pool.acquire(tmp_path / "rover4.conf")
+        assert replacement is not None and replacement is not busy[1]
+        for instance in (busy[0], replacement):
+            pool.release(instance)
+    finally:
+        pool.close()
+
+
+def test_pool_drops_process_on_load_error(rtkrcv, tmp_path):
+    pool = RTKRCVPool(rtkrcv, tmp_path, size=1)
+    try:
+        instance = pool.acquire(tmp_path / "rover.conf")
+        pool.release(instance)
+        # 'no options file' sul processo riusato: terminato, ne parte uno nuovo
+        replacement = pool.acquire(tmp_path / "missing.conf")
+        assert replacement is not None and replacement is not instance and not instance.alive()
+        pool.release(replacement)
+    finally:
+        pool.close()
@@ -0,0 +1,27 @@
+import select
+import threading
+import time
+from utils.cancel_event import CancelEvent
+from utils.solution_watcher import SolutionWatcher
+
+
+def test_cancel_event_wakes_wait(tmp_path):
+    cancel_event = CancelEvent()
+    watcher = SolutionWatcher(tmp_path / "solution.pos", None)
+    try:
+        threading.Timer(0.2, cancel_event.set).start()
+        start = time.monotonic()
+        assert watcher.wait(5.0, [cancel_event.fileno()])
+        assert time.monotonic() - start < 2.0
+    finally:
+        watcher.close()
+
+
+def test_cancel_event_clear_drains():
+    cancel_event = CancelEvent()
+    cancel_event.set()
+    cancel_event.clear()
+    assert not select.select([cancel_event], [], [], 0)[0]
+    cancel_event.set()
+    assert select.select([cancel_event], [], [], 0)[0]
+    cancel_event.close()
@@ -0,0 +1,28 @@
+import pytest
+from utils.validator import Validator
+
+RECEIVERS = """
+receivers:
+  base:
+    serial: M1
+    ip: 10.0.0.1
+    port: 5000
+    role: master
+"""
+
+
+def write_config(tmp_path, settings: str):
+    path = tmp_path / "stations.yaml"
+    path.write_text(f"settings:\n{settings}\n{RECEIVERS}")
+    return path
+
+
+@pytest.mark.parametrize('value', ['0', '-1', 'true', '"8"'])
+def test_probe_deadline_must_be_positive(tmp_path, value):
+    with pytest.raises(ValueError, match='probe_deadline'):
+        Validator.validate_config(write_config(tmp_path, f"  probe_deadline: {value}"))
+
+
+def test_probe_settings_accepted(tmp_path):
+    # probe_cache_ttl 0 disattiva la cache
+    assert Validator.validate_config(write_config(tmp_path, "  probe_deadline: 0.5\n  probe_cache_ttl: 0"))
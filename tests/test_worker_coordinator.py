@@ -0,0 +1,145 @@
+import http.client
+import json
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer
+import pytest
+from manager.worker_coordinator import WorkerCoordinator
+from models.master import Master
+from models.rover import Rover
+from models.session_options import SessionOptions
+from worker_agent import WorkerAgent, _Handler, serve
+
+TOKEN = 'secret'
+
+
+def fake_execute(self, payload, put, cancel_event):
+    """Sessione finta: registra il worker che l'ha eseguita e restituisce un FIX"""
+    serial = payload['rover']['serial']
+    self.executed.append(serial)
+    put({'type': 'log', 'message': f"sessione {serial} su {self.name}"})
+    if self.gate is not None:
+        self.gate.wait(5)
+    put({'type': 'result', 'success': True, 'status': 'FIX',
+         'coords': {'lat': 45.0, 'lon': 9.0, 'alt': 100.0}, 'timings': {'solution': 1.0}})
+
+
+def dying_stream_job(self, payload):
+    """Il worker muore a metà stream: una riga di log e poi la connessione si chiude"""
+    self.agent.executed.append(payload['rover']['serial'])
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/x-ndjson')
+    self.end_headers()
+    self.wfile.write(json.dumps({'type': 'log', 'message': 'avvio'}).encode() + b'\n')
+    self.wfile.flush()
+    self.connection.shutdown(socket.SHUT_RDWR)
+
+
+@pytest.fixture
+def agents(tmp_path, monkeypatch):
+    monkeypatch.setattr(WorkerAgent, 'execute', fake_execute)
+    servers = []
+
+    def start(name, capacity=1, dying=False):
+        agent = WorkerAgent(tmp_path / "rtkrcv", tmp_path / name, capacity, name)
+        agent.executed = []
+        agent.gate = None
+        if dying:
+            handler = type('Handler', (_Handler,), {'agent': agent, 'token': TOKEN,
+                                                    '_stream_job': dying_stream_job})
+            server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+            server.daemon_threads = True
+        else:
+            server = serve(agent, '127.0.0.1', 0, token=TOKEN)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return agent, f"127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def session(coordinator, serial):
+    master = Master('M1', '10.0.0.1', 5000)
+    master.set_coordinates(45.0, 9.0, 100.0)
+    rover = Rover(serial, '10.0.0.2', 5000, 60)
+    return rover, coordinator.run_session(rover, master, SessionOptions())
+
+
+def test_jobs_spread_across_workers(agents):
+    started = [agents(f"w{i}") for i in range(3)]
+    gate = threading.Event()
+    for agent, _ in started:
+        agent.gate = gate
+    coordinator = WorkerCoordinator([address for _, address in started], token=TOKEN)
+    assert coordinator.refresh() == 3
+
+    outcomes = []
+    threads = [threading.Thread(target=lambda s=serial: outcomes.append(session(coordinator, s)[1]))
+               for serial in ('R1', 'R2', 'R3')]
+    for thread in threads:
+        thread.start()
+    # Tutte e tre le sessioni in corso contemporaneamente, una per worker
+    deadline = time.monotonic() + 5
+    while sum(len(agent.executed) for agent, _ in started) < 3 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    gate.set()
+    for thread in threads:
+        thread.join(10)
+    assert [len(agent.executed) for agent, _ in started] == [1, 1, 1]
+    assert outcomes == [True, True, True]
+
+
+def test_busy_worker_requeues_job(agents):
+    busy, busy_address = agents('busy')
+    free, free_address = agents('free')
+    # Il coordinatore non sa che busy è pieno: il job viene rifiutato (503) e va all'altro worker
+    busy.reserve('OTHER')
+    coordinator = WorkerCoordinator([busy_address, free_address], token=TOKEN)
+    coordinator.refresh()
+
+    rover, ok = session(coordinator, 'R1')
+    assert ok and rover.sol_status == 'FIX'
+    assert busy.executed == [] and free.executed == ['R1']
+    # Un rifiuto non esclude il worker
+    assert all(worker.alive for worker in coordinator.workers)
+
+
+def test_rover_already_running_is_409(agents):
+    agent, address = agents('w', capacity=2)
+    agent.reserve('R1')
+    conn = http.client.HTTPConnection(*address.split(':'))
+    conn.request('POST', '/jobs', body=json.dumps({'rover': {'serial': 'R1'}}),
+                 headers={'Authorization': f"Bearer {TOKEN}"})
+    assert conn.getresponse().status == 409
+    conn.close()
+
+
+def test_dead_worker_requeues_job(agents):
+    dead, dead_address = agents('dead', dying=True)
+    alive, alive_address = agents('alive')
+    coordinator = WorkerCoordinator([dead_address, alive_address], token=TOKEN)
+    coordinator.refresh()
+
+    rover, ok = session(coordinator, 'R1')
+    assert ok and rover.coords is not None
+    assert dead.executed == ['R1'] and alive.executed == ['R1']
+    worker = next(w for w in coordinator.workers if w.address == dead_address)
+    assert not worker.alive
+    assert worker.retry_at - time.monotonic() > WorkerCoordinator.RETRY_INTERVAL - 5
+
+
+def test_token_rejected(agents):
+    agent, address = agents('w')
+    conn = http.client.HTTPConnection(*address.split(':'))
+    conn.request('GET', '/health')
+    assert conn.getresponse().status == 401
+    conn.close()
+
+    coordinator = WorkerCoordinator([address], token='wrong')
+    assert coordinator.refresh() == 0
+    assert session(coordinator, 'R1')[1] is None
+    assert agent.executed == []
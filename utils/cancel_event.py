@@ -0,0 +1,43 @@
+import socket
+import threading
+
+
+class CancelEvent(threading.Event):
+    """
+    threading.Event con un descrittore che diventa leggibile quando l'evento è impostato.
+    Chi attende su poll/select (es. SolutionWatcher) può includere fileno() tra i propri
+    descrittori e svegliarsi subito all'annullamento invece che al prossimo timeout.
+    Usa una coppia di socket (e non una pipe) perché select le accetta su ogni piattaforma.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
+
+    def set(self) -> None:
+        super().set()
+        try:
+            self._writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            # Buffer pieno (già leggibile) o evento chiuso
+            pass
+
+    def clear(self) -> None:
+        super().clear()
+        try:
+            while self._reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self) -> None:
+        self._reader.close()
+        self._writer.close()
+
+    def __del__(self):
+        self.close()
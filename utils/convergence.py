@@ -0,0 +1,150 @@
+import math
+from dataclasses import dataclass, fields
+from typing import Dict, Optional
+from models.coordinates import EARTH_RADIUS
+
+CONVERGED = 'converged'
+DIVERGED = 'diverged'
+
+
+@dataclass
+class ConvergenceCriteria:
+    """
+    Obiettivi di convergenza di una sessione RTK (settings.convergence, sovrascrivibili
+    dal campo convergence del Rover in stations.yaml). Distanze in metri, tempi in secondi.
+    """
+    # Epoche FIX accettate necessarie prima di poter chiudere la sessione
+    min_fix_epochs: int = 3
+    # Deviazione standard stimata da RTKRCV per l'epoca (sqrt(sdn²+sde²) e sdu)
+    max_sd_horizontal: float = 0.05
+    max_sd_vertical: float = 0.10
+    # Ratio minimo dell'ambiguity resolution (0 = si accetta la soglia di RTKRCV)
+    min_ratio: float = 0.0
+    # Età massima delle correzioni differenziali
+    max_age: float = 30.0
+    # Dispersione massima (dev. standard orizzontale) delle posizioni FIX accettate
+    max_spread: float = 0.03
+    # Dopo divergence_timeout secondi senza FIX accettati, la sessione viene rilasciata
+    # se la precisione dell'ultima epoca è ancora peggiore di divergence_sd (o non ci sono epoche)
+    divergence_timeout: float = 120.0
+    divergence_sd: float = 1.0
+
+    @classmethod
+    def from_config(cls, *sections: Optional[Dict]) -> 'ConvergenceCriteria':
+        """Combina le sezioni indicate (le successive hanno precedenza) sui valori di default"""
+        names = {f.name for f in fields(cls)}
+        values = {}
+        for section in sections:
+            values.update({k: v for k, v in (section or {}).items() if k in names})
+        return cls(**values)
+
+
+class _RunningStats:
+    """Media e varianza incrementali (algoritmo di Welford)"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float) -> None:
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+
+class ConvergenceTracker:
+    """
+    Valuta epoca per epoca se una sessione è convergente.
+
+    Le epoche FIX che rispettano i limiti di precisione (sdn/sde/sdu), ratio ed età delle
+    correzioni vengono accumulate in statistiche incrementali della posizione; la sessione
+    converge appena ci sono min_fix_epochs epoche con dispersione entro max_spread.
+    Se la dispersione supera il limite il FIX viene considerato errato e le statistiche
+    ripartono dall'ultima epoca. Una sessione senza FIX accettati dopo divergence_timeout
+    secondi e con precisione ancora scarsa (o senza epoche) viene dichiarata divergente.
+    """
+
+    def __init__(self, criteria: Optional[ConvergenceCriteria] = None):
+        self.criteria = criteria or ConvergenceCriteria()
+        self.rejected = 0
+        self.resets = 0
+        self._last_epoch: Optional[Dict] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._lat = _RunningStats()
+        self._lon = _RunningStats()
+        self._alt = _RunningStats()
+
+    @property
+    def accepted(self) -> int:
+        return self._lat.n
+
+    def spread(self) -> float:
+        """Dispersione orizzontale (m) delle posizioni FIX accettate"""
+        lat_m = math.sqrt(self._lat.variance) * math.pi / 180 * EARTH_RADIUS
+        lon_m = math.sqrt(self._lon.variance) * math.pi / 180 * EARTH_RADIUS * math.cos(math.radians(self._lat.mean))
+        return math.hypot(lat_m, lon_m)
+
+    def update(self, sol: Dict, elapsed: float) -> Optional[str]:
+        """
+        Considera una nuova epoca (elapsed: secondi dall'inizio della sessione).
+        Restituisce CONVERGED, DIVERGED o None se serve attendere altre epoche.
+        """
+        c = self.criteria
+        self._last_epoch = sol
+
+        if sol['quality'] == 1:
+            if self._acceptable(sol):
+                self._lat.add(sol['lat'])
+                self._lon.add(sol['lon'])
+                self._alt.add(sol['alt'])
+                if self.accepted >= c.min_fix_epochs:
+                    if self.spread() <= c.max_spread:
+                        return CONVERGED
+                    # Posizioni incoerenti tra loro: FIX errato, si riparte dall'ultima epoca
+                    self.resets += 1
+                    self._reset()
+                    self._lat.add(sol['lat'])
+                    self._lon.add(sol['lon'])
+                    self._alt.add(sol['alt'])
+            else:
+                self.rejected += 1
+
+        return DIVERGED if self.diverged(elapsed) else None
+
+    def diverged(self, elapsed: float) -> bool:
+        """
+        True se dopo divergence_timeout secondi non c'è alcun FIX accettato e l'ultima epoca
+        ha precisione ancora scarsa (o non è arrivata nessuna epoca). Va valutata anche
+        quando non arrivano epoche, es. con lo stream del Rover fermo.
+        """
+        c = self.criteria
+        if self.accepted > 0 or elapsed < c.divergence_timeout:
+            return False
+        return self._last_epoch is None or self._horizontal_sd(self._last_epoch) > c.divergence_sd
+
+    def solution(self) -> Dict:
+        """Posizione media delle epoche FIX accettate (campi dell'ultima epoca per il resto)"""
+        result = dict(self._last_epoch or {})
+        result.update(lat=self._lat.mean, lon=self._lon.mean, alt=self._alt.mean,
+                      quality=1, samples=self.accepted, spread=self.spread())
+        return result
+
+    def _acceptable(self, sol: Dict) -> bool:
+        c = self.criteria
+        if self._horizontal_sd(sol) > c.max_sd_horizontal or sol.get('sdu', 0.0) > c.max_sd_vertical:
+            return False
+        if c.min_ratio and sol.get('ratio', 0.0) < c.min_ratio:
+            return False
+        return sol.get('age', 0.0) <= c.max_age
+
+    @staticmethod
+    def _horizontal_sd(sol: Dict) -> float:
+        return math.hypot(sol.get('sdn', 0.0), sol.get('sde', 0.0))
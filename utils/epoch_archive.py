@@ -0,0 +1,227 @@
+import calendar
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+import numpy as np
+
+DEFAULT_EPOCH_ARCHIVE = Path("data") / "epochs"
+
+# Colonne dell'archivio (nome, dtype little-endian): un file <nome>.bin per colonna e giorno.
+# time è l'etichetta temporale del .pos (GPST, out-timesys) in secondi dal 1970.
+COLUMNS = (
+    ('time', '<f8'),
+    ('lat', '<f8'), ('lon', '<f8'), ('alt', '<f8'),
+    ('quality', 'u1'), ('ns', 'u1'),
+    ('sdn', '<f4'), ('sde', '<f4'), ('sdu', '<f4'),
+    ('sdne', '<f4'), ('sdeu', '<f4'), ('sdun', '<f4'),
+    ('age', '<f4'), ('ratio', '<f4'),
+)
+DTYPES = {name: np.dtype(dtype) for name, dtype in COLUMNS}
+INDEX_FILE = "sessions.ndjson"
+
+TimeLike = Union[float, int, datetime.datetime, datetime.date, None]
+
+
+def _seconds(value: TimeLike) -> Optional[float]:
+    """Secondi dal 1970; un datetime senza fuso è inteso nella stessa scala dell'archivio (GPST)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def _day_name(seconds: float) -> str:
+    return (datetime.date(1970, 1, 1) + datetime.timedelta(days=int(seconds // 86400))).isoformat()
+
+
+class EpochArchive:
+    """
+    Archivio colonnare su disco delle epoche di ogni sessione RTKRCV (tempo, lat/lon/alt,
+    Q, ns, deviazioni standard, età delle correzioni, ratio).
+
+    Struttura: root/<serial>/<AAAA-MM-GG>/<colonna>.bin, array grezzi a dtype fisso (COLUMNS)
+    accodati sessione per sessione, più sessions.ndjson con una riga per sessione (offset,
+    righe, intervallo di tempo, run, Master, esito). L'indice fa da commit: una sessione
+    esiste solo dopo la sua riga, e all'accodamento successivo i byte oltre le righe indicizzate
+    (scrittura interrotta) vengono troncati.
+
+    La lettura usa np.memmap: iter_days() restituisce per ogni giorno le colonne richieste
+    come viste sul file, quindi settimane di dati si possono filtrare e aggregare giorno per
+    giorno senza caricarle in memoria; read() concatena in array ordinari.
+    """
+
+    def __init__(self, root: Path = DEFAULT_EPOCH_ARCHIVE):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    # --- Scrittura ------------------------------------------------------------
+
+    def append(self, serial: str, epochs: Sequence[Dict], run_id: Optional[int] = None,
+               master_id: Optional[str] = None, status: Optional[str] = None) -> int:
+        """
+        Accoda le epoche di una sessione (dict di solution_reader.parse_solution_line).
+        Una sessione a cavallo della mezzanotte viene divisa tra i due giorni con lo stesso
+        id di sessione. Restituisce il numero di epoche scritte.
+        """
+        if not epochs:
+            return 0
+        columns = self._to_columns(epochs)
+        days = (columns['time'] // 86400).astype(np.int64)
+        info = {'session': int(time.time() * 1000), 'run_id': run_id, 'master_id': master_id, 'status': status}
+        with self._lock:
+            for day in np.unique(days):
+                mask = days == day
+                self._append_day(self._serial_dir(serial) / _day_name(day * 86400),
+                                 {name: values[mask] for name, values in columns.items()}, info)
+        return len(epochs)
+
+    @staticmethod
+    def _to_columns(epochs: Sequence[Dict]) -> Dict[str, np.ndarray]:
+        count = len(epochs)
+        # 'AAAA/MM/GG hh:mm:ss.sss' -> datetime64 in blocco, senza strptime per epoca
+        stamps = np.array([e['time'].replace('/', '-').replace(' ', 'T') for e in epochs], dtype='datetime64[ms]')
+        columns = {'time': stamps.astype(np.int64) / 1000.0}
+        for name, dtype in DTYPES.items():
+            if name == 'time':
+                continue
+            missing = 0 if dtype.kind == 'u' else np.nan
+            values = (e.get(name) for e in epochs)
+            columns[name] = np.fromiter((missing if v is None else v for v in values), dtype=dtype, count=count)
+        return columns
+
+    @staticmethod
+    def _append_day(day_dir: Path, part: Dict[str, np.ndarray], info: Dict) -> None:
+        day_dir.mkdir(parents=True, exist_ok=True)
+        index = EpochArchive._load_index(day_dir)
+        offset = sum(entry['rows'] for entry in index)
+        for name, dtype in DTYPES.items():
+            path = day_dir / f"{name}.bin"
+            committed = offset * dtype.itemsize
+            if path.exists() and path.stat().st_size > committed:
+                os.truncate(path, committed)
+            with open(path, 'ab') as f:
+                f.write(part[name].astype(dtype, copy=False).tobytes())
+
+        times, quality = part['time'], part['quality']
+        entry = {**info, 'offset': offset, 'rows': len(times), 't0': float(times[0]), 't1': float(times[-1]),
+                 'fix': int(np.count_nonzero(quality == 1)), 'float': int(np.count_nonzero(quality == 2))}
+        index_path = day_dir / INDEX_FILE
+        with open(index_path, 'ab+') as f:
+            # Riga finale incompleta di una scrittura interrotta: la nuova riga non vi si accoda
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write(json.dumps(entry, separators=(',', ':')).encode() + b'\n')
+
+    def prune(self, max_age: float) -> int:
+        """Rimuove i giorni più vecchi di max_age secondi; restituisce il numero di giorni rimossi"""
+        cutoff = _day_name(time.time() - max_age)
+        removed = 0
+        with self._lock:
+            for serial in self.serials():
+                for day in self.days(serial):
+                    if day < cutoff:
+                        shutil.rmtree(self._serial_dir(serial) / day, ignore_errors=True)
+                        removed += 1
+        return removed
+
+    # --- Lettura --------------------------------------------------------------
+
+    def serials(self) -> List[str]:
+        if not self.root.is_dir():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir())
+
+    def days(self, serial: str) -> List[str]:
+        serial_dir = self._serial_dir(serial)
+        if not serial_dir.is_dir():
+            return []
+        return sorted(p.name for p in serial_dir.iterdir() if (p / INDEX_FILE).exists())
+
+    def sessions(self, serial: str, start: TimeLike = None, end: TimeLike = None) -> List[Dict]:
+        """Righe dell'indice delle sessioni che intersecano [start, end), con il giorno ('day')"""
+        start, end = _seconds(start), _seconds(end)
+        result = []
+        for day in self._days_between(serial, start, end):
+            for entry in self._load_index(self._serial_dir(serial) / day):
+                if (start is None or entry['t1'] >= start) and (end is None or entry['t0'] < end):
+                    result.append({**entry, 'day': day})
+        return result
+
+    def iter_days(self, serial: str, start: TimeLike = None, end: TimeLike = None,
+                  columns: Optional[Sequence[str]] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Per ogni giorno con dati in [start, end) le colonne richieste (default tutte).
+        Se le sessioni del giorno sono in ordine di tempo (il caso normale) gli array sono
+        viste np.memmap in sola lettura: nulla viene letto finché non si accede ai valori.
+        """
+        start, end = _seconds(start), _seconds(end)
+        names = list(columns or DTYPES)
+        unknown = set(names) - set(DTYPES)
+        if unknown:
+            raise ValueError(f"Colonne sconosciute: {sorted(unknown)}. Valide: {list(DTYPES)}")
+        for day in self._days_between(serial, start, end):
+            day_dir = self._serial_dir(serial) / day
+            index = self._load_index(day_dir)
+            rows = sum(entry['rows'] for entry in index)
+            if not rows:
+                continue
+            times = self._column(day_dir, 'time', rows)
+            ordered = all(a['t1'] <= b['t0'] for a, b in zip(index, index[1:]))
+            if ordered:
+                lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+                hi = rows if end is None else int(np.searchsorted(times, end, side='left'))
+                if lo >= hi:
+                    continue
+                yield {name: self._column(day_dir, name, rows)[lo:hi] for name in names}
+            else:
+                mask = np.ones(rows, dtype=bool)
+                if start is not None:
+                    mask &= times >= start
+                if end is not None:
+                    mask &= times < end
+                if mask.any():
+                    yield {name: self._column(day_dir, name, rows)[mask] for name in names}
+
+    def read(self, serial: str, start: TimeLike = None, end: TimeLike = None,
+             columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """Colonne di [start, end) concatenate in array in memoria (per intervalli brevi)"""
+        names = list(columns or DTYPES)
+        chunks = list(self.iter_days(serial, start, end, names))
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) if chunks
+                else np.empty(0, dtype=DTYPES[name]) for name in names}
+
+    def _serial_dir(self, serial: str) -> Path:
+        # Il seriale diventa un nome di directory: niente separatori di percorso
+        return self.root / serial.replace('/', '_').replace('\\', '_')
+
+    def _days_between(self, serial: str, start: Optional[float], end: Optional[float]) -> List[str]:
+        first = _day_name(start) if start is not None else None
+        last = _day_name(end) if end is not None else None
+        return [day for day in self.days(serial)
+                if (first is None or day >= first) and (last is None or day <= last)]
+
+    @staticmethod
+    def _column(day_dir: Path, name: str, rows: int) -> np.ndarray:
+        return np.memmap(day_dir / f"{name}.bin", dtype=DTYPES[name], mode='r', shape=(rows,))
+
+    @staticmethod
+    def _load_index(day_dir: Path) -> List[Dict]:
+        entries = []
+        try:
+            with open(day_dir / INDEX_FILE, 'r') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue  # riga interrotta: la sessione non è mai stata registrata
+        except FileNotFoundError:
+            pass
+        return entries
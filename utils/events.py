@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from utils.session_log import write_line
+
+# Le righe evento su stdout iniziano con questo prefisso seguito dall'evento in JSON
+EVENT_PREFIX = '@event '
+
+# Tipi di evento
+RUN_STARTED = 'run_started'
+RUN_FINISHED = 'run_finished'        # wall_time, completed, status
+PROBE = 'probe'                      # serial, role, protocol
+MASTER_SAMPLE = 'master_sample'      # serial, n, target, lat, lon, alt
+MASTER_POSITION = 'master_position'  # serial, lat, lon, alt, source
+ASSIGNED = 'assigned'                # serial, master, distance (m, None se ignota)
+SESSION_STARTED = 'session_started'  # serial, pid, pooled, worker (solo sessioni remote)
+EPOCH = 'epoch'                      # serial, quality, lat, lon, alt, ns, ratio, remaining
+FIX_SAMPLE = 'fix_sample'            # serial, n, target
+SOLUTION = 'solution'                # serial, status, lat, lon, alt
+TIMING = 'timing'                    # serial, name, seconds
+SESSION_RESOURCES = 'session_resources'  # serial, cpu_seconds, cpu_percent, peak_rss_mb, wall_time
+ERROR = 'error'                      # serial, message
+ALERT = 'alert'                      # serial, horizontal, vertical
+PHASE = 'phase'                      # serial (opzionale), name, seconds, ok (vedi utils.metrics.phase)
+
+_listeners: List[Callable[[Dict], None]] = []
+_listeners_lock = threading.Lock()
+# Con listener in-process registrati le righe su stdout non servono più (vedi set_stdout)
+_stdout_enabled = True
+
+
+def add_listener(listener: Callable[[Dict], None]) -> None:
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[Dict], None]) -> None:
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def set_stdout(enabled: bool) -> None:
+    """Abilita/disabilita la scrittura degli eventi su stdout (protocollo verso la dashboard)"""
+    global _stdout_enabled
+    _stdout_enabled = enabled
+
+
+def emit(event_type: str, serial: Optional[str] = None, **fields) -> Dict:
+    """
+    Emette un evento tipizzato: una riga '@event {json}' su stdout, letta dalla dashboard
+    quando il manager gira come sottoprocesso, e i listener registrati nello stesso processo.
+    """
+    event = {'type': event_type, 'ts': time.time()}
+    if serial is not None:
+        event['serial'] = serial
+    event.update(fields)
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(event)
+        except Exception:
+            pass
+    if _stdout_enabled:
+        write_line(EVENT_PREFIX + json.dumps(event, separators=(',', ':')))
+    return event
+
+
+def parse_event(line: str) -> Optional[Dict]:
+    """Evento contenuto in una riga di output, None se la riga è testo normale"""
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(EVENT_PREFIX):])
+    except ValueError:
+        return None
+
+
+class StatusBoard:
+    """
+    Stato corrente per ricevitore, aggiornato evento per evento.
+    snapshot() non rilegge il log: costa come il numero di ricevitori, non come la durata del run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._receivers: Dict[str, Dict] = {}
+            self._run: Dict = {'state': 'idle'}
+
+    def apply(self, event: Dict) -> None:
+        kind = event.get('type')
+        with self._lock:
+            if kind == RUN_STARTED:
+                self._receivers = {}
+                self._run = {'state': 'running', 'started': event['ts']}
+                return
+            if kind == RUN_FINISHED:
+                self._run.update(state='finished', finished=event['ts'],
+                                 wall_time=event.get('wall_time'))
+                return
+
+            serial = event.get('serial')
+            if serial is None:
+                return
+            rcv = self._receivers.setdefault(serial, {'state': 'pending'})
+            rcv['updated'] = event['ts']
+
+            if kind == PROBE:
+                rcv.update(role=event.get('role'), protocol=event.get('protocol'))
+                if event.get('protocol') in ('ERROR', 'TIMEOUT', 'SSH'):
+                    rcv['state'] = 'unreachable'
+            elif kind == MASTER_SAMPLE:
+                rcv.update(role='master', state='acquiring', samples=event['n'], target=event['target'])
+            elif kind == MASTER_POSITION:
+                rcv.update(role='master', state='positioned', lat=event['lat'], lon=event['lon'],
+                           alt=event['alt'], source=event.get('source'))
+            elif kind == ASSIGNED:
+                rcv.update(role='rover', master=event['master'], master_distance=event.get('distance'))
+            elif kind == SESSION_STARTED:
+                rcv.update(role='rover', state='running', pid=event.get('pid'), worker=event.get('worker'), fix_samples=0)
+            elif kind == EPOCH:
+                rcv.update(quality=event['quality'], lat=event['lat'], lon=event['lon'], alt=event['alt'],
+                           ns=event.get('ns'), ratio=event.get('ratio'), remaining=event.get('remaining'))
+                rcv['state'] = {1: 'fix', 2: 'float'}.get(event['quality'], 'running')
+            elif kind == FIX_SAMPLE:
+                rcv.update(fix_samples=event['n'], fix_target=event['target'])
+            elif kind == TIMING:
+                rcv.setdefault('timings', {})[event['name']] = event['seconds']
+            elif kind == SESSION_RESOURCES:
+                rcv['resources'] = {k: event.get(k) for k in ('cpu_seconds', 'cpu_percent', 'peak_rss_mb')}
+            elif kind == SOLUTION:
+                rcv.update(state='solved', status=event['status'], lat=event['lat'], lon=event['lon'],
+                           alt=event['alt'])
+            elif kind == ERROR:
+                rcv.update(state='error', message=event.get('message'))
+            elif kind == ALERT:
+                rcv.update(alert={'horizontal': event['horizontal'], 'vertical': event['vertical'],
+                                  'ts': event['ts']})
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            receivers = {}
+            for serial, state in self._receivers.items():
+                receivers[serial] = dict(state)
+                if 'timings' in state:
+                    receivers[serial]['timings'] = dict(state['timings'])
+            return {'run': dict(self._run), 'receivers': receivers}
@@ -0,0 +1,264 @@
+import csv
+import datetime
+import io
+import json
+import os
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from xml.sax.saxutils import escape
+from models.receiver import Ricevitore
+
+# Campi di un record esportato (placemark): name, description, lat, lon, alt, style, serial, role, status
+CSV_FIELDS = ['serial', 'role', 'status', 'lat', 'lon', 'alt', 'name']
+
+
+def receiver_record(rcv: Ricevitore) -> Optional[Dict]:
+    """Record di esportazione di un ricevitore (None se non ha coordinate)"""
+    if not rcv.has_coordinates():
+        return None
+    coords = rcv.get_coordinates()
+
+    if rcv.role == 'master':
+        description = "Role: Master"
+    else:
+        description = f"""Role: Rover
+Master: {rcv.linked_master_id if rcv.linked_master_id else 'N/A'}
+Solution: {rcv.sol_status if rcv.sol_status else 'N/A'}"""
+    description += f"""
+Lat: {coords['lat']}
+Lon: {coords['lon']}
+Alt: {coords['alt']}"""
+
+    return {
+        'name': f"{rcv.serial_number} ({rcv.role})",
+        'description': description,
+        'lat': coords['lat'],
+        'lon': coords['lon'],
+        'alt': coords['alt'],
+        'style': "#masterStyle" if rcv.role == 'master' else "#roverStyle",
+        'serial': rcv.serial_number,
+        'role': rcv.role,
+        'status': rcv.sol_status,
+    }
+
+
+def receiver_records(receivers: Iterable[Ricevitore]) -> Iterable[Dict]:
+    """Record dei ricevitori con coordinate, generati uno alla volta"""
+    for rcv in receivers:
+        record = receiver_record(rcv)
+        if record is not None:
+            yield record
+
+
+class Exporter:
+    """
+    Esportazione incrementale su file: begin() all'apertura, write() per ogni record,
+    end() alla chiusura. Nessun record viene trattenuto in memoria, quindi il consumo è
+    costante qualunque sia il numero di ricevitori o di epoche. Il file viene scritto
+    accanto (.tmp) e sostituito atomicamente solo a esportazione completata.
+    """
+
+    extension = ''
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.count = 0
+        self._tmp_path = self.path.with_name(self.path.name + '.tmp')
+        self._f = None
+
+    def open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self._open_stream()
+        self.begin()
+
+    def write(self, record: Dict) -> None:
+        self.count += 1
+
+    def close(self) -> None:
+        self.end()
+        self._close_stream()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        """Chiude il file parziale e lo elimina (il file di destinazione resta invariato)"""
+        try:
+            if self._f is not None:
+                self._close_stream()
+        finally:
+            self._tmp_path.unlink(missing_ok=True)
+
+    def begin(self) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def _open_stream(self):
+        return open(self._tmp_path, 'w', encoding='utf-8', newline='')
+
+    def _close_stream(self) -> None:
+        self._f.close()
+        self._f = None
+
+
+class KMLExporter(Exporter):
+    """KML con stile Master/Rover; nomi e descrizioni sono escapati come testo XML"""
+
+    extension = 'kml'
+
+    HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+  <Document>
+    <name>RTK Receiver Coordinates</name>
+    <description>Generated by RTK Manager on {timestamp}</description>
+    <Style id="masterStyle">
+      <IconStyle>
+        <color>ff0000ff</color>
+        <scale>1.1</scale>
+        <Icon>
+          <href>http://maps.google.com/mapfiles/kml/paddle/red-stars.png</href>
+        </Icon>
+      </IconStyle>
+    </Style>
+    <Style id="roverStyle">
+      <IconStyle>
+        <color>ff00ff00</color>
+        <scale>1.1</scale>
+        <Icon>
+          <href>http://maps.google.com/mapfiles/kml/paddle/grn-circle.png</href>
+        </Icon>
+      </IconStyle>
+    </Style>"""
+
+    FOOTER = """
+  </Document>
+</kml>"""
+
+    def begin(self) -> None:
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._f.write(self.HEADER.format(timestamp=timestamp))
+
+    def write(self, record: Dict) -> None:
+        super().write(record)
+        self._f.write(f"""
+    <Placemark>
+      <name>{escape(record['name'])}</name>
+      <description>{escape(record.get('description', ''))}</description>
+      <styleUrl>{escape(record.get('style', ''))}</styleUrl>
+      <Point>
+        <coordinates>{record['lon']},{record['lat']},{record['alt']}</coordinates>
+      </Point>
+    </Placemark>""")
+
+    def end(self) -> None:
+        self._f.write(self.FOOTER)
+
+
+class KMZExporter(KMLExporter):
+    """KML compresso (doc.kml in un archivio zip), scritto in streaming nell'archivio"""
+
+    extension = 'kmz'
+
+    def _open_stream(self):
+        self._zip = zipfile.ZipFile(self._tmp_path, 'w', compression=zipfile.ZIP_DEFLATED)
+        return io.TextIOWrapper(self._zip.open('doc.kml', 'w'), encoding='utf-8', newline='')
+
+    def _close_stream(self) -> None:
+        try:
+            super()._close_stream()
+        finally:
+            self._zip.close()
+
+
+class GeoJSONExporter(Exporter):
+    """FeatureCollection di Point (caricabile direttamente con L.geoJSON in Leaflet)"""
+
+    extension = 'geojson'
+
+    def begin(self) -> None:
+        self._f.write('{"type":"FeatureCollection","features":[')
+
+    def write(self, record: Dict) -> None:
+        if self.count:
+            self._f.write(',')
+        super().write(record)
+        properties = {k: v for k, v in record.items() if k not in ('lat', 'lon', 'alt')}
+        feature = {'type': 'Feature',
+                   'geometry': {'type': 'Point', 'coordinates': [record['lon'], record['lat'], record['alt']]},
+                   'properties': properties}
+        self._f.write('\n' + json.dumps(feature, separators=(',', ':')))
+
+    def end(self) -> None:
+        self._f.write('\n]}\n')
+
+
+class CSVExporter(Exporter):
+    """CSV con intestazione (CSV_FIELDS); i campi mancanti restano vuoti"""
+
+    extension = 'csv'
+
+    def __init__(self, path: Path, fields: List[str] = None):
+        super().__init__(path)
+        self.fields = fields or CSV_FIELDS
+
+    def begin(self) -> None:
+        self._writer = csv.DictWriter(self._f, fieldnames=self.fields, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, record: Dict) -> None:
+        super().write(record)
+        self._writer.writerow(record)
+
+
+class NDJSONExporter(Exporter):
+    """Un oggetto JSON per riga"""
+
+    extension = 'ndjson'
+
+    def write(self, record: Dict) -> None:
+        super().write(record)
+        self._f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+EXPORTERS = {cls.extension: cls for cls in (KMLExporter, KMZExporter, GeoJSONExporter, CSVExporter, NDJSONExporter)}
+
+
+def export(records: Iterable[Dict], exporters: List[Exporter]) -> int:
+    """
+    Scrive records su tutti gli exporter in un solo passaggio (records può essere un
+    generatore). In caso di errore i file parziali vengono eliminati. Restituisce il
+    numero di record esportati.
+    """
+    opened: List[Exporter] = []
+    try:
+        for exporter in exporters:
+            exporter.open()
+            opened.append(exporter)
+        count = 0
+        for record in records:
+            for exporter in opened:
+                exporter.write(record)
+            count += 1
+        for exporter in opened:
+            exporter.close()
+        return count
+    except BaseException:
+        for exporter in opened:
+            try:
+                exporter.abort()
+            except OSError:
+                pass
+        raise
+
+
+def export_files(records: Iterable[Dict], base_path: Path, formats: Iterable[str]) -> Dict[str, Path]:
+    """Esporta records in base_path.<estensione> per ogni formato; restituisce {formato: percorso}"""
+    base_path = Path(base_path)
+    exporters = []
+    for fmt in dict.fromkeys(formats):
+        if fmt not in EXPORTERS:
+            raise ValueError(f"Formato di esportazione non valido '{fmt}'. Validi: {list(EXPORTERS)}")
+        exporters.append(EXPORTERS[fmt](base_path.with_name(f"{base_path.name}.{fmt}")))
+    export(records, exporters)
+    return {exporter.extension: exporter.path for exporter in exporters}
@@ -0,0 +1,175 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+UBX_SYNC = b'\xb5\x62'
+RTCM3_PREAMBLE = 0xD3
+# Limiti di plausibilità: oltre, la sync word è quasi certamente un falso positivo
+UBX_MAX_PAYLOAD = 8192
+NMEA_MAX_LENGTH = 256
+
+# Nomi dei messaggi UBX più comuni (classe, id)
+UBX_MESSAGE_NAMES = {
+    (0x01, 0x07): 'NAV-PVT',
+    (0x01, 0x14): 'NAV-HPPOSLLH',
+    (0x01, 0x35): 'NAV-SAT',
+    (0x01, 0x3C): 'NAV-RELPOSNED',
+    (0x02, 0x13): 'RXM-SFRBX',
+    (0x02, 0x15): 'RXM-RAWX',
+    (0x05, 0x00): 'ACK-NAK',
+    (0x05, 0x01): 'ACK-ACK',
+    (0x0A, 0x04): 'MON-VER',
+}
+
+
+def _crc24q_table() -> List[int]:
+    table = []
+    for i in range(256):
+        crc = i << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+        table.append(crc & 0xFFFFFF)
+    return table
+
+
+_CRC24Q_TABLE = _crc24q_table()
+
+
+def crc24q(data: bytes) -> int:
+    """CRC-24Q usato dai frame RTCM3"""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFF) ^ _CRC24Q_TABLE[(crc >> 16) ^ byte]
+    return crc
+
+
+def ubx_checksum(data: bytes) -> bytes:
+    """Checksum Fletcher a 8 bit di UBX (su classe, id, lunghezza e payload)"""
+    ck_a = ck_b = 0
+    for byte in data:
+        ck_a = (ck_a + byte) & 0xFF
+        ck_b = (ck_b + ck_a) & 0xFF
+    return bytes((ck_a, ck_b))
+
+
+@dataclass
+class Frame:
+    """Frame valido riconosciuto nello stream"""
+    protocol: str  # 'UBX', 'RTCM3', 'NMEA'
+    message: str   # es. 'RXM-RAWX', '1077', 'GNGGA'
+    length: int
+
+
+@dataclass
+class FramerStats:
+    frames: Counter = field(default_factory=Counter)      # per protocollo
+    messages: Counter = field(default_factory=Counter)    # per 'PROTO message'
+    bytes_framed: int = 0
+    bytes_skipped: int = 0
+
+
+class GNSSFramer:
+    """
+    Framer incrementale per stream misti UBX / RTCM3 / NMEA.
+
+    Cerca le sync word (0xB5 0x62, 0xD3, '$'), valida ogni candidato con il relativo
+    controllo (Fletcher UBX, CRC-24Q RTCM3, checksum NMEA) e in caso di errore avanza
+    di un byte per risincronizzarsi. Funziona anche se la connessione inizia a metà frame.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.stats = FramerStats()
+
+    def feed(self, data: bytes) -> List[Frame]:
+        buffer = self._buffer
+        buffer += data
+        frames: List[Frame] = []
+        pos = 0
+        size = len(buffer)
+
+        while pos < size:
+            byte = buffer[pos]
+            if byte == 0xB5:
+                result = self._try_ubx(buffer, pos)
+            elif byte == RTCM3_PREAMBLE:
+                result = self._try_rtcm3(buffer, pos)
+            elif byte == 0x24:  # '$'
+                result = self._try_nmea(buffer, pos)
+            else:
+                result = -1
+
+            if result is None:
+                break  # frame potenzialmente valido ma incompleto: attende altri byte
+            if isinstance(result, Frame):
+                frames.append(result)
+                self.stats.frames[result.protocol] += 1
+                self.stats.messages[f"{result.protocol} {result.message}"] += 1
+                self.stats.bytes_framed += result.length
+                pos += result.length
+            else:
+                self.stats.bytes_skipped += 1
+                pos += 1
+
+        del buffer[:pos]
+        return frames
+
+    @staticmethod
+    def _try_ubx(buffer: bytearray, pos: int):
+        if len(buffer) - pos < 6:
+            return None if buffer[pos:pos + 2] in (b'\xb5', UBX_SYNC) else -1
+        if buffer[pos + 1] != 0x62:
+            return -1
+        length = buffer[pos + 4] | (buffer[pos + 5] << 8)
+        if length > UBX_MAX_PAYLOAD:
+            return -1
+        total = 6 + length + 2
+        if len(buffer) - pos < total:
+            return None
+        body = bytes(buffer[pos + 2:pos + 6 + length])
+        if ubx_checksum(body) != bytes(buffer[pos + 6 + length:pos + total]):
+            return -1
+        msg_class, msg_id = body[0], body[1]
+        name = UBX_MESSAGE_NAMES.get((msg_class, msg_id), f"{msg_class:02X}-{msg_id:02X}")
+        return Frame('UBX', name, total)
+
+    @staticmethod
+    def _try_rtcm3(buffer: bytearray, pos: int):
+        if len(buffer) - pos < 3:
+            return None
+        if buffer[pos + 1] & 0xFC:
+            return -1  # i 6 bit riservati devono essere zero
+        length = ((buffer[pos + 1] & 0x03) << 8) | buffer[pos + 2]
+        total = 3 + length + 3
+        if len(buffer) - pos < total:
+            return None
+        frame = bytes(buffer[pos:pos + total])
+        if crc24q(frame[:-3]) != int.from_bytes(frame[-3:], 'big'):
+            return -1
+        message_type = (frame[3] << 4) | (frame[4] >> 4) if length >= 2 else 0
+        return Frame('RTCM3', str(message_type), total)
+
+    @staticmethod
+    def _try_nmea(buffer: bytearray, pos: int):
+        end = buffer.find(b'\n', pos, pos + NMEA_MAX_LENGTH)
+        if end < 0:
+            return None if len(buffer) - pos < NMEA_MAX_LENGTH else -1
+        sentence = bytes(buffer[pos:end]).rstrip(b'\r')
+        star = sentence.rfind(b'*')
+        if star < 0 or len(sentence) < star + 3:
+            return -1
+        checksum = 0
+        for byte in sentence[1:star]:
+            checksum ^= byte
+        try:
+            if checksum != int(sentence[star + 1:star + 3], 16):
+                return -1
+        except ValueError:
+            return -1
+        address = sentence[1:star].split(b',', 1)[0].decode('ascii', errors='replace')
+        return Frame('NMEA', address, end + 1 - pos)
+
+    def protocol_counts(self) -> Dict[str, int]:
+        return dict(self.stats.frames)
@@ -1,76 +1,56 @@
+import json
+import os
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, List, Optional
 from models.receiver import Ricevitore
+from utils.exporters import KMLExporter, export, export_files, receiver_record, receiver_records
+from utils.metrics import phase
 import datetime
 
+# Risultati dell'ultimo run in JSON, accanto ai KML (vedi KMLWriter.write_json)
+RESULTS_JSON = "results.json"
+
 class KMLWriter:
-    """Gestisce la scrittura di file KML per le coordinate dei ricevitori"""
-    
-    TEMPLATE_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
-<kml xmlns="http://www.opengis.net/kml/2.2">
-  <Document>
-    <name>RTK Receiver Coordinates</name>
-    <description>Generated by RTK Manager on {timestamp}</description>
-    <Style id="masterStyle">
-      <IconStyle>
-        <color>ff0000ff</color>
-        <scale>1.1</scale>
-        <Icon>
-          <href>http://maps.google.com/mapfiles/kml/paddle/red-stars.png</href>
-        </Icon>
-      </IconStyle>
-    </Style>
-    <Style id="roverStyle">
-      <IconStyle>
-        <color>ff00ff00</color>
-        <scale>1.1</scale>
-        <Icon>
-          <href>http://maps.google.com/mapfiles/kml/paddle/grn-circle.png</href>
-        </Icon>
-      </IconStyle>
-    </Style>"""
+    """Gestisce la scrittura di file KML (e degli altri formati di utils/exporters.py) per i ricevitori"""
+
+    TEMPLATE_HEADER = KMLExporter.HEADER
+    TEMPLATE_FOOTER = KMLExporter.FOOTER
 
-    TEMPLATE_FOOTER = """
-  </Document>
-</kml>"""
+    @staticmethod
+    def placemark(rcv: Ricevitore) -> Optional[Dict]:
+        """Dati del placemark di un ricevitore (None se non ha coordinate), condivisi da tutti i formati"""
+        return receiver_record(rcv)
 
     @staticmethod
     def write(receivers: List[Ricevitore], output_path: Path) -> None:
         """Scrive le coordinate dei ricevitori su file KML"""
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(KMLWriter.TEMPLATE_HEADER.format(timestamp=timestamp))
-            
-            for rcv in receivers:
-                if not rcv.has_coordinates():
-                    continue
-                    
-                style = "masterStyle" if rcv.role == 'master' else "roverStyle"
-                coords = rcv.get_coordinates()
-                
-                # Build description
-                description = ""
-                if rcv.role == 'master':
-                    description = "Role: Master"
-                else:
-                    description = f"""Role: Rover
-Master: {rcv.linked_master_id if rcv.linked_master_id else 'N/A'}
-Solution: {rcv.sol_status if rcv.sol_status else 'N/A'}"""
-
-                f.write(f"""
-    <Placemark>
-      <name>{rcv.serial_number} ({rcv.role})</name>
-      <description>{description}
-Lat: {coords['lat']}
-Lon: {coords['lon']}
-Alt: {coords['alt']}</description>
-      <styleUrl>#{style}</styleUrl>
-      <Point>
-        <coordinates>{coords['lon']},{coords['lat']},{coords['alt']}</coordinates>
-      </Point>
-    </Placemark>""")
-                
-            f.write(KMLWriter.TEMPLATE_FOOTER)
-        
+        with phase('export'):
+            export(receiver_records(receivers), [KMLExporter(output_path)])
         print(f"File KML creato: {output_path}")
+
+    @staticmethod
+    def write_all(receivers: Iterable[Ricevitore], base_path: Path, formats: Iterable[str]) -> Dict[str, Path]:
+        """
+        Esporta i ricevitori in tutti i formati richiesti ('kml', 'kmz', 'geojson', 'csv',
+        'ndjson') con un solo passaggio: base_path senza estensione, es. output/output_<ts>.
+        """
+        with phase('export'):
+            paths = export_files(receiver_records(receivers), base_path, formats)
+        for fmt, path in paths.items():
+            print(f"File {fmt.upper()} creato: {path}")
+        return paths
+
+    @staticmethod
+    def write_json(receivers: List[Ricevitore], output_path: Path, kml_file: str = '') -> None:
+        """
+        Scrive gli stessi placemark del KML in JSON, già nel formato servito da /api/kml/json
+        ({"placemarks": [...], "file": ...}): la dashboard non deve più rileggere il KML.
+        La sostituzione è atomica, un lettore non vede mai un file scritto a metà.
+        """
+        placemarks = list(receiver_records(receivers))
+        data = {'placemarks': placemarks, 'file': kml_file,
+                'generated': datetime.datetime.now().isoformat(timespec='seconds')}
+        tmp_path = output_path.with_name(output_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, output_path)
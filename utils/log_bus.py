@@ -0,0 +1,100 @@
+import threading
+from collections import deque
+from typing import List, Optional, Tuple
+
+# Righe speciali pubblicate sul bus
+END_OF_STREAM = '[PROCESS_END]'
+
+
+class SubscriberDropped(Exception):
+    """Il sottoscrittore è rimasto indietro oltre la capacità del buffer"""
+
+
+class LogBus:
+    """
+    Bus publish/subscribe per le righe di log del processo, con buffer circolare limitato.
+
+    Ogni riga riceve un id crescente. I sottoscrittori non hanno code proprie: ciascuno
+    mantiene solo un cursore (l'ultimo id letto) sul buffer comune, quindi il produttore
+    non si blocca mai e la memoria è limitata a capacity righe qualunque sia il numero di
+    client. Un client che si riconnette riparte dal suo Last-Event-ID; un client così lento
+    che le righe non lette sono già uscite dal buffer viene disconnesso.
+    """
+
+    def __init__(self, capacity: int = 5000):
+        self._lines: deque = deque(maxlen=capacity)  # (id, riga)
+        self._next_id = 1
+        # Le righe con id inferiore sono state rimosse da clear(), non perse per lentezza
+        self._history_start = 1
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self) -> int:
+        return self._next_id - 1
+
+    def publish(self, line: str) -> int:
+        with self._cond:
+            event_id = self._next_id
+            self._next_id += 1
+            self._lines.append((event_id, line))
+            self._cond.notify_all()
+        return event_id
+
+    def end(self) -> int:
+        """Segnala ai sottoscrittori la fine del processo"""
+        return self.publish(END_OF_STREAM)
+
+    def clear(self) -> None:
+        """Svuota la cronologia (nuovo processo); gli id restano crescenti"""
+        with self._cond:
+            self._lines.clear()
+            self._history_start = self._next_id
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> 'Subscription':
+        """
+        Nuovo sottoscrittore. Senza last_event_id riceve tutta la cronologia disponibile,
+        altrimenti solo le righe successive a quell'id.
+        """
+        cursor = last_event_id or 0
+        if cursor > self.last_id:
+            cursor = 0  # id di un'istanza precedente del server: si riparte dalla cronologia
+        return Subscription(self, cursor)
+
+    def _read_after(self, cursor: int, timeout: float) -> Tuple[List[Tuple[int, str]], int]:
+        """Righe con id > cursor (attende al più timeout secondi); restituisce anche le righe perse"""
+        with self._cond:
+            if self._next_id - 1 <= cursor:
+                self._cond.wait(timeout)
+            if not self._lines or self._lines[-1][0] <= cursor:
+                return [], 0
+            first_id = self._lines[0][0]
+            lost = max(0, first_id - max(cursor + 1, self._history_start))
+            start = max(0, cursor + 1 - first_id)
+            return [self._lines[i] for i in range(start, len(self._lines))], lost
+
+
+class Subscription:
+    """Cursore di un client sul LogBus"""
+
+    def __init__(self, bus: LogBus, cursor: int):
+        self.bus = bus
+        self.cursor = cursor
+        # Righe non più disponibili al momento della riconnessione
+        self.gap = 0
+        self._started = False
+
+    def read(self, timeout: float = 30.0) -> List[Tuple[int, str]]:
+        """
+        Righe nuove (id, riga) in ordine; lista vuota se non ne arrivano entro timeout.
+        Solleva SubscriberDropped se alcune righe non lette sono già uscite dal buffer:
+        alla prima lettura (riconnessione) si riparte invece dalla riga più vecchia disponibile.
+        """
+        lines, lost = self.bus._read_after(self.cursor, timeout)
+        if lost and self._started:
+            raise SubscriberDropped(f"{lost} righe perse")
+        if not self._started and self.cursor:
+            self.gap = lost
+        self._started = True
+        if lines:
+            self.cursor = lines[-1][0]
+        return lines
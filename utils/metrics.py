@@ -0,0 +1,247 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from utils import events
+
+# Bucket (s) degli istogrammi: fasi brevi (verifica, avvio RTKRCV, export), convergenza, run completi
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+CONVERGENCE_BUCKETS = (5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+RUN_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+LabelValues = Tuple[str, ...]
+
+
+@contextmanager
+def phase(name: str, serial: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Misura una fase del workflow ed emette l'evento PHASE (name, seconds, ok).
+    Il chiamante imposta outcome['ok'] = False per un esito negativo; un'eccezione
+    conta come fallimento.
+
+        with phase('master_acquisition', master.serial_number) as outcome:
+            outcome['ok'] = master.read_nmea_position()
+    """
+    outcome = {'ok': True}
+    start = time.monotonic()
+    try:
+        yield outcome
+    except BaseException:
+        outcome['ok'] = False
+        raise
+    finally:
+        events.emit(events.PHASE, serial, name=name, seconds=round(time.monotonic() - start, 3),
+                    ok=bool(outcome['ok']))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Righe dei campioni nel formato di esposizione Prometheus (chiamata con _lock acquisito)"""
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        # Una metrica senza label esiste (a 0) anche prima della prima osservazione
+        self._values: Dict[LabelValues, float] = {} if self.labels else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Istogramma cumulativo (bucket 'le', _sum, _count) come da formato di esposizione Prometheus"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = PHASE_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per serie: conteggi per bucket (non cumulativi, l'ultimo è +Inf), somma
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        if not self.labels:
+            self._series[()] = ([0] * (len(self.buckets) + 1), [0.0])
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RunMetrics:
+    """
+    Metriche dei run ricavate dagli eventi strutturati (utils/events.py), aggiornate
+    evento per evento come StatusBoard: funziona allo stesso modo con il run in-process
+    (listener) e con main.py come sottoprocesso (righe '@event').
+
+    Il throughput si ottiene da rtk_solutions_total (es. rate(...[1h]) * 3600 Rover/ora);
+    rtk_last_run_rovers_per_hour riporta quello dell'ultimo run concluso.
+    """
+
+    def __init__(self):
+        self.registry = Registry()
+        r = self.registry.register
+        self.runs = r(Counter('rtk_runs_total', "Run conclusi per esito", ['outcome']))
+        self.run_duration = r(Histogram('rtk_run_duration_seconds', "Durata dei run", buckets=RUN_BUCKETS))
+        self.run_in_progress = r(Gauge('rtk_run_in_progress', "1 se un run è in corso"))
+        self.last_run_throughput = r(Gauge('rtk_last_run_rovers_per_hour', "Rover risolti all'ora nell'ultimo run"))
+        self.phase_duration = r(Histogram('rtk_phase_duration_seconds',
+                                          "Durata delle fasi (verification, master_acquisition, rtkrcv_start, "
+                                          "rtkrcv_session, rtkrcv_stop, export)", ['phase']))
+        self.phase_failures = r(Counter('rtk_phase_failures_total', "Fasi concluse con esito negativo", ['phase']))
+        self.sessions = r(Counter('rtk_sessions_total', "Sessioni RTKRCV per esito", ['outcome']))
+        self.sessions_active = r(Gauge('rtk_sessions_active', "Sessioni RTKRCV in corso"))
+        self.solutions = r(Counter('rtk_solutions_total', "Soluzioni Rover calcolate per stato", ['status']))
+        self.time_to_first_float = r(Histogram('rtk_time_to_first_float_seconds',
+                                               "Tempo dall'avvio di RTKRCV alla prima epoca FLOAT",
+                                               buckets=CONVERGENCE_BUCKETS))
+        self.time_to_fix = r(Histogram('rtk_time_to_fix_seconds', "Tempo dall'avvio di RTKRCV alla prima epoca FIX",
+                                       buckets=CONVERGENCE_BUCKETS))
+        self.time_to_solution = r(Histogram('rtk_time_to_solution_seconds',
+                                            "Tempo dall'avvio di RTKRCV alla soluzione accettata",
+                                            buckets=CONVERGENCE_BUCKETS))
+        self.session_cpu = r(Counter('rtk_session_cpu_seconds_total', "Tempo CPU consumato dai processi RTKRCV"))
+        self.errors = r(Counter('rtk_errors_total', "Eventi di errore"))
+        self.alerts = r(Counter('rtk_alerts_total', "Allarmi di spostamento in monitoraggio"))
+        self._run_solutions = 0
+
+    def apply(self, event: Dict) -> None:
+        kind = event.get('type')
+        if kind == events.RUN_STARTED:
+            self.run_in_progress.set(1)
+            self.sessions_active.set(0)
+            self._run_solutions = 0
+        elif kind == events.RUN_FINISHED:
+            self.run_in_progress.set(0)
+            self.sessions_active.set(0)
+            wall_time = event.get('wall_time') or 0.0
+            completed = event.get('completed')
+            outcome = event.get('status') or ('completed' if completed or completed is None else 'interrupted')
+            self.runs.inc(outcome=outcome)
+            self.run_duration.observe(wall_time)
+            if wall_time > 0:
+                self.last_run_throughput.set(round(self._run_solutions * 3600 / wall_time, 2))
+        elif kind == events.PHASE:
+            name = event.get('name', '')
+            self.phase_duration.observe(event.get('seconds', 0.0), phase=name)
+            if not event.get('ok', True):
+                self.phase_failures.inc(phase=name)
+            if name == 'rtkrcv_session':
+                self.sessions.inc(outcome='solved' if event.get('ok', True) else 'failed')
+            elif name == 'rtkrcv_stop':
+                self.sessions_active.dec()
+        elif kind == events.SESSION_STARTED:
+            self.sessions_active.inc()
+        elif kind == events.TIMING:
+            histogram = {'first_float': self.time_to_first_float, 'first_fix': self.time_to_fix,
+                         'solution': self.time_to_solution}.get(event.get('name'))
+            if histogram is not None:
+                histogram.observe(event.get('seconds', 0.0))
+        elif kind == events.SOLUTION:
+            # Le soluzioni riprese dall'archivio non sono lavoro di questo run
+            if event.get('source') != 'archive':
+                self.solutions.inc(status=event.get('status') or 'UNKNOWN')
+                self._run_solutions += 1
+        elif kind == events.SESSION_RESOURCES:
+            self.session_cpu.inc(event.get('cpu_seconds') or 0.0)
+        elif kind == events.ERROR:
+            self.errors.inc()
+        elif kind == events.ALERT:
+            self.alerts.inc()
+
+    def render(self) -> str:
+        return self.registry.render()
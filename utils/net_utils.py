@@ -0,0 +1,11 @@
+import socket
+
+
+def find_free_port(host: str = '127.0.0.1') -> int:
+    """
+    Restituisce una porta TCP libera su host.
+    La porta viene rilasciata subito: chi la usa (es. rtkrcv) deve fare bind a breve.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
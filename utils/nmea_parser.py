@@ -1,4 +1,10 @@
-from typing import Optional, Dict
+from pathlib import Path
+from typing import Optional, Dict, Iterator, List, Union
+
+# Lunghezza massima di una sentence NMEA 0183 (82 caratteri, con margine per varianti proprietarie)
+MAX_SENTENCE_LENGTH = 256
+SUPPORTED_TYPES = ('GGA', 'RMC', 'GST', 'GSA')
+
 
 def parse_gga(gga_sentence: str) -> Optional[Dict[str, float]]:
     """
@@ -37,3 +43,230 @@ def parse_gga(gga_sentence: str) -> Optional[Dict[str, float]]:
 
     except (ValueError, IndexError):
         return None
+
+
+def nmea_checksum_ok(sentence: bytes) -> bool:
+    """Verifica il checksum '*hh' (XOR dei byte tra '$' e '*'); False se assente o errato"""
+    star = sentence.rfind(b'*')
+    if not sentence.startswith(b'$') or star < 0 or len(sentence) < star + 3:
+        return False
+    checksum = 0
+    for byte in sentence[1:star]:
+        checksum ^= byte
+    try:
+        return checksum == int(sentence[star + 1:star + 3], 16)
+    except ValueError:
+        return False
+
+
+def _to_degrees(value: str, hemisphere: str) -> Optional[float]:
+    """DDMM.MMMM / DDDMM.MMMM + emisfero -> gradi decimali"""
+    if not value:
+        return None
+    raw = float(value)
+    degrees = int(raw / 100)
+    result = degrees + (raw - degrees * 100) / 60
+    return -result if hemisphere in ('S', 'W') else result
+
+
+def _to_float(value: str) -> Optional[float]:
+    return float(value) if value else None
+
+
+def _to_seconds(value: str) -> Optional[float]:
+    """hhmmss.ss -> secondi dalla mezzanotte"""
+    if len(value) < 6:
+        return None
+    return int(value[0:2]) * 3600 + int(value[2:4]) * 60 + float(value[4:])
+
+
+def _parse_fields(sentence_type: str, f: List[str]) -> Optional[Dict]:
+    if sentence_type == 'GGA' and len(f) >= 10:
+        return {
+            'time': _to_seconds(f[1]),
+            'lat': _to_degrees(f[2], f[3]),
+            'lon': _to_degrees(f[4], f[5]),
+            'quality': int(f[6] or 0),
+            'num_sats': int(f[7] or 0),
+            'hdop': _to_float(f[8]),
+            'alt': _to_float(f[9]),
+        }
+    if sentence_type == 'RMC' and len(f) >= 10:
+        return {
+            'time': _to_seconds(f[1]),
+            'status': f[2],
+            'lat': _to_degrees(f[3], f[4]),
+            'lon': _to_degrees(f[5], f[6]),
+            'speed_knots': _to_float(f[7]),
+            'course': _to_float(f[8]),
+            'date': f[9],
+        }
+    if sentence_type == 'GST' and len(f) >= 9:
+        return {
+            'time': _to_seconds(f[1]),
+            'rms': _to_float(f[2]),
+            'std_lat': _to_float(f[6]),
+            'std_lon': _to_float(f[7]),
+            'std_alt': _to_float(f[8]),
+        }
+    if sentence_type == 'GSA' and len(f) >= 18:
+        return {
+            'mode': f[1],
+            'fix_type': int(f[2] or 1),
+            'sats': [int(s) for s in f[3:15] if s],
+            'pdop': _to_float(f[15]),
+            'hdop': _to_float(f[16]),
+            'vdop': _to_float(f[17]),
+        }
+    return None
+
+
+def parse_sentence(sentence: bytes, validate: bool = True) -> Optional[Dict]:
+    """
+    Parsifica una singola sentence NMEA (bytes, con '$' e checksum).
+    Restituisce {'type', 'talker', ...campi} per GGA/RMC/GST/GSA, None se
+    il checksum è errato, il tipo non è supportato o i campi sono invalidi.
+    """
+    if validate and not nmea_checksum_ok(sentence):
+        return None
+    star = sentence.rfind(b'*')
+    body = sentence[1:star if star > 0 else len(sentence)]
+    try:
+        fields = body.decode('ascii').split(',')
+    except UnicodeDecodeError:
+        return None
+    address = fields[0]
+    if len(address) < 5 or address[-3:] not in SUPPORTED_TYPES:
+        return None
+    try:
+        parsed = _parse_fields(address[-3:], fields)
+    except (ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    parsed['type'] = address[-3:]
+    parsed['talker'] = address[:-3]
+    return parsed
+
+
+class NMEAStreamParser:
+    """
+    Parser NMEA incrementale su buffer di byte.
+    Accetta chunk arbitrari (anche con dati binari UBX/RTCM intercalati), si risincronizza
+    su '$' e restituisce solo sentence complete con checksum valido: nessuna decodifica
+    o concatenazione di stringhe per chunk.
+    """
+
+    def __init__(self, validate: bool = True):
+        self.validate = validate
+        self._buffer = bytearray()
+        self.checksum_errors = 0
+
+    def feed(self, data: bytes) -> Iterator[Dict]:
+        """Aggiunge byte al buffer e produce le sentence complete riconosciute"""
+        buffer = self._buffer
+        buffer += data
+        pos = 0
+        while True:
+            start = buffer.find(b'$', pos)
+            if start < 0:
+                pos = len(buffer)
+                break
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                pos = start
+                # Sentence incompleta troppo lunga: è rumore binario, si scarta
+                if len(buffer) - start > MAX_SENTENCE_LENGTH:
+                    pos = start + 1
+                    continue
+                break
+            sentence = bytes(buffer[start:end]).rstrip(b'\r')
+            # Un '$' dentro la sentence indica che l'inizio era rumore: ripartiamo dall'ultimo
+            inner = sentence.rfind(b'$')
+            if inner > 0:
+                sentence = sentence[inner:]
+            # Consuma subito i byte: il generatore resta coerente anche se interrotto a metà
+            del buffer[:end + 1]
+            pos = 0
+            if self.validate and not nmea_checksum_ok(sentence):
+                self.checksum_errors += 1
+                continue
+            parsed = parse_sentence(sentence, validate=False)
+            if parsed:
+                yield parsed
+        del buffer[:pos]
+
+
+def iter_nmea_file(path: Union[str, Path], chunk_size: int = 1 << 20,
+                   validate: bool = True) -> Iterator[Dict]:
+    """Itera tutte le sentence supportate di un log NMEA leggendolo a blocchi"""
+    parser = NMEAStreamParser(validate=validate)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield from parser.feed(chunk)
+
+
+def parse_gga_log(path: Union[str, Path], chunk_size: int = 1 << 20, validate: bool = True) -> Dict:
+    """
+    Converte le sentence GGA di un log NMEA in array NumPy (analisi offline di ore di dati):
+    time (s dalla mezzanotte), lat, lon, alt, quality, hdop, num_sats.
+
+    I campi vengono raccolti come testo e convertiti/trasformati in blocco da NumPy
+    (conversione gradi-minuti vettorizzata), evitando la costruzione di un dict per riga.
+    """
+    import numpy as np
+
+    columns: Dict[str, List[bytes]] = {k: [] for k in ('time', 'lat', 'ns', 'lon', 'ew', 'quality', 'num_sats', 'hdop', 'alt')}
+    indexes = {'time': 1, 'lat': 2, 'ns': 3, 'lon': 4, 'ew': 5, 'quality': 6, 'num_sats': 7, 'hdop': 8, 'alt': 9}
+    remainder = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            _collect_gga(lines, columns, indexes, validate)
+    _collect_gga([remainder], columns, indexes, validate)
+
+    def as_float(name: str) -> 'np.ndarray':
+        values = np.array([v or b'nan' for v in columns[name]], dtype=np.bytes_)
+        return values.astype(np.float64)
+
+    def to_degrees(raw: 'np.ndarray', hemisphere: List[bytes], negative: bytes) -> 'np.ndarray':
+        degrees = np.trunc(raw / 100)
+        result = degrees + (raw - degrees * 100) / 60
+        sign = np.where(np.array(hemisphere, dtype=np.bytes_) == negative, -1.0, 1.0)
+        return result * sign
+
+    hhmmss = as_float('time')
+    hours = np.trunc(hhmmss / 10000)
+    minutes = np.trunc((hhmmss - hours * 10000) / 100)
+    return {
+        'time': hours * 3600 + minutes * 60 + (hhmmss - hours * 10000 - minutes * 100),
+        'lat': to_degrees(as_float('lat'), columns['ns'], b'S'),
+        'lon': to_degrees(as_float('lon'), columns['ew'], b'W'),
+        'alt': as_float('alt'),
+        'quality': np.nan_to_num(as_float('quality')).astype(np.int8),
+        'hdop': as_float('hdop'),
+        'num_sats': np.nan_to_num(as_float('num_sats')).astype(np.int16),
+    }
+
+
+def _collect_gga(lines: List[bytes], columns: Dict[str, List[bytes]], indexes: Dict[str, int], validate: bool) -> None:
+    for line in lines:
+        start = line.find(b'$')
+        if start < 0 or line[start + 3:start + 6] != b'GGA':
+            continue
+        sentence = line[start:].rstrip(b'\r')
+        if validate and not nmea_checksum_ok(sentence):
+            continue
+        fields = sentence.split(b'*', 1)[0].split(b',')
+        # Righe senza posizione (ricevitore senza fix) non hanno lat/lon da riportare
+        if len(fields) < 10 or not fields[2] or not fields[4]:
+            continue
+        for name, index in indexes.items():
+            columns[name].append(fields[index])
@@ -0,0 +1,136 @@
+import errno
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import yaml
+from utils.session_log import log
+from utils.stream_recorder import RecordingReader, RECORDING_SUFFIX
+
+
+class ReplayServer:
+    """
+    Server TCP locale che riproduce le registrazioni .gnssrec come se fossero ricevitori live.
+
+    Ogni registrazione viene servita sulla sua porta originale su un alias di loopback
+    dedicato (127.0.1.N), così più ricevitori con la stessa porta possono coesistere.
+    Gli alias oltre 127.0.0.1 rispondono solo su Linux: dove il bind fallisce
+    (macOS, BSD, container senza la rotta) ogni ricevitore usa una porta libera di 127.0.0.1.
+    Tutti gli stream condividono lo stesso orologio di riproduzione (avviato da start())
+    accelerato di speed volte: un client che si connette dopo riceve i dati da quel
+    momento in poi, come con un ricevitore reale, e Master/Rover restano allineati.
+    """
+
+    def __init__(self, recordings_dir: Path, speed: float = 1.0, bind_host: Optional[str] = None):
+        self.recordings_dir = recordings_dir
+        self.speed = max(0.01, float(speed))
+        self.bind_host = bind_host
+        self.readers: Dict[str, RecordingReader] = {}
+        self.addresses: Dict[str, Tuple[str, int]] = {}
+        self._listeners: List[socket.socket] = []
+        self._stop = threading.Event()
+        self._t0 = 0.0
+
+        for path in sorted(recordings_dir.glob(f"*{RECORDING_SUFFIX}")):
+            reader = RecordingReader(path)
+            self.readers[reader.metadata['serial']] = reader
+        if not self.readers:
+            raise ValueError(f"Nessuna registrazione {RECORDING_SUFFIX} in {recordings_dir}")
+
+    def start(self) -> 'ReplayServer':
+        for index, (serial, reader) in enumerate(self.readers.items()):
+            if self.bind_host:
+                listener = self._listen((self.bind_host, 0))
+            else:
+                listener = self._listen_alias(f"127.0.1.{index + 1}", int(reader.metadata['port']))
+            listener.settimeout(0.5)
+            self._listeners.append(listener)
+            self.addresses[serial] = listener.getsockname()
+            threading.Thread(target=self._accept_loop, args=(listener, reader),
+                             name=f"replay-{serial}", daemon=True).start()
+
+        self._t0 = time.monotonic()
+        for serial, (host, port) in self.addresses.items():
+            log(f"Replay {serial} su {host}:{port} (x{self.speed:g})")
+        return self
+
+    def _listen_alias(self, host: str, port: int) -> socket.socket:
+        try:
+            return self._listen((host, port))
+        except OSError as e:
+            if e.errno != errno.EADDRNOTAVAIL:
+                raise
+        # Alias di loopback non disponibile: da qui in poi porte distinte su 127.0.0.1
+        log(f"Alias di loopback {host} non disponibile su questo sistema, uso 127.0.0.1 con porte libere")
+        self.bind_host = '127.0.0.1'
+        return self._listen((self.bind_host, 0))
+
+    @staticmethod
+    def _listen(address: Tuple[str, int]) -> socket.socket:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(address)
+            listener.listen(16)
+        except OSError:
+            listener.close()
+            raise
+        return listener
+
+    def stop(self) -> None:
+        self._stop.set()
+        for listener in self._listeners:
+            listener.close()
+
+    def __enter__(self) -> 'ReplayServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def playback_position(self) -> float:
+        """Posizione corrente della riproduzione, in secondi di registrazione"""
+        return (time.monotonic() - self._t0) * self.speed
+
+    def write_stations(self, source_yaml: Path, output_yaml: Path) -> Path:
+        """Crea una copia di stations.yaml con ip/porta dei ricevitori puntati al replay"""
+        with open(source_yaml, 'r') as f:
+            data = yaml.safe_load(f) or {}
+        receivers = data.get('receivers') or {}
+        for name, item in list(receivers.items()):
+            address = self.addresses.get(item.get('serial'))
+            if address is None:
+                # Ricevitore non registrato: escluso dal replay
+                del receivers[name]
+                continue
+            item['ip'], item['port'] = address[0], address[1]
+        with open(output_yaml, 'w') as f:
+            yaml.dump(data, f, default_flow_style=False, allow_unicode=True)
+        return output_yaml
+
+    def _accept_loop(self, listener: socket.socket, reader: RecordingReader) -> None:
+        while not self._stop.is_set():
+            try:
+                conn, _ = listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn, reader), daemon=True).start()
+
+    def _serve(self, conn: socket.socket, reader: RecordingReader) -> None:
+        with conn:
+            start = self.playback_position()
+            for offset, payload in reader.records():
+                if self._stop.is_set():
+                    return
+                if offset < start:
+                    continue
+                delay = (offset - self.playback_position()) / self.speed
+                if delay > 0 and self._stop.wait(delay):
+                    return
+                try:
+                    conn.sendall(payload)
+                except OSError:
+                    return
@@ -0,0 +1,252 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+from utils.session_log import log
+
+PROC = Path("/proc")
+_CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+@dataclass
+class HostSample:
+    """Carico dell'host: CPU occupata (in core, media dall'ultimo campione), load average e memoria"""
+    cpu_count: int
+    busy_cores: float
+    load1: float
+    mem_total_mb: float
+    mem_available_mb: float
+
+
+@dataclass
+class ProcessSample:
+    """Tempo CPU cumulativo (utente + sistema, s) e memoria residente (MB) di un processo"""
+    cpu_seconds: float
+    rss_mb: float
+
+
+class ResourceMonitor:
+    """
+    Letture di /proc (Linux). Il carico CPU dell'host è la frazione di tempo non idle tra
+    due chiamate a host(); se /proc non è disponibile available è False e i metodi
+    restituiscono None.
+    """
+
+    def __init__(self, proc: Path = PROC):
+        self.proc = proc
+        self.available = (proc / "stat").exists()
+        self.cpu_count = os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._last_cpu: Optional[tuple] = None
+
+    def host(self) -> Optional[HostSample]:
+        if not self.available:
+            return None
+        try:
+            busy, total = self._cpu_times()
+            with self._lock:
+                previous = self._last_cpu
+                if previous is None:
+                    # Primo campione: breve intervallo di misura
+                    time.sleep(0.1)
+                    previous = (busy, total)
+                    busy, total = self._cpu_times()
+                self._last_cpu = (busy, total)
+            fraction = (busy - previous[0]) / (total - previous[1]) if total > previous[1] else 0.0
+            load1 = float((self.proc / "loadavg").read_text().split()[0])
+            meminfo = self._meminfo()
+        except (OSError, ValueError, IndexError):
+            return None
+        return HostSample(cpu_count=self.cpu_count, busy_cores=fraction * self.cpu_count, load1=load1,
+                          mem_total_mb=meminfo.get('MemTotal', 0) / 1024,
+                          mem_available_mb=meminfo.get('MemAvailable', meminfo.get('MemFree', 0)) / 1024)
+
+    def process(self, pid: int) -> Optional[ProcessSample]:
+        try:
+            stat = (self.proc / str(pid) / "stat").read_text()
+        except OSError:
+            return None
+        # Il nome del processo (campo 2) può contenere spazi: i campi numerici seguono l'ultima ')'
+        values = stat[stat.rfind(')') + 2:].split()
+        try:
+            utime, stime, rss_pages = int(values[11]), int(values[12]), int(values[21])
+        except (IndexError, ValueError):
+            return None
+        return ProcessSample(cpu_seconds=(utime + stime) / _CLK_TCK, rss_mb=rss_pages * _PAGE_SIZE / 2 ** 20)
+
+    def _cpu_times(self) -> tuple:
+        # cpu user nice system idle iowait irq softirq steal ...
+        values = [int(v) for v in (self.proc / "stat").read_text().split('\n', 1)[0].split()[1:9]]
+        total = sum(values)
+        return total - values[3] - values[4], total
+
+    def _meminfo(self) -> Dict[str, float]:
+        info = {}
+        for line in (self.proc / "meminfo").read_text().splitlines():
+            name, _, rest = line.partition(':')
+            parts = rest.split()
+            if parts:
+                info[name] = float(parts[0])  # kB
+        return info
+
+
+class SessionResources:
+    """Consumo di un processo RTKRCV durante una sessione: CPU (delta dall'avvio) e picco di RSS"""
+
+    def __init__(self, pid: int, monitor: Optional[ResourceMonitor] = None):
+        self.pid = pid
+        self.monitor = monitor or ResourceMonitor()
+        self.started_at = time.monotonic()
+        start = self.monitor.process(pid)
+        # Con il pool il processo è riusato: conta solo la CPU consumata da questa sessione
+        self._cpu_start = start.cpu_seconds if start else 0.0
+        self._cpu_last = self._cpu_start
+        self.peak_rss_mb = start.rss_mb if start else 0.0
+
+    def sample(self) -> None:
+        usage = self.monitor.process(self.pid)
+        if usage is None:
+            return
+        self._cpu_last = usage.cpu_seconds
+        self.peak_rss_mb = max(self.peak_rss_mb, usage.rss_mb)
+
+    def summary(self) -> Dict[str, float]:
+        wall = time.monotonic() - self.started_at
+        cpu = max(0.0, self._cpu_last - self._cpu_start)
+        return {'cpu_seconds': round(cpu, 3), 'cpu_percent': round(100 * cpu / wall, 1) if wall > 0 else 0.0,
+                'peak_rss_mb': round(self.peak_rss_mb, 1), 'wall_time': round(wall, 3)}
+
+
+@dataclass
+class AdmissionSettings:
+    """Parametri del controllo di ammissione delle sessioni (settings.admission in stations.yaml)"""
+    enabled: bool = True
+    # Frazione massima dei core occupati, contando la stima della nuova sessione
+    cpu_high: float = 0.85
+    # Load average (1 min) massimo per core
+    load_high: float = 1.5
+    # Memoria da lasciare sempre libera (MB)
+    mem_reserve_mb: float = 256.0
+    # Intervallo minimo tra due avvii (s): il campione successivo vede già il carico della sessione avviata
+    interval: float = 1.0
+    # Stima iniziale del costo di una sessione (core e MB), poi aggiornata dalle sessioni misurate
+    session_cpu: float = 0.5
+    session_rss_mb: float = 64.0
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> 'AdmissionSettings':
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in (settings.get('admission') or {}).items() if k in names})
+
+
+class AdmissionController:
+    """
+    Ammette una nuova sessione RTKRCV locale solo se l'host ha margine.
+
+    Prima di ogni avvio campiona /proc: la sessione parte se CPU occupata più il costo
+    stimato di una sessione resta entro cpu_high, il load average entro load_high per core
+    e la memoria disponibile sopra mem_reserve_mb. Altrimenti il thread attende (host
+    saturo) e ricampiona ogni interval secondi; gli avvii sono comunque distanziati di
+    interval secondi. Il costo stimato è la media mobile di CPU e RSS delle sessioni
+    misurate (observe). Con nessuna sessione attiva l'avvio è sempre ammesso.
+    """
+
+    # Peso di una nuova misura nella media mobile del costo per sessione
+    SMOOTHING = 0.3
+    # Tetto delle sessioni per core in auto_limit: la concorrenza effettiva la decide slot()
+    MAX_SESSIONS_PER_CPU = 4
+
+    def __init__(self, settings: Optional[AdmissionSettings] = None, monitor: Optional[ResourceMonitor] = None):
+        self.settings = settings or AdmissionSettings()
+        self.monitor = monitor or ResourceMonitor()
+        self.session_cpu = self.settings.session_cpu
+        self.session_rss_mb = self.settings.session_rss_mb
+        self.active = 0
+        self.paused = 0
+        self._admit_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._last_admission = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled and self.monitor.available
+
+    def auto_limit(self) -> int:
+        """
+        Tetto di sessioni concorrenti per questo host (numero di thread di sessione): un
+        multiplo dei core, limitato dalla memoria disponibile. Quante sessioni girano davvero
+        dipende dal carico misurato a ogni ammissione.
+        """
+        host = self.monitor.host()
+        if host is None or not self.settings.enabled:
+            return self.monitor.cpu_count
+        cpu_limit = self.monitor.cpu_count * self.MAX_SESSIONS_PER_CPU
+        mem_limit = int((host.mem_available_mb - self.settings.mem_reserve_mb) / max(self.session_rss_mb, 1.0))
+        return max(1, min(cpu_limit, mem_limit))
+
+    @contextmanager
+    def slot(self, cancel_event: Optional[threading.Event] = None) -> Iterator[bool]:
+        """Attende il margine per una sessione; restituisce False se cancel_event interrompe l'attesa"""
+        cancel_event = cancel_event or threading.Event()
+        admitted = self._admit(cancel_event)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                with self._lock:
+                    self.active -= 1
+
+    def observe(self, usage: Dict[str, float]) -> None:
+        """Aggiorna il costo stimato per sessione con il consumo misurato (SessionResources.summary)"""
+        if not usage or usage.get('wall_time', 0) < 1.0:
+            return
+        with self._lock:
+            self.session_cpu += self.SMOOTHING * (usage['cpu_percent'] / 100 - self.session_cpu)
+            self.session_rss_mb += self.SMOOTHING * (usage['peak_rss_mb'] - self.session_rss_mb)
+
+    def _admit(self, cancel_event: threading.Event) -> bool:
+        with self._admit_lock:
+            waiting = False
+            while not cancel_event.is_set():
+                wait = self._last_admission + self.settings.interval - time.monotonic()
+                if wait > 0 and self.active:
+                    cancel_event.wait(wait)
+                    continue
+                reason = self._saturation() if self.enabled and self.active else None
+                if reason is None:
+                    if waiting:
+                        log("▶️  Risorse disponibili, avvio sessione")
+                    with self._lock:
+                        self.active += 1
+                        if waiting:
+                            self.paused -= 1
+                    self._last_admission = time.monotonic()
+                    return True
+                if not waiting:
+                    log(f"⏸️  Host saturo ({reason}): sessione in attesa, {self.active} attive")
+                    waiting = True
+                    with self._lock:
+                        self.paused += 1
+                cancel_event.wait(self.settings.interval)
+            if waiting:
+                with self._lock:
+                    self.paused -= 1
+            return False
+
+    def _saturation(self) -> Optional[str]:
+        """Motivo per cui l'host non ha margine per una sessione in più, None se c'è margine"""
+        host = self.monitor.host()
+        if host is None:
+            return None
+        s = self.settings
+        if host.busy_cores + self.session_cpu > host.cpu_count * s.cpu_high:
+            return f"CPU {host.busy_cores:.1f}/{host.cpu_count} core"
+        if host.load1 > host.cpu_count * s.load_high:
+            return f"load {host.load1:.1f}"
+        if host.mem_available_mb - self.session_rss_mb < s.mem_reserve_mb:
+            return f"memoria disponibile {host.mem_available_mb:.0f} MB"
+        return None
@@ -0,0 +1,266 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_RESULT_STORE = Path("data") / "results.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    config TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT NOT NULL DEFAULT 'running',
+    master_serial TEXT,
+    master_lat REAL,
+    master_lon REAL,
+    master_alt REAL
+);
+CREATE TABLE IF NOT EXISTS run_masters (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    serial TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    alt REAL NOT NULL,
+    PRIMARY KEY (run_id, serial)
+);
+CREATE TABLE IF NOT EXISTS rover_results (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    serial TEXT NOT NULL,
+    status TEXT NOT NULL,
+    lat REAL,
+    lon REAL,
+    alt REAL,
+    master_id TEXT,
+    time_to_first_float REAL,
+    time_to_fix REAL,
+    time_to_solution REAL,
+    solved_at REAL NOT NULL,
+    PRIMARY KEY (run_id, serial)
+);
+CREATE TABLE IF NOT EXISTS master_positions (
+    serial TEXT NOT NULL,
+    address TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    alt REAL NOT NULL,
+    acquired_at REAL NOT NULL,
+    PRIMARY KEY (serial, address)
+);
+CREATE TABLE IF NOT EXISTS monitor_series (
+    serial TEXT NOT NULL,
+    master_id TEXT,
+    solved_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    lat REAL,
+    lon REAL,
+    alt REAL
+);
+CREATE TABLE IF NOT EXISTS monitor_alerts (
+    serial TEXT NOT NULL,
+    raised_at REAL NOT NULL,
+    horizontal REAL NOT NULL,
+    vertical REAL NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    alt REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_resources (
+    run_id INTEGER,
+    serial TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    cpu_seconds REAL,
+    cpu_percent REAL,
+    peak_rss_mb REAL,
+    wall_time REAL
+);
+CREATE INDEX IF NOT EXISTS idx_rover_results_serial ON rover_results(serial, solved_at);
+CREATE INDEX IF NOT EXISTS idx_monitor_series_serial ON monitor_series(serial, solved_at);
+CREATE INDEX IF NOT EXISTS idx_monitor_series_time ON monitor_series(solved_at);
+"""
+
+
+class ResultStore:
+    """
+    Archivio SQLite dei risultati, scritto in modo incrementale durante il run.
+
+    Ogni soluzione Rover viene registrata (in una transazione dedicata) nel momento in cui
+    viene trovata, quindi un crash o un'interruzione perdono al massimo le sessioni in corso.
+    Un run rimasto in stato 'running' o 'interrupted' può essere ripreso; in modalità delta
+    i Rover con un FIX recente calcolato rispetto allo stesso Master non vengono rielaborati.
+
+    Conserva anche l'ultima posizione acquisita di ogni Master (serial + ip:porta), usata
+    come cache con controllo di deriva invece di ripetere la media completa a ogni run,
+    e le serie temporali e gli allarmi di spostamento della modalità monitoraggio.
+
+    La connessione è condivisa dai worker dello scheduler e serializzata da un lock.
+    """
+
+    def __init__(self, path: Path = DEFAULT_RESULT_STORE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL + synchronous=NORMAL: ogni commit è durevole rispetto a crash del processo
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def begin_run(self, config: str) -> int:
+        """Apre un nuovo run per il file di configurazione indicato e ne restituisce l'id"""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO runs (config, started_at) VALUES (?, ?)", (config, time.time()))
+            return cur.lastrowid
+
+    def resumable_run(self, config: str) -> Optional[sqlite3.Row]:
+        """Ultimo run non completato per la configurazione, se è anche l'ultimo run eseguito"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM runs WHERE config = ? ORDER BY id DESC LIMIT 1", (config,)).fetchone()
+        if row is not None and row['status'] in ('running', 'interrupted'):
+            return row
+        return None
+
+    def reopen_run(self, run_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE runs SET status = 'running', finished_at = NULL WHERE id = ?", (run_id,))
+
+    def finish_run(self, run_id: int, status: str) -> None:
+        """status: 'completed', 'failed' oppure 'interrupted' (solo quest'ultimo potrà essere ripreso)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE runs SET status = ?, finished_at = ? WHERE id = ?", (status, time.time(), run_id))
+
+    def record_master(self, run_id: int, serial: str, lat: float, lon: float, alt: float) -> None:
+        """Memorizza le coordinate di un Master usato dal run (servono a riprenderlo in modo coerente)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO run_masters (run_id, serial, lat, lon, alt) VALUES (?, ?, ?, ?, ?)",
+                (run_id, serial, lat, lon, alt))
+
+    def run_masters(self, run_id: int) -> Dict[str, Dict[str, float]]:
+        """
+        Coordinate dei Master usati da un run, per serial. I run registrati prima della
+        tabella run_masters hanno solo il Master principale, nelle colonne master_* di runs.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT serial, lat, lon, alt FROM run_masters WHERE run_id = ?", (run_id,)).fetchall()
+            if not rows:
+                rows = self._conn.execute(
+                    "SELECT master_serial AS serial, master_lat AS lat, master_lon AS lon, master_alt AS alt "
+                    "FROM runs WHERE id = ? AND master_lat IS NOT NULL", (run_id,)).fetchall()
+        return {row['serial']: {'lat': row['lat'], 'lon': row['lon'], 'alt': row['alt']} for row in rows}
+
+    def record_rover(self, run_id: int, serial: str, status: str, coords: Optional[Dict[str, float]],
+                     master_id: Optional[str], timings: Dict[str, float], solved_at: Optional[float] = None) -> None:
+        """
+        Registra l'esito della sessione di un Rover (status 'FIX', 'FLOAT' o 'NONE').
+        solved_at (default: adesso) permette di copiare una soluzione di un altro run senza ringiovanirla.
+        """
+        coords = coords or {}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rover_results (run_id, serial, status, lat, lon, alt, master_id, "
+                "time_to_first_float, time_to_fix, time_to_solution, solved_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, serial, status, coords.get('lat'), coords.get('lon'), coords.get('alt'), master_id,
+                 timings.get('first_float'), timings.get('first_fix'), timings.get('solution'),
+                 solved_at if solved_at is not None else time.time()))
+
+    def discard_rover(self, run_id: int, serial: str) -> None:
+        """Elimina la soluzione di un Rover dal run (da ricalcolare, es. Master riposizionato)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM rover_results WHERE run_id = ? AND serial = ?", (run_id, serial))
+
+    def run_results(self, run_id: int) -> Dict[str, sqlite3.Row]:
+        """Soluzioni (FIX o FLOAT) già ottenute in un run, per serial"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM rover_results WHERE run_id = ? AND status IN ('FIX', 'FLOAT')",
+                (run_id,)).fetchall()
+        return {row['serial']: row for row in rows}
+
+    def fresh_fixes(self, master_id: str, max_age: float) -> Dict[str, sqlite3.Row]:
+        """FIX più recente per serial, se ottenuto rispetto a master_id negli ultimi max_age secondi"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM rover_results WHERE status = 'FIX' AND master_id = ? AND solved_at >= ? "
+                "ORDER BY solved_at", (master_id, time.time() - max_age)).fetchall()
+        # ORDER BY solved_at: per ogni serial resta il FIX più recente
+        return {row['serial']: row for row in rows}
+
+    def last_position(self, serial: str) -> Optional[sqlite3.Row]:
+        """Ultima soluzione (FIX o FLOAT) nota per il Rover, in qualunque run e rispetto a qualunque Master"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT lat, lon, alt, solved_at FROM rover_results WHERE serial = ? AND status IN ('FIX', 'FLOAT') "
+                "ORDER BY solved_at DESC LIMIT 1", (serial,)).fetchone()
+
+    def cached_master_position(self, serial: str, address: str, max_age: float) -> Optional[sqlite3.Row]:
+        """Ultima posizione acquisita per il Master (serial + ip:porta), se più recente di max_age secondi"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM master_positions WHERE serial = ? AND address = ? AND acquired_at >= ?",
+                (serial, address, time.time() - max_age)).fetchone()
+
+    def save_master_position(self, serial: str, address: str, lat: float, lon: float, alt: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO master_positions (serial, address, lat, lon, alt, acquired_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (serial, address, lat, lon, alt, time.time()))
+
+    def record_resources(self, run_id: Optional[int], serial: str, usage: Dict[str, float]) -> None:
+        """Registra CPU e memoria del processo RTKRCV di una sessione (run_id None in monitoraggio)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO session_resources (run_id, serial, recorded_at, cpu_seconds, cpu_percent, "
+                "peak_rss_mb, wall_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, serial, time.time(), usage.get('cpu_seconds'), usage.get('cpu_percent'),
+                 usage.get('peak_rss_mb'), usage.get('wall_time')))
+
+    def record_series(self, serial: str, master_id: Optional[str], status: str,
+                      coords: Optional[Dict[str, float]]) -> None:
+        """Aggiunge una soluzione alla serie temporale di monitoraggio del Rover"""
+        coords = coords or {}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO monitor_series (serial, master_id, solved_at, status, lat, lon, alt) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (serial, master_id, time.time(), status, coords.get('lat'), coords.get('lon'), coords.get('alt')))
+
+    def series_baseline(self, serial: str, master_id: str) -> Optional[sqlite3.Row]:
+        """Primo FIX della serie (rispetto a master_id): riferimento per gli spostamenti"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM monitor_series WHERE serial = ? AND master_id = ? AND status = 'FIX' "
+                "ORDER BY solved_at LIMIT 1", (serial, master_id)).fetchone()
+
+    def record_alert(self, serial: str, horizontal: float, vertical: float, coords: Dict[str, float]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO monitor_alerts (serial, raised_at, horizontal, vertical, lat, lon, alt) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (serial, time.time(), horizontal, vertical, coords['lat'], coords['lon'], coords['alt']))
+
+    def prune_series(self, max_age: float) -> int:
+        """
+        Elimina i punti della serie più vecchi di max_age secondi (il primo FIX di ogni
+        Rover/Master resta come riferimento). Restituisce il numero di righe eliminate.
+        """
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM monitor_series WHERE solved_at < ? AND rowid NOT IN ("
+                "SELECT MIN(rowid) FROM monitor_series WHERE status = 'FIX' GROUP BY serial, master_id)",
+                (time.time() - max_age,))
+            return cur.rowcount
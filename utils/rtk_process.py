@@ -1,23 +1,49 @@
 import subprocess
+import threading
 import time
 import tempfile
 from pathlib import Path
 from typing import Optional, List, Dict
-from utils.solution_reader import read_solution_file
+from utils.solution_reader import SolutionTailReader, SolutionSocketReader
+from utils.solution_watcher import SolutionWatcher
+from utils.cancel_event import CancelEvent
+from utils.rtkrcv_pool import RTKRCVPool, PooledRTKRCV
+from utils.convergence import ConvergenceCriteria, ConvergenceTracker, CONVERGED, DIVERGED
+from utils.resource_monitor import SessionResources
+from utils.metrics import phase
+from utils.session_log import log
+from utils import events
 
 class RTKProcess:
     """Gestisce il ciclo di vita del processo RTKRCV"""
+
+    # Intervallo massimo tra due risvegli senza nuove epoche (timeout, status); un CancelEvent
+    # sveglia subito l'attesa, un threading.Event semplice viene controllato ogni CANCEL_POLL
+    IDLE_WAKEUP = 5.0
+    CANCEL_POLL = 1.0
+    # Intervallo tra i tentativi di connessione al tcpsvr della soluzione
+    CONNECT_RETRY = 0.5
     
-    def __init__(self, config_file: Path, rtklib_path: Path, output_dir: Optional[Path] = None):
+    def __init__(self, config_file: Path, rtklib_path: Path, output_dir: Optional[Path] = None,
+                 cancel_event: Optional[threading.Event] = None, solution_port: Optional[int] = None,
+                 pool: Optional[RTKRCVPool] = None):
         self.config_file = config_file
         self.rtklib_path = rtklib_path
         self.output_dir = output_dir or Path(tempfile.gettempdir())
+        # Permette all'orchestratore di interrompere la sessione (es. Ctrl+C con sessioni parallele)
+        self.cancel_event = cancel_event or CancelEvent()
+        # Se impostata, le epoche arrivano dal tcpsvr locale di RTKRCV invece che dal file .pos
+        self.solution_port = solution_port
+        # Pool di processi RTKRCV riutilizzabili (None = un processo dedicato per sessione)
+        self.pool = pool
+        self.pooled: Optional[PooledRTKRCV] = None
         
         # Paths management
         self.rtkrcv_tmp_dir = self.output_dir / "rt"
         self.rtkrcv_tmp_dir.mkdir(exist_ok=True, parents=True)
         
         identifier = config_file.stem.replace("rtkrcv_", "").replace(".conf", "")
+        self.serial = identifier
         
         self.solution_file = self.output_dir / f"solution_{identifier}.pos"
         self.stdout_file = self.output_dir / f"rtkrcv_stdout_{identifier}.log"
@@ -30,17 +56,37 @@ class RTKProcess:
         # State per output dinamico
         self.last_status_line = ""
 
+        # Tempi della sessione in secondi dall'avvio del processo
+        # (first_float, first_fix, solution), usati per i report di run
+        self.started_at: Optional[float] = None
+        self.timings: Dict[str, float] = {}
+        # CPU e memoria del processo RTKRCV campionate durante la sessione (vedi stop)
+        self.resources: Optional[SessionResources] = None
+        self.resource_usage: Dict[str, float] = {}
+        # Tutte le epoche lette nella sessione, per l'archivio colonnare (utils/epoch_archive.py)
+        self.epochs: List[Dict] = []
+        # True tra un avvio riuscito e stop() (la fase rtkrcv_stop si misura solo per sessioni avviate)
+        self._started = False
+
     def start(self) -> bool:
-        """Avvia il processo RTKRCV"""
+        """Avvia il processo RTKRCV (o riconfigura un processo del pool, se disponibile)"""
+        with phase('rtkrcv_start', self.serial) as outcome:
+            outcome['ok'] = self._started = self._start()
+            return self._started
+
+    def _start(self) -> bool:
+        if self.pool and self._start_pooled():
+            return True
         try:
             rtklib_path_abs = self.rtklib_path if self.rtklib_path.is_absolute() else Path.cwd() / self.rtklib_path
             config_file_abs = self.config_file if self.config_file.is_absolute() else Path.cwd() / self.config_file
 
-            print(f"Comando: {rtklib_path_abs} -nc -t 2 -o {config_file_abs}", flush=True)
+            log(f"Comando: {rtklib_path_abs} -nc -t 2 -o {config_file_abs}")
 
             self.stdout_fd = open(self.stdout_file, 'w', buffering=1)
             self.stderr_fd = open(self.stderr_file, 'w', buffering=1)
 
+            self.started_at = time.monotonic()
             self.process = subprocess.Popen(
                 [str(rtklib_path_abs), '-nc', '-t', '2', '-o', str(config_file_abs)],
                 stdin=subprocess.DEVNULL,
@@ -51,92 +97,217 @@ class RTKProcess:
                 close_fds=False
             )
             
-            print(f"RTKRCV avviato (PID: {self.process.pid})", flush=True)
-            print(f"File soluzione: {self.solution_file}", flush=True)
+            log(f"RTKRCV avviato (PID: {self.process.pid})")
+            self.resources = SessionResources(self.process.pid)
+            events.emit(events.SESSION_STARTED, self.serial, pid=self.process.pid, pooled=False)
+            if self.solution_port:
+                log(f"Stream soluzione: tcp://127.0.0.1:{self.solution_port}")
+            else:
+                log(f"File soluzione: {self.solution_file}")
             
             return True
         except Exception as e:
-            print(f"Errore avvio RTKRCV: {e}", flush=True)
+            log(f"Errore avvio RTKRCV: {e}")
+            events.emit(events.ERROR, self.serial, message=f"Errore avvio RTKRCV: {e}")
             self.stop()
             return False
 
-    def wait_for_fix(self, timeout: int = 300, median_samples: int = 3) -> Optional[Dict]:
+    def _start_pooled(self) -> bool:
+        config_file_abs = self.config_file if self.config_file.is_absolute() else Path.cwd() / self.config_file
+        self.started_at = time.monotonic()
+        self.pooled = self.pool.acquire(config_file_abs)
+        if self.pooled is None:
+            log("Pool RTKRCV non disponibile, avvio processo dedicato")
+            return False
+        self.process = self.pooled.process
+        log(f"RTKRCV dal pool (PID: {self.process.pid}, sessione #{self.pooled.sessions})")
+        self.resources = SessionResources(self.process.pid)
+        events.emit(events.SESSION_STARTED, self.serial, pid=self.process.pid, pooled=True)
+        if self.solution_port:
+            log(f"Stream soluzione: tcp://127.0.0.1:{self.solution_port}")
+        else:
+            log(f"File soluzione: {self.solution_file}")
+        return True
+
+    def wait_for_fix(self, timeout: int = 300, median_samples: int = 3,
+                     criteria: Optional[ConvergenceCriteria] = None) -> Optional[Dict]:
+        """Attende la convergenza della sessione (vedi _wait_for_fix); fase rtkrcv_session"""
+        with phase('rtkrcv_session', self.serial) as outcome:
+            result = self._wait_for_fix(timeout, median_samples, criteria)
+            outcome['ok'] = result is not None
+            return result
+
+    def _wait_for_fix(self, timeout: int, median_samples: int,
+                      criteria: Optional[ConvergenceCriteria]) -> Optional[Dict]:
         """
         Attende che venga trovata una soluzione.
-        Raccoglie N soluzioni FIX (default 3) e restituisce quella con coordinate mediane.
-        Se scade il timeout e c'è una soluzione FLOAT, restituisce quella.
+        Le epoche FIX vengono valutate da un ConvergenceTracker (precisione sdn/sde/sdu, ratio,
+        età delle correzioni, dispersione delle posizioni): la sessione termina appena gli
+        obiettivi di criteria sono raggiunti e restituisce la posizione media delle epoche
+        accettate. Senza criteria servono median_samples epoche FIX coerenti.
+        Se scade il timeout, o la sessione diverge, e c'è una soluzione FLOAT, restituisce quella.
+
+        Il file soluzione viene letto in modo incrementale: ogni epoca scritta da RTKRCV
+        viene considerata, anche se ne arrivano più di una tra due poll.
+        Il ciclo è guidato da eventi (SolutionWatcher): si sveglia appena RTKRCV scrive
+        o termina, o appena cancel_event viene impostato, altrimenti al più ogni IDLE_WAKEUP secondi.
+        Con solution_port le epoche vengono lette direttamente dal socket di RTKRCV.
         """
+        criteria = criteria or ConvergenceCriteria(min_fix_epochs=median_samples)
+        tracker = ConvergenceTracker(criteria)
         start_time = time.time()
         best_solution = None
-        fix_solutions = []
+        if self.solution_port:
+            reader = SolutionSocketReader(self.solution_port)
+        else:
+            reader = SolutionTailReader(self.solution_file)
+        watcher = SolutionWatcher(self.solution_file, self.process)
+        last_epoch = None
         
         try:
             while time.time() - start_time < timeout:
-                self.stdout_fd.flush()
-                self.stderr_fd.flush()
-                
+                if self.cancel_event.is_set():
+                    log("\nSessione annullata")
+                    return best_solution
+
                 elapsed = time.time() - start_time
                 remaining = timeout - elapsed
                 
-                # Check solution file
-                if self.solution_file.exists():
-                    sol = read_solution_file(self.solution_file)
-                    if sol:
-                        quality = sol.get('quality', 0)
-                        q_str = "FIX" if quality == 1 else "FLOAT" if quality == 2 else f"Q={quality}"
-                        
-                        fix_progress = f" [{len(fix_solutions)}/{median_samples}]" if fix_solutions else ""
-                        status_line = f"Soluzione: {sol['lat']:.8f}, {sol['lon']:.8f}, {sol['alt']:.3f} ({q_str}{fix_progress}) - {remaining:.0f}s"
-                        
-                        # Aggiorna status su stessa riga
-                        self._update_status(status_line)
-
-                        # Se abbiamo FIX (Q=1), accumula per filtro mediano
-                        if quality == 1:
-                            if not fix_solutions or self._is_new_solution(sol, fix_solutions[-1]):
-                                fix_solutions.append(sol)
-                                print(f"\n  ✓ Campione FIX #{len(fix_solutions)} raccolto", flush=True)
-                            
-                            if len(fix_solutions) >= median_samples:
-                                print(flush=True)  # Newline finale
-                                median_sol = self._compute_median_solution(fix_solutions)
-                                print(f"  📊 Soluzione mediana da {len(fix_solutions)} campioni", flush=True)
-                                return median_sol
-                        
-                        # FLOAT come fallback
-                        if quality == 2:
-                            best_solution = sol
+                for sol in reader.read_new_epochs():
+                    self.epochs.append(sol)
+                    last_epoch = sol
+                    quality = sol['quality']
+
+                    if quality in (1, 2):
+                        self._mark_timing('first_fix' if quality == 1 else 'first_float')
+
+                    # FLOAT come fallback
+                    if quality == 2:
+                        best_solution = sol
+
+                    accepted = tracker.accepted
+                    state = tracker.update(sol, elapsed)
+                    if tracker.accepted > accepted:
+                        log(f"\n  ✓ Campione FIX #{tracker.accepted} raccolto")
+                        events.emit(events.FIX_SAMPLE, self.serial, n=tracker.accepted,
+                                    target=criteria.min_fix_epochs)
+
+                    if state == CONVERGED:
+                        log()  # Newline finale
+                        self._mark_timing('solution')
+                        log(f"  📊 Soluzione media da {tracker.accepted} campioni "
+                            f"(dispersione {tracker.spread() * 100:.1f} cm)")
+                        return tracker.solution()
+
+                    if state == DIVERGED:
+                        return self._release_diverged(elapsed, best_solution)
+
+                # Anche senza nuove epoche (stream del Rover fermo) la divergenza va valutata
+                if tracker.diverged(elapsed):
+                    return self._release_diverged(elapsed, best_solution)
+
+                if last_epoch:
+                    quality = last_epoch['quality']
+                    q_str = "FIX" if quality == 1 else "FLOAT" if quality == 2 else f"Q={quality}"
+                    fix_progress = f" [{tracker.accepted}/{criteria.min_fix_epochs}]" if tracker.accepted else ""
+                    status_line = f"Soluzione: {last_epoch['lat']:.8f}, {last_epoch['lon']:.8f}, {last_epoch['alt']:.3f} ({q_str}{fix_progress}) - {remaining:.0f}s"
+                    
+                    # Aggiorna status su stessa riga
+                    if self._update_status(status_line):
+                        events.emit(events.EPOCH, self.serial, quality=quality, lat=last_epoch['lat'],
+                                    lon=last_epoch['lon'], alt=last_epoch['alt'], ns=last_epoch.get('ns'),
+                                    ratio=last_epoch.get('ratio'), remaining=round(remaining))
                 else:
                     self._update_status(f"Attendo soluzione... {remaining:.0f}s")
 
+                if self.resources:
+                    self.resources.sample()
+
                 # Check process status
                 if self.process.poll() is not None:
-                    print(f"\nRTKRCV terminato inaspettatamente", flush=True)
+                    log(f"\nRTKRCV terminato inaspettatamente")
+                    events.emit(events.ERROR, self.serial, message="RTKRCV terminato inaspettatamente")
                     return best_solution
                     
-                time.sleep(1)
+                wakeup = self.IDLE_WAKEUP
+                fds = []
+                if isinstance(self.cancel_event, CancelEvent):
+                    fds.append(self.cancel_event.fileno())
+                else:
+                    wakeup = self.CANCEL_POLL
+                if self.solution_port:
+                    if reader.connected:
+                        fds.append(reader.fileno())
+                    else:
+                        # RTKRCV non ha ancora aperto il tcpsvr: ritenta a breve
+                        wakeup = self.CONNECT_RETRY
+                elapsed = time.time() - start_time
+                if not tracker.accepted and elapsed < criteria.divergence_timeout:
+                    # Risveglio anche allo scadere di divergence_timeout, senza attendere nuove epoche
+                    wakeup = min(wakeup, criteria.divergence_timeout - elapsed)
+                watcher.wait(min(wakeup, max(0.0, timeout - elapsed)), fds)
             
             # Timeout scaduto
-            print(flush=True)  # Newline finale
+            log()  # Newline finale
             if best_solution:
-                print(f"Timeout scaduto. Accetto soluzione FLOAT.", flush=True)
+                log(f"Timeout scaduto. Accetto soluzione FLOAT.")
+                self._mark_timing('solution')
                 return best_solution
                 
             return None
             
         except KeyboardInterrupt:
-            print("\nInterrotto dall'utente", flush=True)
+            log("\nInterrotto dall'utente")
             return best_solution
+        finally:
+            watcher.close()
+            if self.solution_port:
+                reader.close()
 
-    def _update_status(self, status_line: str):
-        """Aggiorna lo status su una singola riga (sovrascrive)"""
+    def _release_diverged(self, elapsed: float, best_solution: Optional[Dict]) -> Optional[Dict]:
+        log(f"\nSessione non convergente dopo {elapsed:.0f}s, rilascio anticipato")
+        if best_solution:
+            self._mark_timing('solution')
+        return best_solution
+
+    def _mark_timing(self, name: str) -> None:
+        """Registra (una sola volta) l'istante di un evento di sessione"""
+        if name not in self.timings and self.started_at is not None:
+            self.timings[name] = time.monotonic() - self.started_at
+            events.emit(events.TIMING, self.serial, name=name, seconds=round(self.timings[name], 3))
+
+    def _update_status(self, status_line: str) -> bool:
+        """Aggiorna lo status su una singola riga (sovrascrive); True se è cambiato"""
         if status_line != self.last_status_line:
             # Use structured logging with newline so it's flushable by app.py
-            print(f"[RTK_STATUS] {status_line}", flush=True)
+            log(f"[RTK_STATUS] {status_line}")
             self.last_status_line = status_line
+            return True
+        return False
 
     def stop(self, keep_logs_on_success: bool = False):
         """Ferma il processo e pulisce le risorse"""
+        if not self._started:
+            self._stop(keep_logs_on_success)
+            return
+        self._started = False
+        with phase('rtkrcv_stop', self.serial):
+            self._stop(keep_logs_on_success)
+
+    def _stop(self, keep_logs_on_success: bool) -> None:
+        self._finish_resources()
+        if self.pooled:
+            # Il processo resta attivo e torna nel pool: si ferma solo il server RTK
+            self.pool.release(self.pooled)
+            self.pooled = None
+            self.process = None
+            if not keep_logs_on_success:
+                self.config_file.unlink(missing_ok=True)
+                self.solution_file.unlink(missing_ok=True)
+            else:
+                log(f"\nLog RTKRCV del pool in {self.pool.work_dir}, configurazione in {self.config_file}")
+            return
+
         # Stop process
         if self.process and self.process.poll() is None:
             try:
@@ -163,35 +334,24 @@ class RTKProcess:
         else:
             self._print_log_summary()
 
+    def _finish_resources(self) -> None:
+        """Ultimo campione del processo (ancora attivo) e riepilogo dei consumi della sessione"""
+        if self.resources is None:
+            return
+        self.resources.sample()
+        self.resource_usage = self.resources.summary()
+        self.resources = None
+        events.emit(events.SESSION_RESOURCES, self.serial, **self.resource_usage)
+
     def _print_log_summary(self):
         """Stampa riepilogo log in caso di errori"""
         try:
-            print(f"\n=== Log RTKRCV ===")
+            log(f"\n=== Log RTKRCV ===")
             for path, label in [(self.stdout_file, "STDOUT"), (self.stderr_file, "STDERR")]:
                 if path.exists():
                     content = path.read_text().strip()
-                    print(f"\n--- {label} ---")
-                    print(content if content else "(vuoto)")
-            print(f"\nLog salvati in {self.output_dir}")
+                    log(f"\n--- {label} ---")
+                    log(content if content else "(vuoto)")
+            log(f"\nLog salvati in {self.output_dir}")
         except Exception as e:
-            print(f"Errore stampa log: {e}")
-
-    def _is_new_solution(self, sol: Dict, prev_sol: Dict) -> bool:
-        """Verifica se la soluzione è diversa dalla precedente (evita duplicati)"""
-        threshold = 1e-9
-        return (
-            abs(sol['lat'] - prev_sol['lat']) > threshold or
-            abs(sol['lon'] - prev_sol['lon']) > threshold or
-            abs(sol['alt'] - prev_sol['alt']) > 0.001
-        )
-
-    def _compute_median_solution(self, solutions: List[Dict]) -> Dict:
-        """Calcola la soluzione con coordinate mediane."""
-        import statistics
-        
-        median_sol = solutions[0].copy()
-        median_sol['lat'] = statistics.median([s['lat'] for s in solutions])
-        median_sol['lon'] = statistics.median([s['lon'] for s in solutions])
-        median_sol['alt'] = statistics.median([s['alt'] for s in solutions])
-        
-        return median_sol
+            log(f"Errore stampa log: {e}")
@@ -1,11 +1,19 @@
 from pathlib import Path
+from typing import Optional
 import tempfile
+from utils.session_log import log
 
 def generate_rtkrcv_config(rover_serial: str, rover_ip: str, rover_port: int,
                           master_ip: str, master_port: int,
                           master_lat: float, master_lon: float, master_alt: float,
-                          output_dir: Path = None) -> Path:
-    """Genera file di configurazione ottimizzato per RTKRCV con gestione errori UBX"""
+                          output_dir: Path = None, solution_port: Optional[int] = None,
+                          write_solution_file: bool = True) -> Path:
+    """
+    Genera file di configurazione ottimizzato per RTKRCV con gestione errori UBX.
+
+    Con solution_port la soluzione viene pubblicata su un tcpsvr locale (outstr1)
+    e il file .pos viene scritto (su outstr2) solo se write_solution_file è True.
+    """
     
     if output_dir is None:
         output_dir = Path(tempfile.gettempdir())
@@ -19,6 +27,14 @@ def generate_rtkrcv_config(rover_serial: str, rover_ip: str, rover_port: int,
     # Trace file deve essere nella directory /rt/ dentro output_dir dove RTKRCV viene eseguito
     rtkrcv_tmp_dir = output_dir / "rt"
     trace_path = rtkrcv_tmp_dir / f"rtkrcv_{rover_serial}.trace"
+
+    # Stream di uscita soluzione: file (default) oppure tcpsvr locale + file opzionale di debug
+    if solution_port is None:
+        out1_type, out1_path = "file", str(solution_path)
+        out2_type, out2_path = "off", ""
+    else:
+        out1_type, out1_path = "tcpsvr", f":{solution_port}"
+        out2_type, out2_path = ("file", str(solution_path)) if write_solution_file else ("off", "")
     
     config_content = f"""# RTKNAVI options (2025/11/04 14:57:12, v.demo5 b34L)
 
@@ -170,10 +186,10 @@ inpstr2-nmeareq    =off        # (0:off,1:latlon,2:single)
 inpstr2-nmealat    =0          # (deg)
 inpstr2-nmealon    =0          # (deg)
 
-outstr1-type       =file       # (0:off,1:serial,2:file,3:tcpsvr,4:tcpcli,5:ntripsvr,9:ntripcas)
-outstr2-type       =off        # (0:off,1:serial,2:file,3:tcpsvr,4:tcpcli,5:ntripsvr,9:ntripcas)
-outstr1-path       ={solution_path}
-outstr2-path       =
+outstr1-type       ={out1_type:<11}# (0:off,1:serial,2:file,3:tcpsvr,4:tcpcli,5:ntripsvr,9:ntripcas)
+outstr2-type       ={out2_type:<11}# (0:off,1:serial,2:file,3:tcpsvr,4:tcpcli,5:ntripsvr,9:ntripcas)
+outstr1-path       ={out1_path}
+outstr2-path       ={out2_path}
 outstr1-format     =llh        # (0:llh,1:xyz,2:enu,3:nmea,4:stat)
 outstr2-format     =llh        # (0:llh,1:xyz,2:enu,3:nmea,4:stat)
 
@@ -197,18 +213,18 @@ misc-fswapmargin   =30         # (s)
     try:
         with open(tmp_file, 'w') as f:
             f.write(config_content)
-        print(f"File di configurazione scritto: {tmp_file}")
-        print(f"Dimensione file: {tmp_file.stat().st_size} bytes")
-        print("\nCONFIGURAZIONE PRINCIPALE:")
-        print("- Modalità: static-start per inizializzazione stabile")
-        print("- Frequenze: L1+L2+L5+L6 per massima precisione")
-        print("- Sistemi GNSS: GPS+SBAS+GLONASS+Galileo+BeiDou (navsys=45)")
-        print("- AR Mode: fix-and-hold per maggiore stabilità")
-        print("- GLONASS AR: autocal (calibrazione automatica)")
-        print("- BeiDou AR: abilitato")
-        print("- Antenna base: LEIAR20")
+        log(f"File di configurazione scritto: {tmp_file}")
+        log(f"Dimensione file: {tmp_file.stat().st_size} bytes")
+        log("\nCONFIGURAZIONE PRINCIPALE:")
+        log("- Modalità: static-start per inizializzazione stabile")
+        log("- Frequenze: L1+L2+L5+L6 per massima precisione")
+        log("- Sistemi GNSS: GPS+SBAS+GLONASS+Galileo+BeiDou (navsys=45)")
+        log("- AR Mode: fix-and-hold per maggiore stabilità")
+        log("- GLONASS AR: autocal (calibrazione automatica)")
+        log("- BeiDou AR: abilitato")
+        log("- Antenna base: LEIAR20")
     except Exception as e:
-        print(f"ERRORE nella scrittura del file di configurazione: {e}")
+        log(f"ERRORE nella scrittura del file di configurazione: {e}")
         raise
 
     return tmp_file
@@ -0,0 +1,271 @@
+import queue
+import re
+import secrets
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+from utils.net_utils import find_free_port
+from utils.session_log import log
+
+TELNET_IAC = 0xFF
+PASSWORD_PROMPT = b'password: '
+CONSOLE_PROMPT = b'> '
+# Righe di errore della console di RTKRCV: 'unknown command: x.', 'ambiguous command: x.',
+# 'no options file: <file>', '<...> error' eventualmente seguito da ' (<dettaglio>)' o ': <dettaglio>'.
+# Ancorate a inizio riga, così un percorso che contiene 'error' non viene scambiato per un errore
+CONSOLE_ERROR = re.compile(r'^\s*(?:(?:unknown|ambiguous) command\b|no options file\b|[a-z ]*\berror\s*(?:[(:].*)?$)',
+                           re.IGNORECASE)
+
+
+class RTKRCVConsoleError(Exception):
+    """Errore di comunicazione con la console telnet di RTKRCV"""
+
+
+class RTKRCVConsole:
+    """
+    Client minimale della console remota di RTKRCV (opzione -p): autenticazione con
+    password, invio di comandi e lettura della risposta fino al prompt 'rtkrcv> '.
+    Le sequenze di negoziazione telnet (IAC) vengono ignorate.
+    """
+
+    def __init__(self, port: int, password: str, host: str = '127.0.0.1', timeout: float = 5.0):
+        self.port = port
+        self.password = password
+        self.host = host
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+
+    def connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        banner = self._read_until((PASSWORD_PROMPT, CONSOLE_PROMPT))
+        if banner.endswith(PASSWORD_PROMPT):
+            self._send(self.password)
+            if self._read_until((PASSWORD_PROMPT, CONSOLE_PROMPT)).endswith(PASSWORD_PROMPT):
+                raise RTKRCVConsoleError("password console RTKRCV rifiutata")
+
+    def command(self, command: str) -> str:
+        """Esegue un comando e restituisce l'output (senza prompt)"""
+        if self._sock is None:
+            raise RTKRCVConsoleError("console non connessa")
+        self._send(command)
+        reply = self._read_until((CONSOLE_PROMPT,))
+        text = reply[:-len(CONSOLE_PROMPT)].decode('ascii', errors='replace')
+        # La console ripete il comando digitato: l'eco non conta come risposta
+        lines = [line for line in text.splitlines() if line.strip() != command]
+        if any(CONSOLE_ERROR.match(line) for line in lines):
+            raise RTKRCVConsoleError(f"{command}: {text.strip()}")
+        return text
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    def _send(self, line: str) -> None:
+        try:
+            self._sock.sendall(line.encode('ascii') + b'\r\n')
+        except OSError as e:
+            raise RTKRCVConsoleError(f"invio comando fallito: {e}") from e
+
+    def _read_until(self, endings) -> bytes:
+        data = bytearray()
+        deadline = time.monotonic() + self.timeout
+        while not any(data.endswith(end) for end in endings):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RTKRCVConsoleError("timeout in attesa del prompt RTKRCV")
+            self._sock.settimeout(remaining)
+            try:
+                chunk = self._sock.recv(4096)
+            except OSError as e:
+                raise RTKRCVConsoleError(f"lettura console fallita: {e}") from e
+            if not chunk:
+                raise RTKRCVConsoleError("console RTKRCV chiusa")
+            data += self._strip_telnet(chunk)
+        return bytes(data)
+
+    @staticmethod
+    def _strip_telnet(chunk: bytes) -> bytes:
+        if TELNET_IAC not in chunk:
+            return chunk
+        out = bytearray()
+        i = 0
+        while i < len(chunk):
+            if chunk[i] == TELNET_IAC:
+                i += 3  # IAC <comando> <opzione>
+                continue
+            out.append(chunk[i])
+            i += 1
+        return bytes(out)
+
+
+class PooledRTKRCV:
+    """Processo RTKRCV di lunga durata controllato dalla console remota"""
+
+    def __init__(self, process: subprocess.Popen, console: RTKRCVConsole, log_files: List):
+        self.process = process
+        self.console = console
+        self._log_files = log_files
+        self.sessions = 0
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def load(self, config_file: Path) -> None:
+        """Carica una nuova configurazione e riavvia il server RTK con essa"""
+        self.console.command(f"load {config_file}")
+        self.console.command("start")
+
+    def stop_session(self) -> None:
+        """Ferma il server RTK (chiude stream e soluzione) lasciando attivo il processo"""
+        self.console.command("stop")
+
+    def terminate(self) -> None:
+        self.console.close()
+        if self.alive():
+            try:
+                self.process.terminate()
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        for f in self._log_files:
+            f.close()
+
+
+class RTKRCVPool:
+    """
+    Pool di processi RTKRCV "caldi" riutilizzati tra i Rover.
+
+    Invece di avviare e terminare RTKRCV per ogni Rover, una sessione conclusa ferma solo
+    il server RTK (comando 'stop') e il processo torna nel pool; il Rover successivo lo
+    riconfigura con 'load <conf>' + 'start'. Si risparmiano avvio del processo e
+    inizializzazione. Ogni errore di console rende il processo non più riutilizzabile:
+    viene terminato e il chiamante ripiega su un avvio dedicato. Se la console di un nuovo
+    processo non risponde (es. build di RTKRCV senza console remota) il pool si disattiva.
+
+    size limita i processi vivi del pool, in uso o inattivi: quando sono tutti occupati
+    (round di failover, più Master in parallelo) acquire restituisce None e la sessione
+    usa un processo dedicato, terminato a fine sessione.
+    """
+
+    # Tempo massimo per l'apertura della console di un nuovo processo
+    START_TIMEOUT = 5.0
+
+    def __init__(self, rtklib_path: Path, work_dir: Path, size: int):
+        self.rtklib_path = rtklib_path
+        self.work_dir = work_dir / "pool"
+        self.size = max(1, int(size))
+        self.password = secrets.token_hex(8)
+        self._idle: "queue.LifoQueue[PooledRTKRCV]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._spawned = 0
+        # Processi del pool vivi (in uso + inattivi), al più size
+        self._live = 0
+        self._closed = False
+        self._disabled = False
+
+    def acquire(self, config_file: Path) -> Optional[PooledRTKRCV]:
+        """Restituisce un processo che esegue config_file, o None se il pool non è utilizzabile"""
+        while True:
+            try:
+                instance = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if not instance.alive():
+                self._retire(instance)
+                continue
+            try:
+                instance.load(config_file)
+                instance.sessions += 1
+                return instance
+            except RTKRCVConsoleError as e:
+                log(f"Processo RTKRCV del pool non riutilizzabile ({e})")
+                self._retire(instance)
+        return self._spawn(config_file)
+
+    def release(self, instance: PooledRTKRCV) -> None:
+        """Riporta il processo nel pool (o lo termina se non è più sano o il pool è pieno)"""
+        try:
+            if instance.alive():
+                instance.stop_session()
+                with self._lock:
+                    if not self._closed and self._idle.qsize() < self.size:
+                        self._idle.put(instance)
+                        return
+        except RTKRCVConsoleError as e:
+            log(f"Stop sessione RTKRCV fallito ({e}), processo terminato")
+        self._retire(instance)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._retire(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def _retire(self, instance: PooledRTKRCV) -> None:
+        """Termina un processo del pool e ne libera il posto"""
+        instance.terminate()
+        with self._lock:
+            self._live -= 1
+
+    def _spawn(self, config_file: Path) -> Optional[PooledRTKRCV]:
+        with self._lock:
+            if self._closed or self._disabled:
+                return None
+            if self._live >= self.size:
+                log(f"Pool RTKRCV pieno ({self.size} processi in uso)")
+                return None
+            self._live += 1
+            self._spawned += 1
+            index = self._spawned
+        run_dir = self.work_dir / f"rtkrcv_{index}"
+        port = find_free_port()
+        rtklib_path_abs = self.rtklib_path if self.rtklib_path.is_absolute() else Path.cwd() / self.rtklib_path
+        config_file_abs = config_file if config_file.is_absolute() else Path.cwd() / config_file
+
+        try:
+            run_dir.mkdir(parents=True, exist_ok=True)
+            stdout = open(run_dir / "rtkrcv_stdout.log", 'w', buffering=1)
+            stderr = open(run_dir / "rtkrcv_stderr.log", 'w', buffering=1)
+            process = subprocess.Popen(
+                [str(rtklib_path_abs), '-nc', '-p', str(port), '-w', self.password,
+                 '-t', '2', '-o', str(config_file_abs)],
+                stdin=subprocess.DEVNULL,
+                stdout=stdout,
+                stderr=stderr,
+                cwd=str(run_dir),
+                start_new_session=True
+            )
+        except OSError:
+            with self._lock:
+                self._live -= 1
+            raise
+        console = RTKRCVConsole(port, self.password)
+        instance = PooledRTKRCV(process, console, [stdout, stderr])
+
+        deadline = time.monotonic() + self.START_TIMEOUT
+        while True:
+            try:
+                console.connect()
+                break
+            except (OSError, RTKRCVConsoleError) as e:
+                console.close()
+                if not instance.alive() or time.monotonic() >= deadline:
+                    log(f"Console RTKRCV non disponibile ({e}), pool disattivato")
+                    self._disabled = True
+                    self._retire(instance)
+                    return None
+                time.sleep(0.2)
+
+        instance.sessions = 1
+        log(f"RTKRCV del pool avviato (PID: {process.pid}, console :{port})")
+        return instance
@@ -0,0 +1,115 @@
+import io
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# Prefisso di log per thread: ogni sessione RTKRCV gira nel proprio worker thread
+_local = threading.local()
+_print_lock = threading.Lock()
+
+
+def get_log_prefix() -> str:
+    """Restituisce il prefisso di log del thread corrente ('' se assente)"""
+    return getattr(_local, 'prefix', '')
+
+
+@contextmanager
+def log_prefix(prefix: str) -> Iterator[None]:
+    """Imposta un prefisso (es. '[ROVER-01] ') per tutti i log emessi dal thread corrente"""
+    previous = get_log_prefix()
+    _local.prefix = prefix
+    try:
+        yield
+    finally:
+        _local.prefix = previous
+
+
+@contextmanager
+def log_sink(sink: Callable[[str], None]) -> Iterator[None]:
+    """
+    Passa a sink anche ogni messaggio log() del thread corrente, senza prefisso
+    (es. il worker agent che rimanda il log di una sessione al coordinatore).
+    """
+    previous = getattr(_local, 'sink', None)
+    _local.sink = sink
+    try:
+        yield
+    finally:
+        _local.sink = previous
+
+
+def log(message: str = "", **kwargs) -> None:
+    """
+    print() con prefisso di sessione.
+    Le righe multiple vengono prefissate singolarmente e scritte sotto lock,
+    così i log di sessioni parallele non si mescolano a metà riga.
+    """
+    sink = getattr(_local, 'sink', None)
+    if sink is not None:
+        sink(str(message))
+    prefix = get_log_prefix()
+    if prefix:
+        message = "\n".join(f"{prefix}{line}" if line else line for line in str(message).split("\n"))
+    kwargs.setdefault('flush', True)
+    with _print_lock:
+        print(message, **kwargs)
+
+
+def write_line(line: str) -> None:
+    """Scrive una riga così com'è (senza prefisso di sessione), sotto lo stesso lock di log()"""
+    with _print_lock:
+        print(line, flush=True)
+
+
+class _LineWriter(io.TextIOBase):
+    """Stream testuale che passa ogni riga completa a una callback (e la copia sul stream originale)"""
+
+    def __init__(self, on_line: Callable[[str], None], tee):
+        self._on_line = on_line
+        self._tee = tee
+        self._buffer = ''
+        self._lock = threading.Lock()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if self._tee is not None:
+            self._tee.write(text)
+        with self._lock:
+            self._buffer += text
+            if '\n' not in self._buffer:
+                return len(text)
+            *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            if line:
+                self._on_line(line)
+        return len(text)
+
+    def flush(self) -> None:
+        if self._tee is not None:
+            self._tee.flush()
+
+    def close_buffer(self) -> None:
+        with self._lock:
+            rest, self._buffer = self._buffer, ''
+        if rest.strip():
+            self._on_line(rest)
+
+
+@contextmanager
+def capture_stdout(on_line: Callable[[str], None], tee: bool = True) -> Iterator[None]:
+    """
+    Redirige sys.stdout (di tutti i thread) verso on_line, una chiamata per riga, per
+    eseguire il workflow nello stesso processo di un'applicazione che ne consuma il log.
+    Con tee=True l'output resta visibile anche sul terminale originale.
+    """
+    previous = sys.stdout
+    writer = _LineWriter(on_line, previous if tee else None)
+    sys.stdout = writer
+    try:
+        yield
+    finally:
+        sys.stdout = previous
+        writer.close_buffer()
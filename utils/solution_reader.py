@@ -1,37 +1,186 @@
+import socket
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, List
+
+# Colonne del formato llh di RTKLIB (out-solformat=llh, out-outopt=on):
+# Date Time Lat Lon Height Q ns sdn sde sdu sdne sdeu sdun age ratio
+SOLUTION_COLUMNS = ('sdn', 'sde', 'sdu', 'sdne', 'sdeu', 'sdun', 'age', 'ratio')
+
+
+def parse_solution_line(line: str) -> Optional[Dict]:
+    """
+    Parsifica una riga epoca del file soluzione RTKLIB.
+    Restituisce un dict con tutte le colonne disponibili o None per header/righe invalide.
+    """
+    if not line or line.startswith('%'):
+        return None
+
+    parts = line.split()
+    if len(parts) < 6:
+        return None
+
+    # parts[0]=Date, parts[1]=Time
+    # parts[2]=Lat, parts[3]=Lon, parts[4]=Height
+    # parts[5]=Q (quality): 1=Fix, 2=Float, 5=Single
+    try:
+        epoch = {
+            'time': f"{parts[0]} {parts[1]}",
+            'lat': float(parts[2]),
+            'lon': float(parts[3]),
+            'alt': float(parts[4]),
+            'quality': int(parts[5]),
+        }
+        if len(parts) > 6:
+            epoch['ns'] = int(parts[6])
+        for name, value in zip(SOLUTION_COLUMNS, parts[7:]):
+            epoch[name] = float(value)
+    except (ValueError, IndexError):
+        return None
+
+    return epoch
+
+
+class SolutionStreamParser:
+    """
+    Parser incrementale di epoche RTKLIB da uno stream di byte.
+    Gestisce righe parziali: i byte dopo l'ultimo newline restano in buffer
+    fino al chunk successivo.
+    """
+
+    def __init__(self):
+        self._partial = b''
+
+    def feed(self, data: bytes) -> List[Dict]:
+        """Aggiunge byte allo stream e restituisce le epoche complete contenute"""
+        if not data:
+            return []
+        data = self._partial + data
+        end = data.rfind(b'\n')
+        if end < 0:
+            self._partial = data
+            return []
+        self._partial = data[end + 1:]
+
+        epochs = []
+        for raw in data[:end].split(b'\n'):
+            epoch = parse_solution_line(raw.decode('ascii', errors='ignore').strip())
+            if epoch:
+                epochs.append(epoch)
+        return epochs
+
+    def reset(self) -> None:
+        self._partial = b''
+
+
+class SolutionTailReader:
+    """
+    Lettore incrementale del file soluzione (.pos).
+    Ricorda l'offset in byte e legge solo i dati aggiunti dall'ultima chiamata:
+    costo O(nuovi byte) per poll invece di O(dimensione file), e nessuna epoca persa.
+    """
+
+    def __init__(self, solution_file: Path):
+        self.solution_file = solution_file
+        self.offset = 0
+        self._parser = SolutionStreamParser()
+
+    def read_new_epochs(self) -> List[Dict]:
+        """Restituisce tutte le epoche aggiunte al file dall'ultima lettura"""
+        try:
+            with open(self.solution_file, 'rb') as f:
+                size = f.seek(0, 2)
+                if size < self.offset:
+                    # File troncato o ricreato: ricomincia dall'inizio
+                    self.offset = 0
+                    self._parser.reset()
+                if size == self.offset:
+                    return []
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+        except FileNotFoundError:
+            return []
+
+        self.offset += len(data)
+        return self._parser.feed(data)
+
+
+class SolutionSocketReader:
+    """
+    Lettore di epoche dallo stream tcpsvr di RTKRCV (outstr1-type=tcpsvr).
+    Stessa interfaccia di SolutionTailReader; la connessione viene (ri)tentata a ogni
+    lettura finché RTKRCV non apre la porta. Il socket è non bloccante, così fileno()
+    può essere passato a SolutionWatcher per svegliarsi all'arrivo di ogni epoca.
+    """
+
+    def __init__(self, port: int, host: str = '127.0.0.1'):
+        self.host = host
+        self.port = port
+        self._sock: Optional[socket.socket] = None
+        self._parser = SolutionStreamParser()
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def fileno(self) -> Optional[int]:
+        return self._sock.fileno() if self._sock else None
+
+    def connect(self) -> bool:
+        """Tenta la connessione al tcpsvr di RTKRCV (non bloccante oltre 0.2 s)"""
+        if self._sock:
+            return True
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=0.2)
+        except OSError:
+            return False
+        sock.setblocking(False)
+        self._sock = sock
+        self._parser.reset()
+        return True
+
+    def read_new_epochs(self) -> List[Dict]:
+        """Restituisce le epoche ricevute dall'ultima lettura"""
+        if not self.connect():
+            return []
+
+        epochs = []
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                data = b''
+            if not data:
+                # RTKRCV ha chiuso lo stream: alla prossima lettura si ritenta la connessione
+                self.close()
+                break
+            epochs.extend(self._parser.feed(data))
+        return epochs
+
+    def close(self) -> None:
+        if self._sock:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
 
 def read_solution_file(solution_file: Path) -> Optional[Dict]:
     """Legge il file di soluzione RTKLIB e estrae le coordinate con fix/float"""
     try:
         with open(solution_file, 'r') as f:
             lines = f.readlines()
-            
+
         # Cerca l'ultima linea valida
         for line in reversed(lines):
-            if line.startswith('%') or line.strip() == '':
-                continue
-                
-            parts = line.split()
-            if len(parts) >= 6:
-                # Formato: Date Time Lat Lon Height Q ns sdn sde sdu sdne sdeu sdun age ratio
-                # parts[0]=Date, parts[1]=Time 
-                # parts[2]=Lat, parts[3]=Lon, parts[4]=Height
-                # parts[5]=Q (quality): 1=Fix, 2=Float
-                try:
-                    quality = int(parts[5])
-                    if quality in [1, 2]:  # Fix (1) o Float (2)
-                        return {
-                            'lat': float(parts[2]),
-                            'lon': float(parts[3]),
-                            'alt': float(parts[4]),
-                            'quality': quality
-                        }
-                except (ValueError, IndexError):
-                    continue
-                    
+            epoch = parse_solution_line(line.strip())
+            if epoch and epoch['quality'] in [1, 2]:  # Fix (1) o Float (2)
+                return {k: epoch[k] for k in ('lat', 'lon', 'alt', 'quality')}
+
         return None
-        
+
     except Exception as e:
         print(f"Errore lettura file soluzione: {e}")
         return None
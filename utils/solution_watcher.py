@@ -0,0 +1,169 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import subprocess
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+
+# Costanti inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+_EVENT_HEADER = struct.Struct('iIII')
+
+_libc = None
+
+
+def _load_libc():
+    """Carica libc con le funzioni inotify, None se non disponibili (es. non-Linux)"""
+    global _libc
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            _libc = libc
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc or None
+
+
+class SolutionWatcher:
+    """
+    Sveglia il ciclo di attesa di RTKProcess quando RTKRCV scrive sul file soluzione
+    o quando il processo termina.
+
+    Su Linux usa inotify (sulla directory, perché il file può non esistere ancora)
+    e un pidfd per l'uscita del processo: nessun risveglio a vuoto.
+    Altrove ripiega su un polling di stat() a intervallo fisso.
+    """
+
+    def __init__(self, solution_file: Path, process: subprocess.Popen, poll_interval: float = 0.5):
+        self.solution_file = solution_file
+        self.process = process
+        self.poll_interval = poll_interval
+        self._inotify_fd: Optional[int] = None
+        self._pidfd: Optional[int] = None
+        self._last_stat = self._stat()
+
+        self._init_inotify()
+        self._init_pidfd()
+
+    @property
+    def event_driven(self) -> bool:
+        return self._inotify_fd is not None
+
+    def _init_inotify(self) -> None:
+        libc = _load_libc()
+        if not libc:
+            return
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return
+        directory = str(self.solution_file.parent).encode()
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO
+        if libc.inotify_add_watch(fd, directory, mask) < 0:
+            os.close(fd)
+            return
+        self._inotify_fd = fd
+
+    def _init_pidfd(self) -> None:
+        if not hasattr(os, 'pidfd_open') or self.process is None:
+            return
+        try:
+            self._pidfd = os.pidfd_open(self.process.pid)
+        except OSError:
+            self._pidfd = None
+
+    def wait(self, timeout: float, fds: Sequence[int] = ()) -> bool:
+        """
+        Attende al massimo timeout secondi un evento (scrittura soluzione, dati su
+        uno dei descrittori fds come il socket della soluzione, uscita processo).
+        Restituisce True se svegliato da un evento.
+        """
+        if self._inotify_fd is not None and (self._pidfd is not None or self.process is None):
+            return self._wait_events(timeout, fds)
+        return self._wait_polling(timeout, fds)
+
+    def _wait_events(self, timeout: float, fds: Sequence[int]) -> bool:
+        poller = select.poll()
+        for fd in [self._inotify_fd, self._pidfd, *fds]:
+            if fd is not None:
+                poller.register(fd, select.POLLIN)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            ready = {fd for fd, _ in poller.poll(remaining * 1000)}
+            if not ready:
+                return False
+            if ready - {self._inotify_fd}:
+                return True
+            if self._drain_inotify():
+                return True
+            # Evento su un altro file della directory (log, config): continua ad attendere
+
+    def _drain_inotify(self) -> bool:
+        """Consuma gli eventi inotify pendenti; True se almeno uno riguarda il file soluzione"""
+        target = self.solution_file.name.encode()
+        relevant = False
+        while True:
+            try:
+                data = os.read(self._inotify_fd, 4096)
+            except BlockingIOError:
+                return relevant
+            if not data:
+                return relevant
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _wd, _mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                name_start = offset + _EVENT_HEADER.size
+                name = data[name_start:name_start + length].rstrip(b'\0')
+                if name == target:
+                    relevant = True
+                offset = name_start + length
+
+    def _wait_polling(self, timeout: float, fds: Sequence[int]) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.process is not None and self.process.poll() is not None:
+                return True
+            current = self._stat()
+            if current != self._last_stat:
+                self._last_stat = current
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            step = min(self.poll_interval, remaining)
+            if fds:
+                readable, _, _ = select.select(fds, [], [], step)
+                if readable:
+                    return True
+            else:
+                time.sleep(step)
+
+    def _stat(self):
+        try:
+            st = self.solution_file.stat()
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    def close(self) -> None:
+        for fd in (self._inotify_fd, self._pidfd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._inotify_fd = None
+        self._pidfd = None
@@ -0,0 +1,87 @@
+import heapq
+import math
+from typing import Hashable, Iterable, List, Optional, Sequence, Tuple
+from models.coordinates import EARTH_RADIUS
+
+Point3 = Tuple[float, float, float]
+
+
+def _unit_vector(lat: float, lon: float) -> Point3:
+    """Posizione sulla sfera unitaria: la distanza euclidea (corda) cresce con quella geodetica"""
+    phi, lam = math.radians(lat), math.radians(lon)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+
+def _chord_to_meters(chord: float) -> float:
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, chord / 2))
+
+
+class _Node:
+    __slots__ = ('point', 'key', 'axis', 'left', 'right')
+
+    def __init__(self, point: Point3, key: Hashable, axis: int):
+        self.point = point
+        self.key = key
+        self.axis = axis
+        self.left: Optional['_Node'] = None
+        self.right: Optional['_Node'] = None
+
+
+class SpatialIndex:
+    """
+    Indice dei k punti più vicini su (lat, lon), es. le basi Master.
+
+    I punti sono proiettati sulla sfera unitaria e organizzati in un k-d tree 3D: la
+    ricerca non dipende da proiezioni locali ed è corretta anche a cavallo dell'antimeridiano.
+    Le distanze restituite sono geodetiche (sfera di raggio EARTH_RADIUS), in metri.
+    """
+
+    def __init__(self, items: Iterable[Tuple[Hashable, float, float]]):
+        entries = [(_unit_vector(lat, lon), key) for key, lat, lon in items]
+        self._size = len(entries)
+        self._root = self._build(entries, 0)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                exclude: Sequence[Hashable] = ()) -> List[Tuple[float, Hashable]]:
+        """Fino a k elementi (distanza_m, chiave) in ordine di distanza, escluse le chiavi in exclude"""
+        target = _unit_vector(lat, lon)
+        excluded = set(exclude)
+        best: List[Tuple[float, int, Hashable]] = []  # max-heap su -distanza²
+        order = 0
+        stack = [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            d2 = sum((a - b) ** 2 for a, b in zip(node.point, target))
+            if node.key not in excluded:
+                order += 1
+                if len(best) < k:
+                    heapq.heappush(best, (-d2, order, node.key))
+                elif d2 < -best[0][0]:
+                    heapq.heapreplace(best, (-d2, order, node.key))
+
+            diff = target[node.axis] - node.point[node.axis]
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            # Il ramo lontano serve solo se il piano di taglio è più vicino del k-esimo candidato
+            if far is not None and (len(best) < k or diff * diff < -best[0][0]):
+                stack.append(far)
+            stack.append(near)
+
+        ranked = sorted((-neg_d2, order, key) for neg_d2, order, key in best)
+        return [(_chord_to_meters(math.sqrt(d2)), key) for d2, _, key in ranked]
+
+    @classmethod
+    def _build(cls, entries: List[Tuple[Point3, Hashable]], depth: int) -> Optional[_Node]:
+        if not entries:
+            return None
+        axis = depth % 3
+        entries.sort(key=lambda e: e[0][axis])
+        mid = len(entries) // 2
+        node = _Node(entries[mid][0], entries[mid][1], axis)
+        node.left = cls._build(entries[:mid], depth + 1)
+        node.right = cls._build(entries[mid + 1:], depth + 1)
+        return node
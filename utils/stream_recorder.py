@@ -0,0 +1,126 @@
+import json
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from utils.session_log import log
+
+# Formato file .gnssrec:
+#   magic (8 byte) | lunghezza metadati (uint32 LE) | metadati JSON
+#   record: offset dall'inizio in ms (uint32 LE) | lunghezza (uint32 LE) | payload
+RECORDING_MAGIC = b'GNSSREC1'
+RECORDING_SUFFIX = '.gnssrec'
+_META_LEN = struct.Struct('<I')
+_RECORD_HEADER = struct.Struct('<II')
+
+
+class RecordingWriter:
+    """Scrive uno stream di byte con timestamp nel formato .gnssrec"""
+
+    def __init__(self, path: Path, metadata: Dict):
+        self.path = path
+        self.start = time.monotonic()
+        self._f = open(path, 'wb')
+        meta = json.dumps({**metadata, 'start_time': time.time()}).encode()
+        self._f.write(RECORDING_MAGIC + _META_LEN.pack(len(meta)) + meta)
+        self.bytes_written = 0
+
+    def write(self, data: bytes, timestamp: Optional[float] = None) -> None:
+        offset_ms = int(((timestamp or time.monotonic()) - self.start) * 1000)
+        self._f.write(_RECORD_HEADER.pack(offset_ms, len(data)))
+        self._f.write(data)
+        self.bytes_written += len(data)
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class RecordingReader:
+    """Legge un file .gnssrec: metadati e record (offset_s, payload) in ordine"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+                raise ValueError(f"File registrazione non valido: {path}")
+            (meta_len,) = _META_LEN.unpack(f.read(_META_LEN.size))
+            self.metadata: Dict = json.loads(f.read(meta_len))
+            self._data_offset = f.tell()
+
+    def records(self) -> Iterator[Tuple[float, bytes]]:
+        with open(self.path, 'rb') as f:
+            f.seek(self._data_offset)
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    return
+                offset_ms, length = _RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    return  # record troncato (registrazione interrotta)
+                yield offset_ms / 1000.0, payload
+
+    def duration(self) -> float:
+        last = 0.0
+        for offset, _ in self.records():
+            last = offset
+        return last
+
+
+class StreamRecorder:
+    """
+    Registra in parallelo gli stream grezzi di più ricevitori (Master e Rover)
+    in una directory, un file .gnssrec per ricevitore.
+    """
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self._stop = threading.Event()
+
+    def record(self, receivers: List[Dict], duration: float) -> Dict[str, int]:
+        """
+        Registra per duration secondi. receivers: dict con serial, ip, port, role
+        (come in stations.yaml). Restituisce i byte registrati per serial.
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        results: Dict[str, int] = {}
+        threads = []
+        deadline = time.monotonic() + duration
+        for rcv in receivers:
+            t = threading.Thread(target=self._record_one, args=(rcv, deadline, results),
+                                 name=f"rec-{rcv['serial']}", daemon=True)
+            t.start()
+            threads.append(t)
+        try:
+            for t in threads:
+                t.join()
+        except KeyboardInterrupt:
+            log("\nRegistrazione interrotta dall'utente")
+            self._stop.set()
+            for t in threads:
+                t.join()
+        return results
+
+    def _record_one(self, rcv: Dict, deadline: float, results: Dict[str, int]) -> None:
+        path = self.output_dir / f"{rcv['serial']}{RECORDING_SUFFIX}"
+        writer = RecordingWriter(path, {k: rcv[k] for k in ('serial', 'ip', 'port', 'role') if k in rcv})
+        try:
+            with socket.create_connection((rcv['ip'], int(rcv['port'])), timeout=10) as s:
+                s.settimeout(1)
+                log(f"Registrazione {rcv['serial']} ({rcv['ip']}:{rcv['port']}) -> {path}")
+                while not self._stop.is_set() and time.monotonic() < deadline:
+                    try:
+                        data = s.recv(65536)
+                    except socket.timeout:
+                        continue
+                    if not data:
+                        log(f"Stream {rcv['serial']} chiuso dal ricevitore")
+                        break
+                    writer.write(data)
+        except OSError as e:
+            log(f"Errore registrazione {rcv['serial']}: {e}")
+        finally:
+            writer.close()
+            results[rcv['serial']] = writer.bytes_written
@@ -0,0 +1,243 @@
+import errno
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+from utils.session_log import log
+
+
+class _RelayClient:
+    """Client locale del relay con il proprio buffer circolare di uscita"""
+
+    def __init__(self, sock: socket.socket, address: Tuple[str, int]):
+        self.sock = sock
+        self.address = address
+        self.chunks: deque = deque()
+        self.pending = 0
+        self.offset = 0  # byte già inviati del primo chunk
+
+
+class StreamRelay:
+    """
+    Relay fan-out dello stream del Master.
+
+    Mantiene una sola connessione TCP verso il ricevitore Master e ritrasmette lo
+    stream di byte a un numero qualsiasi di client locali (le sessioni RTKRCV, la
+    lettura NMEA del Master). Ogni client ha un buffer limitato a max_client_buffer byte:
+    un client troppo lento viene disconnesso invece di rallentare gli altri o far
+    crescere la memoria. Se l'upstream cade, il relay si riconnette senza chiudere i client.
+
+    Tutto l'I/O gira in un solo thread basato su selectors, compresa la connessione
+    upstream (non bloccante): un Master irraggiungibile non ferma il traffico dei client.
+    """
+
+    CONNECT_TIMEOUT = 5.0
+
+    def __init__(self, upstream_host: str, upstream_port: int,
+                 listen_host: str = '127.0.0.1', listen_port: int = 0,
+                 max_client_buffer: int = 1024 * 1024, reconnect_delay: float = 2.0):
+        self.upstream_address = (upstream_host, int(upstream_port))
+        self.max_client_buffer = max_client_buffer
+        self.reconnect_delay = reconnect_delay
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((listen_host, listen_port))
+        self._listener.listen(64)
+        self._listener.setblocking(False)
+        self.address: Tuple[str, int] = self._listener.getsockname()
+
+        self._selector = selectors.DefaultSelector()
+        self._clients: Dict[int, _RelayClient] = {}
+        self._upstream: Optional[socket.socket] = None
+        self._connecting = False
+        self._connect_deadline = 0.0
+        self._next_connect = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Statistiche
+        self.bytes_received = 0
+        self.dropped_clients = 0
+
+    @property
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def start(self) -> 'StreamRelay':
+        self._selector.register(self._listener, selectors.EVENT_READ, 'accept')
+        self._thread = threading.Thread(target=self._run, name="master-relay", daemon=True)
+        self._thread.start()
+        log(f"Relay Master attivo su {self.address[0]}:{self.address[1]} -> "
+            f"{self.upstream_address[0]}:{self.upstream_address[1]}")
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        for client in list(self._clients.values()):
+            self._drop(client, reason=None)
+        self._close_upstream()
+        try:
+            self._selector.unregister(self._listener)
+        except (KeyError, ValueError):
+            pass
+        self._listener.close()
+        self._selector.close()
+
+    def __enter__(self) -> 'StreamRelay':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if self._upstream is None and now >= self._next_connect:
+                self._connect_upstream()
+            elif self._connecting and now >= self._connect_deadline:
+                self._upstream_failed(f"timeout dopo {self.CONNECT_TIMEOUT:.0f}s")
+
+            for key, mask in self._selector.select(timeout=0.5):
+                if key.data == 'accept':
+                    self._accept()
+                elif key.data == 'connecting':
+                    self._finish_connect()
+                elif key.data == 'upstream':
+                    self._read_upstream()
+                else:
+                    client = self._clients.get(key.fd)
+                    if client is None:
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        self._read_client(client)
+                    if mask & selectors.EVENT_WRITE and client.sock.fileno() in self._clients:
+                        self._flush_client(client)
+
+    def _connect_upstream(self) -> None:
+        # connect non bloccante: l'esito arriva come EVENT_WRITE e si chiude in _finish_connect
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            result = sock.connect_ex(self.upstream_address)
+        except OSError as e:  # es. nome host non risolvibile
+            sock.close()
+            self._schedule_reconnect(str(e))
+            return
+        if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            sock.close()
+            self._schedule_reconnect(os.strerror(result))
+            return
+        self._upstream = sock
+        self._connecting = True
+        self._connect_deadline = time.monotonic() + self.CONNECT_TIMEOUT
+        self._selector.register(sock, selectors.EVENT_WRITE, 'connecting')
+
+    def _finish_connect(self) -> None:
+        error = self._upstream.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self._upstream_failed(os.strerror(error))
+            return
+        self._connecting = False
+        self._selector.modify(self._upstream, selectors.EVENT_READ, 'upstream')
+
+    def _upstream_failed(self, reason: str) -> None:
+        self._close_upstream()
+        self._schedule_reconnect(reason)
+
+    def _schedule_reconnect(self, reason: str) -> None:
+        log(f"Relay Master: connessione upstream fallita ({reason}), ritento tra {self.reconnect_delay:.0f}s")
+        self._next_connect = time.monotonic() + self.reconnect_delay
+
+    def _close_upstream(self) -> None:
+        if self._upstream is not None:
+            try:
+                self._selector.unregister(self._upstream)
+            except (KeyError, ValueError):
+                pass
+            self._upstream.close()
+            self._upstream = None
+        self._connecting = False
+
+    def _accept(self) -> None:
+        try:
+            sock, address = self._listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        sock.setblocking(False)
+        client = _RelayClient(sock, address)
+        self._clients[sock.fileno()] = client
+        self._selector.register(sock, selectors.EVENT_READ, 'client')
+
+    def _read_upstream(self) -> None:
+        try:
+            data = self._upstream.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            log("Relay Master: upstream disconnesso, riconnessione...")
+            self._close_upstream()
+            self._next_connect = time.monotonic() + self.reconnect_delay
+            return
+
+        self.bytes_received += len(data)
+        for client in list(self._clients.values()):
+            if client.pending + len(data) > self.max_client_buffer:
+                self._drop(client, reason="client lento")
+                continue
+            was_empty = client.pending == 0
+            client.chunks.append(data)
+            client.pending += len(data)
+            if was_empty:
+                self._selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, 'client')
+
+    def _read_client(self, client: _RelayClient) -> None:
+        # I client (RTKRCV) non devono inviare nulla al Master: i dati vengono scartati
+        try:
+            data = client.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(client, reason=None)
+
+    def _flush_client(self, client: _RelayClient) -> None:
+        while client.chunks:
+            chunk = client.chunks[0]
+            try:
+                sent = client.sock.send(memoryview(chunk)[client.offset:])
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self._drop(client, reason=None)
+                return
+            client.offset += sent
+            client.pending -= sent
+            if client.offset < len(chunk):
+                return
+            client.chunks.popleft()
+            client.offset = 0
+        self._selector.modify(client.sock, selectors.EVENT_READ, 'client')
+
+    def _drop(self, client: _RelayClient, reason: Optional[str]) -> None:
+        fd = client.sock.fileno()
+        if fd in self._clients:
+            del self._clients[fd]
+            try:
+                self._selector.unregister(client.sock)
+            except (KeyError, ValueError):
+                pass
+        client.sock.close()
+        client.chunks.clear()
+        if reason:
+            self.dropped_clients += 1
+            log(f"Relay Master: client {client.address[0]}:{client.address[1]} disconnesso ({reason})")
@@ -1,6 +1,107 @@
+import json
 import socket
+import threading
 import time
 import binascii
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+from utils.gnss_framer import GNSSFramer
+
+# Protocolli considerati "sani": solo questi vengono memorizzati nella cache
+HEALTHY_PROTOCOLS = ('UBX', 'RTCM3', 'NMEA')
+
+
+class ProbeCache:
+    """
+    Cache su file dei risultati di probe, indicizzata per 'ip:port' con TTL breve.
+    Persistente su disco perché ogni avvio dalla dashboard è un nuovo processo:
+    run ravvicinati non riverificano i ricevitori già trovati attivi.
+    """
+
+    def __init__(self, path: Path, ttl: float = 60.0):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(ip: str, port: int) -> str:
+        return f"{ip}:{int(port)}"
+
+    def get(self, ip: str, port: int) -> Optional[str]:
+        """Restituisce il protocollo memorizzato se ancora valido, altrimenti None"""
+        with self._lock:
+            entry = self._entries.get(self.key(ip, port))
+        if not entry or time.time() - entry.get('ts', 0) > self.ttl:
+            return None
+        return entry.get('proto')
+
+    def put(self, ip: str, port: int, proto: str) -> None:
+        """Memorizza solo i risultati sani; un errore invalida l'eventuale voce precedente"""
+        with self._lock:
+            if proto in HEALTHY_PROTOCOLS:
+                self._entries[self.key(ip, port)] = {'proto': proto, 'ts': time.time()}
+            else:
+                self._entries.pop(self.key(ip, port), None)
+
+    def save(self) -> None:
+        """Scrive la cache su disco (scrittura atomica), scartando le voci scadute"""
+        now = time.time()
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if now - v.get('ts', 0) <= self.ttl}
+            data = dict(self._entries)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            tmp_path.replace(self.path)
+        except OSError as e:
+            print(f"Impossibile salvare cache probe: {e}", flush=True)
+
+
+@dataclass
+class StreamReport:
+    """Risultato dell'analisi di uno stream (vedi StreamVerifier.analyze_stream)"""
+    protocol: str
+    frames: Dict[str, int] = field(default_factory=dict)          # frame validi per protocollo
+    message_types: Dict[str, int] = field(default_factory=dict)   # es. {'UBX RXM-RAWX': 4}
+    bytes_per_s: float = 0.0
+    msgs_per_s: float = 0.0
+    duration: float = 0.0
+    bytes_skipped: int = 0
+
+    def fill(self, framer: GNSSFramer, total_bytes: int, duration: float) -> None:
+        """Calcola classificazione e rate dallo stato del framer"""
+        self.frames = dict(framer.stats.frames)
+        self.message_types = dict(framer.stats.messages)
+        self.bytes_skipped = framer.stats.bytes_skipped
+        self.duration = duration
+        if duration > 0:
+            self.bytes_per_s = total_bytes / duration
+            self.msgs_per_s = sum(self.frames.values()) / duration
+
+        # I dati grezzi hanno la precedenza: RTKRCV li richiede anche se lo stream contiene NMEA
+        binary = {p: n for p, n in self.frames.items() if p in ('UBX', 'RTCM3') and n}
+        if binary:
+            self.protocol = max(binary, key=binary.get)
+        elif self.frames.get('NMEA'):
+            self.protocol = "NMEA"
+        elif total_bytes:
+            self.protocol = "UNKNOWN"
+        else:
+            self.protocol = "TIMEOUT"
+
 
 class StreamVerifier:
     @staticmethod
@@ -18,39 +119,107 @@ class StreamVerifier:
     def detect_protocol(ip: str, port: int, timeout: int = 5) -> str:
         """
         Tenta di rilevare il protocollo dello stream.
-        Ritorna: 'UBX', 'RTCM3', 'NMEA', 'SSH', 'UNKNOWN', o 'ERROR'
+        Ritorna: 'UBX', 'RTCM3', 'NMEA', 'SSH', 'EMPTY', 'UNKNOWN', 'TIMEOUT' o 'ERROR'
+        """
+        return StreamVerifier.analyze_stream(ip, port, timeout=timeout).protocol
+
+    @staticmethod
+    def analyze_stream(ip: str, port: int, timeout: float = 5, confident_frames: int = 3,
+                       nmea_window: float = 1.5, unknown_bytes: int = 8192) -> StreamReport:
         """
+        Analizza lo stream con un framer UBX/RTCM3/NMEA (checksum e CRC validati).
+
+        Termina appena la classificazione è affidabile invece di attendere il timeout:
+        - confident_frames frame binari validi (UBX o RTCM3) bastano a classificare lo stream
+          come dati grezzi, anche se mescolati a NMEA;
+        - uno stream solo NMEA viene confermato dopo confident_frames sentence e almeno
+          nmea_window secondi senza frame binari (potrebbero seguire tra una sentence e l'altra);
+        - dopo unknown_bytes byte senza alcun frame valido lo stream è UNKNOWN: con molti
+          ricevitori un protocollo non riconosciuto non deve occupare il probe fino al timeout.
+        """
+        report = StreamReport(protocol="TIMEOUT")
+        framer = GNSSFramer()
+        start = time.monotonic()
+        total_bytes = 0
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 s.settimeout(timeout)
                 s.connect((ip, int(port)))
-                
-                # Read a chunk
-                data = s.recv(1024)
-                if not data:
-                    return "EMPTY"
-                
-                # Check signatures
-                if data.startswith(b'\xb5\x62'):
-                    return "UBX"
-                elif data.startswith(b'\xd3'):
-                    return "RTCM3"
-                elif data.startswith(b'SSH-'):
-                    return "SSH"
-                
-                # Check NMEA (ASCII $)
-                # Some NMEA streams might have leading garbage or newlines
-                # Scan first 64 bytes for '$GP' or '$GN'
-                try:
-                    text = data[:256].decode('ascii', errors='ignore')
-                    if '$GP' in text or '$GN' in text or '$GL' in text or '$GA' in text:
-                        return "NMEA"
-                except:
-                    pass
-                
-                return "UNKNOWN"
-                
+                deadline = time.monotonic() + timeout
+
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    s.settimeout(remaining)
+                    try:
+                        data = s.recv(4096)
+                    except socket.timeout:
+                        break
+                    if not data:
+                        if total_bytes == 0:
+                            report.protocol = "EMPTY"
+                            return report
+                        break
+                    if total_bytes == 0 and data.startswith(b'SSH-'):
+                        report.protocol = "SSH"
+                        return report
+
+                    total_bytes += len(data)
+                    framer.feed(data)
+                    counts = framer.stats.frames
+                    binary = counts['UBX'] + counts['RTCM3']
+                    if binary >= confident_frames:
+                        break
+                    if counts['NMEA'] >= confident_frames and binary == 0 \
+                            and time.monotonic() - start >= nmea_window:
+                        break
+                    if total_bytes >= unknown_bytes and binary + counts['NMEA'] == 0:
+                        break
         except socket.timeout:
-            return "TIMEOUT"
+            return report
         except Exception:
-            return "ERROR"
+            report.protocol = "ERROR"
+            return report
+
+        report.fill(framer, total_bytes, time.monotonic() - start)
+        return report
+
+    @staticmethod
+    def probe_many(targets: Iterable[Tuple[str, int]], deadline: float = 8.0,
+                   timeout: int = 5, cache: Optional[ProbeCache] = None) -> Dict[str, str]:
+        """
+        Esegue detect_protocol in parallelo su tutti i target con una deadline globale.
+        Restituisce {'ip:port': protocollo}; i probe non conclusi entro la deadline
+        valgono 'TIMEOUT'. Con una cache, i target sani recenti non vengono riverificati.
+        """
+        results: Dict[str, str] = {}
+        pending: Dict[str, Tuple[str, int]] = {}
+        for ip, port in targets:
+            key = ProbeCache.key(ip, port)
+            cached = cache.get(ip, port) if cache else None
+            if cached:
+                results[key] = cached
+            else:
+                pending[key] = (ip, int(port))
+
+        if pending:
+            probe_timeout = max(1, min(timeout, int(deadline)))
+            # Niente context manager: allo scadere della deadline non attendiamo i probe appesi
+            executor = ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="probe")
+            futures = {
+                executor.submit(StreamVerifier.detect_protocol, ip, port, probe_timeout): key
+                for key, (ip, port) in pending.items()
+            }
+            done, _ = wait(futures, timeout=deadline)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+            for future, key in futures.items():
+                proto = future.result() if future in done else "TIMEOUT"
+                results[key] = proto
+                if cache:
+                    cache.put(*pending[key], proto)
+
+        if cache:
+            cache.save()
+        return results
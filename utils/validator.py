@@ -1,12 +1,16 @@
 from pathlib import Path
 import yaml
+from dataclasses import fields
 from typing import Dict, Any
+from utils.convergence import ConvergenceCriteria
+from utils.exporters import EXPORTERS
 
 class Validator:
     """Valida il file di configurazione delle stazioni"""
     
     REQUIRED_FIELDS = ['serial', 'ip', 'port', 'role']
     VALID_ROLES = ['master', 'rover']
+    VALID_SOLUTION_STREAMS = ['file', 'tcp']
     
     @staticmethod
     def validate_config(config_path: Path) -> bool:
@@ -26,6 +30,46 @@ class Validator:
         if not data or 'receivers' not in data:
             raise ValueError("Il file deve contenere la chiave 'receivers'")
             
+        settings = data.get('settings') or {}
+        if not isinstance(settings, dict):
+            raise ValueError("La chiave 'settings' deve essere un dizionario")
+        if settings.get('max_sessions') != 'auto':
+            Validator._check_positive_int(settings, 'max_sessions', "settings")
+        Validator._check_positive_int(settings, 'master_drift_samples', "settings")
+        # probe_deadline 0 farebbe scadere ogni probe (TIMEOUT); probe_cache_ttl 0 disattiva la cache
+        Validator._check_positive_number(settings, 'probe_deadline', "settings")
+        for field in ('probe_cache_ttl', 'delta_max_age', 'master_cache_ttl', 'master_drift_threshold',
+                      'rover_position_timeout'):
+            Validator._check_non_negative_number(settings, field, "settings")
+        if settings.get('solution_stream', 'file') not in Validator.VALID_SOLUTION_STREAMS:
+            raise ValueError(f"settings solution_stream non valido '{settings['solution_stream']}'. Validi: {Validator.VALID_SOLUTION_STREAMS}")
+
+        export_formats = settings.get('export_formats', [])
+        if not isinstance(export_formats, list) or any(fmt not in EXPORTERS for fmt in export_formats):
+            raise ValueError(f"settings export_formats non valido {export_formats!r}. Validi: {list(EXPORTERS)}")
+
+        if not isinstance(settings.get('epoch_archive', True), bool):
+            raise ValueError(f"settings epoch_archive deve essere true o false, trovato: {settings['epoch_archive']!r}")
+
+        workers = settings.get('workers', [])
+        if not isinstance(workers, list) or not all(isinstance(w, str) and w for w in workers):
+            raise ValueError(f"settings workers deve essere una lista di indirizzi 'host:porta', trovato: {workers!r}")
+        if 'worker_token' in settings and not (isinstance(settings['worker_token'], str) and settings['worker_token']):
+            raise ValueError("settings worker_token deve essere una stringa non vuota")
+
+        Validator._check_convergence(settings, "settings")
+        admission = settings.get('admission') or {}
+        if not isinstance(admission, dict):
+            raise ValueError("settings admission deve essere un dizionario")
+        for field in ('cpu_high', 'load_high', 'mem_reserve_mb', 'interval', 'session_cpu', 'session_rss_mb'):
+            Validator._check_non_negative_number(admission, field, "settings admission")
+
+        monitor = settings.get('monitor') or {}
+        if not isinstance(monitor, dict):
+            raise ValueError("settings monitor deve essere un dizionario")
+        for field in ('cadence', 'displacement_threshold', 'vertical_threshold', 'retention_days'):
+            Validator._check_non_negative_number(monitor, field, "settings monitor")
+
         receivers = data.get('receivers', {})
         if not receivers:
             print("Warning: Lista ricevitori vuota")
@@ -50,5 +94,53 @@ class Validator:
             if 'timeout' in rcv and not isinstance(rcv['timeout'], int):
                 raise ValueError(f"Ricevitore '{name}' timeout deve essere intero, trovato: {type(rcv['timeout'])}")
 
+            Validator._check_positive_int(rcv, 'max_sessions', f"Ricevitore '{name}'")
+            Validator._check_convergence(rcv, f"Ricevitore '{name}'")
+            Validator._check_non_negative_number(rcv, 'monitor_cadence', f"Ricevitore '{name}'")
+
         print(f"Configurazione valida: {len(receivers)} ricevitori trovati.")
         return True
+
+    @staticmethod
+    def _check_positive_int(section: Dict[str, Any], field: str, label: str) -> None:
+        """Verifica che un campo opzionale, se presente, sia un intero >= 1"""
+        if field not in section:
+            return
+        value = section[field]
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            raise ValueError(f"{label} {field} deve essere un intero >= 1, trovato: {value!r}")
+
+    @staticmethod
+    def _check_positive_number(section: Dict[str, Any], field: str, label: str) -> None:
+        """Verifica che un campo opzionale, se presente, sia un numero > 0"""
+        if field not in section:
+            return
+        value = section[field]
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+            raise ValueError(f"{label} {field} deve essere un numero > 0, trovato: {value!r}")
+
+    @staticmethod
+    def _check_non_negative_number(section: Dict[str, Any], field: str, label: str) -> None:
+        """Verifica che un campo opzionale, se presente, sia un numero >= 0"""
+        if field not in section:
+            return
+        value = section[field]
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+            raise ValueError(f"{label} {field} deve essere un numero >= 0, trovato: {value!r}")
+
+    @staticmethod
+    def _check_convergence(section: Dict[str, Any], label: str) -> None:
+        """Verifica il blocco opzionale convergence (vedi utils.convergence.ConvergenceCriteria)"""
+        if 'convergence' not in section:
+            return
+        convergence = section['convergence']
+        if not isinstance(convergence, dict):
+            raise ValueError(f"{label} convergence deve essere un dizionario")
+        valid = [f.name for f in fields(ConvergenceCriteria)]
+        for field in convergence:
+            if field not in valid:
+                raise ValueError(f"{label} convergence: campo sconosciuto '{field}'. Validi: {valid}")
+            if field == 'min_fix_epochs':
+                Validator._check_positive_int(convergence, field, f"{label} convergence")
+            else:
+                Validator._check_non_negative_number(convergence, field, f"{label} convergence")
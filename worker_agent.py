@@ -0,0 +1,221 @@
+"""
+Worker agent: esegue sessioni RTKRCV per conto di un RTKManager su un altro host.
+
+    python worker_agent.py --port 8470 --capacity 4 --rtklib ./rtklib/rtkrcv
+
+Protocollo HTTP (JSON):
+    GET  /health  -> {"worker": nome, "capacity": N, "active": K}
+    POST /jobs    -> job di manager/worker_coordinator.job_payload; la risposta è uno stream
+                     NDJSON con righe 'log', 'event', 'heartbeat' e infine 'result'.
+Se il client chiude la connessione la sessione viene annullata.
+
+Di default l'agent ascolta solo su 127.0.0.1. Per accettare job da altri host va avviato
+con --host e un token condiviso (--token o RTK_WORKER_TOKEN): ogni richiesta deve allora
+portare 'Authorization: Bearer <token>' (settings.worker_token del coordinatore).
+"""
+import argparse
+import hmac
+import json
+import os
+import queue
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set
+from manager.worker_coordinator import DEFAULT_WORKER_PORT, WORKER_TOKEN_ENV, job_session, valid_serial
+from utils.resource_monitor import AdmissionController
+from utils.rtkrcv_pool import RTKRCVPool
+from utils.cancel_event import CancelEvent
+from utils.session_log import log_prefix, log_sink
+from utils import events
+
+
+class WorkerAgent:
+    """Esegue fino a capacity sessioni in parallelo, ognuna in un thread dedicato"""
+
+    # Intervallo massimo (s) tra due righe dello stream: il coordinatore rileva così un worker morto
+    HEARTBEAT_INTERVAL = 2.0
+
+    def __init__(self, rtklib_path: Path, work_dir: Path, capacity: int, name: str, pool: bool = False):
+        self.rtklib_path = rtklib_path
+        self.work_dir = work_dir
+        # Anche sul worker le sessioni partono solo con margine di CPU e memoria; capacity 0 = automatica
+        self.admission = AdmissionController()
+        self.capacity = capacity if capacity > 0 else self.admission.auto_limit()
+        self.name = name
+        self.pool = RTKRCVPool(rtklib_path, work_dir, size=self.capacity) if pool else None
+        self._lock = threading.Lock()
+        self._active: Set[str] = set()
+
+    def health(self) -> Dict:
+        with self._lock:
+            return {'worker': self.name, 'capacity': self.capacity, 'active': len(self._active)}
+
+    def reserve(self, serial: str) -> Optional[str]:
+        """Occupa uno slot per il Rover; restituisce il motivo del rifiuto, None se accettato"""
+        with self._lock:
+            if serial in self._active:
+                return f"Rover {serial} già in elaborazione"
+            if len(self._active) >= self.capacity:
+                return "nessuno slot libero"
+            self._active.add(serial)
+            return None
+
+    def release(self, serial: str) -> None:
+        with self._lock:
+            self._active.discard(serial)
+
+    def execute(self, payload: Dict, put: Callable[[Dict], None], cancel_event: threading.Event) -> None:
+        """Esegue la sessione del job: log ed eventi del thread vanno a put, per ultimo il risultato"""
+        current = threading.current_thread()
+
+        def forward(event: Dict) -> None:
+            if threading.current_thread() is current:
+                put({'type': 'event', 'event': event})
+
+        events.add_listener(forward)
+        try:
+            rover, master, options = job_session(payload)
+            with log_sink(lambda message: put({'type': 'log', 'message': message})), \
+                    log_prefix(f"[{rover.serial_number}] "), self.admission.slot(cancel_event) as admitted:
+                success = admitted and rover.process_with_rtkrcv(
+                    master, self.rtklib_path, work_dir=self.work_dir, cancel_event=cancel_event,
+                    options=options, pool=self.pool)
+            self.admission.observe(rover.session_resources)
+            result = {'type': 'result', 'success': success, 'status': rover.sol_status,
+                      'coords': rover.get_coordinates(), 'timings': rover.session_timings,
+                      'resources': rover.session_resources, 'epochs': rover.session_epochs}
+        except Exception as e:
+            result = {'type': 'result', 'success': False, 'error': str(e)}
+        finally:
+            events.remove_listener(forward)
+        put(result)
+
+    def close(self) -> None:
+        if self.pool:
+            self.pool.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    agent: WorkerAgent = None
+    token: Optional[str] = None
+
+    def _authorized(self) -> bool:
+        if not self.token:
+            return True
+        if hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {self.token}"):
+            return True
+        self._reply(401, {'error': 'token mancante o non valido'})
+        return False
+
+    def do_GET(self) -> None:
+        if not self._authorized():
+            return
+        if self.path != '/health':
+            self._reply(404, {'error': 'not found'})
+            return
+        self._reply(200, self.agent.health())
+
+    def do_POST(self) -> None:
+        if not self._authorized():
+            return
+        if self.path != '/jobs':
+            self._reply(404, {'error': 'not found'})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            serial = payload['rover']['serial']
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {'error': f"job non valido: {e}"})
+            return
+        # Il seriale compone i nomi dei file sotto work_dir (config, soluzione, log)
+        if not valid_serial(serial):
+            self._reply(400, {'error': f"seriale Rover non valido: {serial!r}"})
+            return
+
+        refused = self.agent.reserve(serial)
+        if refused:
+            self._reply(409 if 'Rover' in refused else 503, {'error': refused})
+            return
+        try:
+            self._stream_job(payload)
+        finally:
+            self.agent.release(serial)
+
+    def _stream_job(self, payload: Dict) -> None:
+        messages: queue.Queue = queue.Queue()
+        cancel_event = CancelEvent()
+        thread = threading.Thread(target=self.agent.execute, args=(payload, messages.put, cancel_event),
+                                  name=f"job-{payload['rover']['serial']}", daemon=True)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        thread.start()
+        try:
+            while True:
+                try:
+                    message = messages.get(timeout=self.agent.HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    message = {'type': 'heartbeat'}
+                self.wfile.write(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+                self.wfile.flush()
+                if message['type'] == 'result':
+                    return
+        except OSError:
+            # Coordinatore disconnesso (o run annullato): la sessione si ferma
+            print(f"Connessione chiusa dal coordinatore, annullo Rover {payload['rover']['serial']}", flush=True)
+            cancel_event.set()
+            thread.join()
+
+    def _reply(self, status: int, body: Dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def serve(agent: WorkerAgent, host: str, port: int, token: Optional[str] = None) -> ThreadingHTTPServer:
+    handler = type('Handler', (_Handler,), {'agent': agent, 'token': token})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker agent per sessioni RTKRCV remote")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Indirizzo di ascolto (0.0.0.0 per accettare job da altri host, richiede --token)")
+    parser.add_argument("--port", type=int, default=DEFAULT_WORKER_PORT)
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="Sessioni RTKRCV concorrenti (0 = in base a CPU e memoria dell'host)")
+    parser.add_argument("--rtklib", type=Path, default=Path("./rtklib/rtkrcv"))
+    parser.add_argument("--work-dir", type=Path, default=Path("tmp"), help="Directory delle sessioni")
+    parser.add_argument("--name", default=None, help="Nome del worker (default: hostname:porta)")
+    parser.add_argument("--pool", action="store_true", help="Riusa processi RTKRCV tra le sessioni")
+    parser.add_argument("--token", default=os.environ.get(WORKER_TOKEN_ENV),
+                        help=f"Token condiviso richiesto a ogni richiesta (default: ${WORKER_TOKEN_ENV})")
+    args = parser.parse_args()
+
+    # Senza autenticazione l'agent esegue job di chiunque lo raggiunga: solo su loopback
+    if not args.token and args.host not in ('127.0.0.1', 'localhost', '::1'):
+        parser.error(f"--host {args.host} richiede --token (o {WORKER_TOKEN_ENV})")
+
+    # Gli eventi vanno al coordinatore tramite lo stream, non sul terminale del worker
+    events.set_stdout(False)
+    agent = WorkerAgent(args.rtklib, args.work_dir, args.capacity,
+                        args.name or f"{socket.gethostname()}:{args.port}", pool=args.pool)
+    server = serve(agent, args.host, args.port, token=args.token)
+    print(f"Worker {agent.name} in ascolto su {args.host}:{args.port} (capacità {agent.capacity})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nWorker arrestato", flush=True)
+    finally:
+        server.server_close()
+        agent.close()